@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+生成一个可复现的合成音频库，用于 benchmark（同一个 --seed 生成的文件内容、名字、mtime 完全相同）。
+
+包含：
+- 多层嵌套目录，大量小文件（1 KiB ~ --max-kb），文件名混合中文 BGM 标题和 ASCII
+- 按 --dup-ratio 复制已有文件到其它目录（内容相同，名字可能不同）
+- 若干稀疏大文件（--sparse-count 个 --sparse-mb MiB，只写头尾，不占磁盘），其中一对内容相同
+- zip（Store / Deflate）和 tar.gz 压缩包，成员取自小文件；按 --archive-dup-ratio
+  把已有压缩包用另一种压缩方式重新打包（整包 hash 不同，成员清单相同）
+
+用法：
+python benchmarks/gen_library.py --out data/samples/bench_lib
+python benchmarks/gen_library.py --out /tmp/bench_lib --files 200000 --sparse-count 4 --sparse-mb 4096
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+# 所有文件的 mtime 从这个时间开始递增，保证每次生成的结果相同
+BASE_MTIME = 1704067200  # 2024-01-01 00:00:00 UTC
+
+WORDS = [
+    "战斗曲", "主题曲", "日常", "悲伤", "紧张", "胜利", "失败", "村庄", "森林", "城堡",
+    "夜晚", "黎明", "回忆", "序章", "终章", "BOSS", "Battle", "Theme", "Town", "Field",
+    "雨", "风", "海边", "雪原", "神殿", "地下城", "OP", "ED", "Loop", "Intro",
+]
+DIR_WORDS = [
+    "原声集", "音效素材", "主库", "作业", "整理完成", "新建文件夹", "OST", "SE", "Voice",
+    "Disc1", "Disc2", "BGM", "环境音", "Archive", "备份",
+]
+AUDIO_EXTS = [".wav", ".mp3", ".flac", ".ogg"]
+
+
+def _name(rng: random.Random, i: int) -> str:
+    return f"{i:05d}_{rng.choice(WORDS)}_{rng.choice(WORDS)}{rng.choice(AUDIO_EXTS)}"
+
+
+def _make_dirs(rng: random.Random, root: Path, depth: int, fanout: int) -> list:
+    dirs = [root]
+    level = [root]
+    for d in range(depth):
+        nxt = []
+        for parent in level:
+            for k in range(rng.randint(1, fanout)):
+                p = parent / f"{rng.choice(DIR_WORDS)}_{d}{k}"
+                nxt.append(p)
+        dirs.extend(nxt)
+        level = nxt
+    for p in dirs:
+        p.mkdir(parents=True, exist_ok=True)
+    return dirs
+
+
+def _write(path: Path, data: bytes, mtime: int):
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+def generate(out: Path,
+             seed: int = 1,
+             files: int = 20000,
+             max_kb: int = 256,
+             depth: int = 3,
+             fanout: int = 4,
+             dup_ratio: float = 0.2,
+             archives: int = 200,
+             archive_members: int = 20,
+             archive_dup_ratio: float = 0.3,
+             sparse_count: int = 2,
+             sparse_mb: int = 1024) -> dict:
+    if out.exists():
+        shutil.rmtree(out)
+    rng = random.Random(seed)
+    t0 = time.time()
+    mtime = BASE_MTIME
+    dirs = _make_dirs(rng, out, depth, fanout)
+
+    stats = {"files": 0, "duplicates": 0, "bytes": 0, "archives": 0, "repacked_archives": 0,
+             "sparse_files": 0, "sparse_bytes": 0, "dirs": len(dirs)}
+
+    # ---- 小文件（部分为重复）
+    contents = []  # 用于重复和压缩包成员
+    for i in range(files):
+        if contents and rng.random() < dup_ratio:
+            data = rng.choice(contents)
+            stats["duplicates"] += 1
+        else:
+            data = rng.randbytes(rng.randint(1, max_kb) * 1024)
+            if len(contents) < 5000:
+                contents.append(data)
+        mtime += 1
+        _write(rng.choice(dirs) / _name(rng, i), data, mtime)
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+
+    # ---- 稀疏大文件：只写头尾 1 MiB，中间是空洞；前两个内容相同
+    if sparse_count:
+        sparse_dir = out / "大文件_Sparse"
+        sparse_dir.mkdir(exist_ok=True)
+        size = sparse_mb * 1024 * 1024
+        head = rng.randbytes(1024 * 1024)
+        for i in range(sparse_count):
+            tail = head if i < 2 else rng.randbytes(1024 * 1024)
+            p = sparse_dir / f"完整录音_{i:02d}.wav"
+            with open(p, "wb") as f:
+                f.write(head)
+                f.seek(max(size - len(tail), len(head)))
+                f.write(tail)
+            mtime += 1
+            os.utime(p, (mtime, mtime))
+            stats["sparse_files"] += 1
+            stats["sparse_bytes"] += os.path.getsize(p)
+
+    # ---- 压缩包
+    archive_dir = out / "压缩包"
+    archive_dir.mkdir(exist_ok=True)
+    made = []  # (name, members)
+    for i in range(archives):
+        repack = bool(made) and rng.random() < archive_dup_ratio
+        if repack:
+            base_name, members = rng.choice(made)
+            stats["repacked_archives"] += 1
+        else:
+            base_name = f"{i:04d}_{rng.choice(WORDS)}"
+            members = [(f"{base_name}/{_name(rng, k)}", rng.choice(contents))
+                       for k in range(rng.randint(1, archive_members))]
+            made.append((base_name, members))
+
+        kind = rng.choice(["zip_store", "zip_deflate", "tar_gz"])
+        stem = f"{base_name}_repack{i:04d}" if repack else base_name
+        mtime += 1
+        if kind == "tar_gz":
+            p = archive_dir / f"{stem}.tar.gz"
+            # gzip 头里有时间戳和文件名，固定下来才能每次生成相同的字节
+            with open(p, "wb") as raw, \
+                    gzip.GzipFile(filename="", fileobj=raw, mode="wb", mtime=mtime) as gz, \
+                    tarfile.open(fileobj=gz, mode="w") as tf:
+                for name, data in members:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = mtime
+                    tf.addfile(info, io.BytesIO(data))
+        else:
+            p = archive_dir / f"{stem}.zip"
+            method = zipfile.ZIP_STORED if kind == "zip_store" else zipfile.ZIP_DEFLATED
+            with zipfile.ZipFile(p, "w", method) as zf:
+                for name, data in members:
+                    zi = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+                    zi.compress_type = method
+                    zf.writestr(zi, data)
+        os.utime(p, (mtime, mtime))
+        stats["archives"] += 1
+
+    stats["seconds"] = round(time.time() - t0, 2)
+    params = {"seed": seed, "files": files, "max_kb": max_kb, "depth": depth, "fanout": fanout,
+              "dup_ratio": dup_ratio, "archives": archives, "archive_members": archive_members,
+              "archive_dup_ratio": archive_dup_ratio, "sparse_count": sparse_count,
+              "sparse_mb": sparse_mb}
+    return {"params": params, "stats": stats}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a deterministic synthetic library for benchmarks")
+    ap.add_argument("--out", required=True, help="Output folder (deleted and recreated)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--files", type=int, default=20000, help="Small files (default: 20000)")
+    ap.add_argument("--max-kb", type=int, default=256, help="Max small file size in KiB (default: 256)")
+    ap.add_argument("--depth", type=int, default=3, help="Folder nesting depth (default: 3)")
+    ap.add_argument("--fanout", type=int, default=4, help="Max sub folders per folder (default: 4)")
+    ap.add_argument("--dup-ratio", type=float, default=0.2, help="Share of duplicated small files")
+    ap.add_argument("--archives", type=int, default=200, help="zip / tar.gz archives (default: 200)")
+    ap.add_argument("--archive-members", type=int, default=20, help="Max members per archive")
+    ap.add_argument("--archive-dup-ratio", type=float, default=0.3,
+                    help="Share of archives that repack an earlier archive's members")
+    ap.add_argument("--sparse-count", type=int, default=2, help="Sparse large files (default: 2)")
+    ap.add_argument("--sparse-mb", type=int, default=1024, help="Size of each sparse file in MiB")
+    args = ap.parse_args()
+
+    out = Path(args.out)
+    info = generate(out, args.seed, args.files, args.max_kb, args.depth, args.fanout,
+                    args.dup_ratio, args.archives, args.archive_members, args.archive_dup_ratio,
+                    args.sparse_count, args.sparse_mb)
+    # 描述文件放在库外面，不会被扫描到
+    meta = out.with_name(out.name + ".json")
+    meta.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    s = info["stats"]
+    print(f"[DONE] {out} | files: {s['files']} (dups {s['duplicates']}) | archives: {s['archives']} "
+          f"(repacked {s['repacked_archives']}) | sparse: {s['sparse_files']} | dirs: {s['dirs']} | "
+          f"{s['seconds']}s")
+    print(f"[INFO] description: {meta}")
+
+
+if __name__ == "__main__":
+    if sys.version_info < (3, 9):
+        sys.exit("[ERROR] Python 3.9+ required (random.randbytes)")
+    main()
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark：按阶段计时，结果写成 JSON，方便和以前的结果对比。
+
+阶段（每个阶段在独立子进程中运行，分别统计峰值 RSS）：
+  walk         walker.walk_files 遍历                               files/s
+  hash         对每个文件 hashers.hash_file                          files/s, MB/s
+  archive_list 对每个压缩包 list_archive_entries                     archives/s, rows/s
+  csv_write    index_archives_v2.scan -> entries / archives CSV       files/s, rows/s
+  import_csv   import_csv.py 导入上一步的 CSV                          rows/s
+  sql_chain    Dup_Check -> Dup_Ranked_v2 -> Delete_Plan_Insert_Data  rows/s
+  dedupe       dedupe.py（同样的结果，Python 实现）                   rows/s
+
+用法：
+python benchmarks/gen_library.py --out data/samples/bench_lib
+python benchmarks/run_bench.py --library data/samples/bench_lib --out bench_results/baseline.json
+python benchmarks/run_bench.py --library data/samples/bench_lib --out bench_results/new.json --compare bench_results/baseline.json
+
+注意：sql/*.sql 里写死了 library_id = 1 和 Windows 路径分隔符 '\\'；
+非 Windows 上 sql_chain 把 SQL 里的 '\\' 换成 os.sep 再执行，Dup_Ranked_v2 的 JOIN 才能匹配到行。
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / "src" / "file_indexer"))
+
+STAGES = ["walk", "hash", "archive_list", "csv_write", "import_csv", "sql_chain", "dedupe"]
+SQL_CHAIN = ["Dup_Check.sql", "Dup_Ranked_v2.sql", "Delete_Plan_Create.sql", "Delete_Plan_Insert_Data.sql"]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# -------------------------------------------------------------
+# 各阶段（在子进程中执行，返回 {"files", "bytes", "rows"} 计数）
+# -------------------------------------------------------------
+def stage_walk(cfg):
+    from walker import walk_files
+    files = 0
+    for _ in walk_files(cfg["library"]):
+        files += 1
+    return {"files": files}
+
+
+def stage_hash(cfg):
+    from hashers import hash_file, resolve_algo
+    from walker import walk_files
+    algo = resolve_algo(cfg["hash"])
+    files = size = 0
+    for path, st in walk_files(cfg["library"]):
+        hash_file(path, algo)
+        files += 1
+        size += st.st_size
+    return {"files": files, "bytes": size}
+
+
+def stage_archive_list(cfg):
+    from archive_list import archive_ext, list_archive_entries
+    from walker import walk_files
+    archives = rows = size = 0
+    for path, st in walk_files(cfg["library"]):
+        if not archive_ext(os.path.basename(path)):
+            continue
+        rows += len(list_archive_entries(Path(path), "7z", cfg["archive_backend"]))
+        archives += 1
+        size += st.st_size
+    return {"files": archives, "bytes": size, "rows": rows}
+
+
+def _csv_rows(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return sum(1 for _ in f) - 1
+
+
+def stage_csv_write(cfg):
+    from index_archives_v2 import scan
+    work = Path(cfg["work"])
+    scan(Path(cfg["library"]), work / "entries.csv", work / "archives.csv", True,
+         cfg["hash"], "7z", workers=cfg["workers"], archive_backend=cfg["archive_backend"])
+    entries = _csv_rows(work / "entries.csv")
+    return {"files": entries, "rows": entries + _csv_rows(work / "archives.csv")}
+
+
+def stage_import_csv(cfg):
+    from create_db import create_db
+    from import_csv import add_library, import_archives, import_entries
+    work = Path(cfg["work"])
+    db = work / "bench.db"
+    if db.exists():
+        db.unlink()
+    create_db(str(db))
+    conn = sqlite3.connect(db)
+    try:
+        library_id = add_library(conn, "bench", str(Path(cfg["library"]).resolve()))
+        rows = import_entries(conn, library_id, str(work / "entries.csv"))
+        rows += import_archives(conn, library_id, str(work / "archives.csv"))
+    finally:
+        conn.close()
+    return {"rows": rows}
+
+
+def _sql_script(name: str) -> str:
+    """sql/ 下的脚本；路径拼接 / 目录深度用的 '\\' 换成本机的分隔符（full_path 是按 os.sep 写入的）"""
+    text = (REPO / "sql" / name).read_text(encoding="utf-8-sig")
+    if os.sep != "\\":
+        text = text.replace("'\\'", f"'{os.sep}'")
+    return text
+
+
+def stage_sql_chain(cfg):
+    db = Path(cfg["work"]) / "bench.db"
+    conn = sqlite3.connect(db)
+    try:
+        for name in SQL_CHAIN:
+            conn.executescript(_sql_script(name))
+        conn.commit()
+        rows = conn.execute("SELECT COUNT(*) FROM delete_plan").fetchone()[0]
+        dup_rows = conn.execute("SELECT COUNT(*) FROM dup_check").fetchone()[0]
+    finally:
+        conn.close()
+    return {"rows": rows, "dup_check_rows": dup_rows}
+
+
+def stage_dedupe(cfg):
+    from dedupe import run_dedupe
+    stats = run_dedupe(str(Path(cfg["work"]) / "bench.db"), None, [1], full=True)
+    return {"rows": stats["plan_rows"], "groups": stats["groups"]}
+
+
+STAGE_FUNCS = {
+    "walk": stage_walk,
+    "hash": stage_hash,
+    "archive_list": stage_archive_list,
+    "csv_write": stage_csv_write,
+    "import_csv": stage_import_csv,
+    "sql_chain": stage_sql_chain,
+    "dedupe": stage_dedupe,
+}
+
+
+def _run_stage_child(name: str, cfg_json: str):
+    cfg = json.loads(cfg_json)
+    # 各阶段自己的输出（进度等）不混进 JSON
+    real_stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        t0 = time.perf_counter()
+        counts = STAGE_FUNCS[name](cfg)
+        elapsed = time.perf_counter() - t0
+    finally:
+        sys.stdout = real_stdout
+    counts["seconds"] = elapsed
+    counts["peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps(counts))
+
+
+# -------------------------------------------------------------
+# 主进程
+# -------------------------------------------------------------
+def _rates(r: dict) -> dict:
+    sec = r["seconds"] or 1e-9
+    out = {"seconds": round(r["seconds"], 3), "peak_rss_mb": r["peak_rss_mb"]}
+    for key in ("files", "bytes", "rows"):
+        if key in r:
+            out[key] = r[key]
+    if "files" in r:
+        out["files_per_s"] = round(r["files"] / sec, 1)
+    if "bytes" in r:
+        out["mb_per_s"] = round(r["bytes"] / 1024 / 1024 / sec, 1)
+    if "rows" in r:
+        out["rows_per_s"] = round(r["rows"] / sec, 1)
+    for k, v in r.items():
+        if k not in out and k not in ("seconds", "peak_rss_mb"):
+            out[k] = v
+    return out
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(library: str, out: str, stages, hash_method: str = "md5", workers: int = 0,
+        archive_backend: str = "auto", work: str = None) -> dict:
+    library = str(Path(library).resolve())
+    work_dir = Path(work) if work else Path(tempfile.mkdtemp(prefix="file_indexer_bench_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    cfg = {"library": library, "work": str(work_dir), "hash": hash_method,
+           "workers": workers, "archive_backend": archive_backend}
+
+    meta_file = Path(library + ".json")
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "library": library,
+            "library_description": json.loads(meta_file.read_text(encoding="utf-8"))
+                                   if meta_file.exists() else None,
+            "config": {k: v for k, v in cfg.items() if k not in ("library", "work")},
+        },
+        "stages": {},
+    }
+
+    print(f"[BENCH] library: {library} | work: {work_dir}")
+    for name in stages:
+        cmd = [sys.executable, os.path.abspath(__file__), "--_stage", name, json.dumps(cfg)]
+        proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+        if proc.returncode != 0:
+            print(f"[ERROR] stage {name} failed:", file=sys.stderr)
+            print(proc.stderr[-4000:], file=sys.stderr)
+            result["stages"][name] = {"error": proc.stderr.strip().splitlines()[-1:]}
+            continue
+        r = _rates(json.loads(proc.stdout.strip().splitlines()[-1]))
+        result["stages"][name] = r
+        rates = " | ".join(f"{k}: {r[k]}" for k in ("files_per_s", "mb_per_s", "rows_per_s") if k in r)
+        print(f"  {name:<13} {r['seconds']:8.2f}s | {rates} | peak RSS {r['peak_rss_mb']} MB")
+
+    if out:
+        Path(out).parent.mkdir(parents=True, exist_ok=True)
+        Path(out).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[DONE] results written to {out}")
+    return result
+
+
+def compare(current: dict, baseline_path: str, threshold: float = 0.10) -> int:
+    """打印与 baseline 的对比，返回变慢超过 threshold 的阶段数"""
+    base = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"[COMPARE] baseline: {baseline_path} ({base['meta'].get('git_commit')}, "
+          f"{base['meta'].get('timestamp')})")
+    regressions = 0
+    for name, cur in current["stages"].items():
+        old = base["stages"].get(name)
+        if not old or "error" in old or "error" in cur:
+            continue
+        ratio = old["seconds"] / cur["seconds"] if cur["seconds"] else float("inf")
+        flag = ""
+        # 太短的阶段误差大，绝对差值不到 50ms 的不算退化
+        if ratio < 1 - threshold and cur["seconds"] - old["seconds"] > 0.05:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        rss = f"RSS {old['peak_rss_mb']} -> {cur['peak_rss_mb']} MB"
+        print(f"  {name:<13} {old['seconds']:8.2f}s -> {cur['seconds']:8.2f}s "
+              f"({ratio:5.2f}x) | {rss}{flag}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--_stage":
+        _run_stage_child(sys.argv[2], sys.argv[3])
+        return
+
+    ap = argparse.ArgumentParser(description="Time each indexing stage and write JSON results")
+    ap.add_argument("--library", required=True, help="Library folder (see benchmarks/gen_library.py)")
+    ap.add_argument("--out", help="Results JSON file")
+    ap.add_argument("--stages", default=",".join(STAGES),
+                    help=f"Comma separated stages (default: {','.join(STAGES)})")
+    ap.add_argument("--hash", default="md5", help="Hash algorithm for hash / csv_write (default: md5)")
+    ap.add_argument("--workers", type=int, default=0, help="Workers for csv_write (default: 0)")
+    ap.add_argument("--archive-backend", default="auto", choices=["auto", "native", "7z"])
+    ap.add_argument("--work", help="Folder for intermediate CSV / DB (default: temp folder)")
+    ap.add_argument("--compare", help="Baseline results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10,
+                    help="Slowdown that counts as a regression (default: 0.10 = 10%%)")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_FUNCS]
+    if unknown:
+        ap.error(f"unknown stages: {', '.join(unknown)}")
+
+    result = run(args.library, args.out, stages, args.hash, args.workers,
+                 args.archive_backend, args.work)
+    if args.compare:
+        if compare(result, args.compare, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,12 +14,14 @@ WITH dup AS (
     FROM entries e
     WHERE e.library_id = 1
       AND e.is_dir = 0
+      AND e.is_deleted = 0
       AND e.hash_value <> ''
       AND (e.size_bytes, e.hash_value) IN (
             SELECT size_bytes, hash_value
             FROM entries
             WHERE library_id = 1
               AND is_dir = 0
+              AND is_deleted = 0
               AND hash_value <> ''
             GROUP BY size_bytes, hash_value
             HAVING COUNT(*) > 1
@@ -0,0 +1,58 @@
+-- Dup_Check.sql 的 schema v2 版本（migrate_v2.py 生成的库），输出的 dup_check 表完全相同。
+-- 兼容视图 entries 上的 hash_value 是 hex() 算出来的，Dup_Check.sql 分组时要对每一行转换一次；
+-- 这里直接在 entries_v2 的 BLOB 列上分组（走 idx_v2_size_hash），只对重复的行还原成 hex。
+
+-- 1. 重建 dup_check
+DROP TABLE IF EXISTS dup_check;
+
+CREATE TABLE dup_check AS
+
+WITH grp AS (
+    SELECT size_bytes, hash_value
+    FROM entries_v2
+    WHERE library_id = 1
+      AND is_dir = 0
+      AND is_deleted = 0
+      AND hash_value <> ''
+    GROUP BY size_bytes, hash_value
+    HAVING COUNT(*) > 1
+),
+dup AS (
+    SELECT
+        e.id,
+        e.name,
+        dr.rel AS parent_path,
+        e.size_bytes,
+        CASE WHEN typeof(e.hash_value) = 'blob'
+             THEN CASE WHEN e.hash_algo = 'crc32' THEN hex(e.hash_value) ELSE lower(hex(e.hash_value)) END
+             ELSE e.hash_value END AS hash_value,
+        e.library_id
+    FROM entries_v2 e
+    JOIN dirs dr ON dr.id = e.dir_id
+    WHERE e.library_id = 1
+      AND e.is_dir = 0
+      AND e.is_deleted = 0
+      AND e.hash_value <> ''
+      AND (e.size_bytes, e.hash_value) IN (SELECT size_bytes, hash_value FROM grp)
+)
+SELECT
+    d.name AS filename,
+
+    -- folder_path = root_path + parent_path（相对路径拼接）
+    CASE
+        WHEN d.parent_path = '.'
+            THEN l.root_path
+        ELSE
+            l.root_path || '\' || d.parent_path
+    END AS folder_path,
+
+    d.size_bytes,
+    d.hash_value
+FROM dup d
+JOIN library l
+  ON d.library_id = l.id
+ORDER BY d.hash_value, filename;
+
+-- 2. 建索引
+CREATE INDEX idx_dup_hash ON dup_check(hash_value);
+CREATE INDEX idx_dup_folder ON dup_check(folder_path);
@@ -0,0 +1,132 @@
+-- schema v2（src/file_indexer/migrate_v2.py 从 v1 库生成，与 create_db.SCHEMA_V2_*_SQL 相同）
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS library (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    name       TEXT NOT NULL,
+    root_path  TEXT NOT NULL,
+    note       TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dirs (
+    id          INTEGER PRIMARY KEY,
+    parent_id   INTEGER,                   -- NULL = 扫描根目录
+    library_id  INTEGER NOT NULL,
+    name        TEXT NOT NULL,             -- 根目录为完整路径
+    path        TEXT NOT NULL,             -- 绝对路径，带结尾分隔符
+    rel         TEXT NOT NULL,             -- 相对 root 的路径（v1 的 parent_path），根目录为 '.'
+    FOREIGN KEY (parent_id)  REFERENCES dirs(id),
+    FOREIGN KEY (library_id) REFERENCES library(id)
+);
+
+CREATE TABLE IF NOT EXISTS entries_v2 (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,   -- 与 v1 的 entries.id 相同
+    library_id    INTEGER NOT NULL,
+    dir_id        INTEGER NOT NULL,
+    name          TEXT NOT NULL,
+    ext           TEXT,
+    is_dir        INTEGER NOT NULL,
+    is_archive    INTEGER NOT NULL DEFAULT 0,
+    size_bytes    INTEGER,
+    mtime         INTEGER,                             -- 整数秒
+    hash_algo     TEXT,
+    hash_value    BLOB,                                -- 不是 hex 的值原样存 TEXT
+    partial_hash  BLOB,
+    manifest_hash BLOB,
+    is_deleted    INTEGER NOT NULL DEFAULT 0,
+    extra_meta    TEXT,
+    crc32         BLOB,                                -- 4 字节
+    FOREIGN KEY (library_id) REFERENCES library(id),
+    FOREIGN KEY (dir_id)     REFERENCES dirs(id)
+);
+
+CREATE TABLE IF NOT EXISTS archives (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    library_id        INTEGER NOT NULL,
+    archive_full_path TEXT NOT NULL,
+    archive_entry_id  INTEGER,
+    member_path       TEXT NOT NULL,
+    member_size       INTEGER,
+    member_mtime      REAL,
+    member_crc        TEXT,
+    member_packed_size INTEGER,
+    hash_algo         TEXT,
+    hash_value        TEXT,
+    extra_meta        TEXT,
+    FOREIGN KEY (library_id)       REFERENCES library(id),
+    FOREIGN KEY (archive_entry_id) REFERENCES entries_v2(id)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dirs_path
+    ON dirs(library_id, path);
+
+CREATE INDEX IF NOT EXISTS idx_dirs_parent
+    ON dirs(parent_id, name);
+
+CREATE INDEX IF NOT EXISTS idx_v2_lib
+    ON entries_v2(library_id);
+
+CREATE INDEX IF NOT EXISTS idx_v2_dir
+    ON entries_v2(dir_id, name);
+
+CREATE INDEX IF NOT EXISTS idx_v2_hash
+    ON entries_v2(hash_value);
+
+CREATE INDEX IF NOT EXISTS idx_v2_size_hash
+    ON entries_v2(size_bytes, hash_value, hash_algo, library_id, is_dir, is_deleted);
+
+CREATE INDEX IF NOT EXISTS idx_v2_manifest
+    ON entries_v2(manifest_hash);
+
+CREATE INDEX IF NOT EXISTS idx_v2_size_crc32
+    ON entries_v2(size_bytes, crc32) WHERE crc32 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_archives_hash
+    ON archives(hash_value);
+
+CREATE INDEX IF NOT EXISTS idx_archives_archive
+    ON archives(archive_full_path);
+
+CREATE INDEX IF NOT EXISTS idx_archives_size_crc
+    ON archives(member_size, member_crc);
+
+CREATE VIEW IF NOT EXISTS entries AS
+SELECT
+    e.id,
+    e.library_id,
+    d.path || e.name AS full_path,
+    d.rel            AS parent_path,
+    e.name,
+    e.ext,
+    e.is_dir,
+    e.is_archive,
+    e.size_bytes,
+    e.mtime,
+    e.hash_algo,
+    CASE WHEN typeof(e.hash_value) = 'blob'
+         THEN CASE WHEN e.hash_algo = 'crc32' THEN hex(e.hash_value) ELSE lower(hex(e.hash_value)) END
+         ELSE e.hash_value END AS hash_value,
+    CASE WHEN typeof(e.partial_hash) = 'blob'
+         THEN CASE WHEN e.hash_algo = 'crc32' THEN hex(e.partial_hash) ELSE lower(hex(e.partial_hash)) END
+         ELSE e.partial_hash END AS partial_hash,
+    CASE WHEN typeof(e.manifest_hash) = 'blob'
+         THEN lower(hex(e.manifest_hash))
+         ELSE e.manifest_hash END AS manifest_hash,
+    e.is_deleted,
+    e.extra_meta,
+    CASE WHEN typeof(e.crc32) = 'blob' THEN hex(e.crc32) ELSE e.crc32 END AS crc32
+FROM entries_v2 e
+JOIN dirs d ON d.id = e.dir_id;
+
+-- delete_exec.py 标记 is_deleted，archive_report.py --backfill 写 manifest_hash（存 TEXT）
+CREATE TRIGGER IF NOT EXISTS entries_update
+INSTEAD OF UPDATE OF is_deleted, extra_meta, manifest_hash ON entries
+BEGIN
+    UPDATE entries_v2
+       SET is_deleted = NEW.is_deleted,
+           extra_meta = NEW.extra_meta,
+           manifest_hash = CASE WHEN NEW.manifest_hash IS OLD.manifest_hash
+                                THEN manifest_hash ELSE NEW.manifest_hash END
+     WHERE id = OLD.id;
+END;
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+"""
+列出压缩包内部成员（不解压）。
+
+两个后端：
+- native：zip 用 zipfile 读中央目录，tar/tgz/tar.gz 用 tarfile 读头部，进程内完成，不 fork
+- 7z    ："7z l -slt"，用于 rar/7z，以及 native 打不开的文件（Popen 流式解析，不缓存 7z 的全部输出）
+
+内存：list_archive_entries 返回一个压缩包的完整成员 list，峰值内存是 O(该压缩包的成员数)。
+manifest_fingerprint 要对全部成员排序、嵌套展开要遍历第一层成员、archives 行要在同一事务里整体重建，
+所以这里不做成逐行流式；单个压缩包几十万成员也只是几十 MB。
+
+list_archive_entries(..., backend=) 的 backend:
+- auto  ：zip/tar 优先 native，失败或其它格式回退 7z（默认）
+- native：只用 native（rar/7z 会报错）
+- 7z    ：总是用 7z
+
+每个成员返回 dict:
+  {
+     "entry_path_in_archive": "...",
+     "entry_size_bytes": int,
+     "is_dir": 0/1,
+     "is_encrypted": 0/1,
+     "method": "Deflate" 等,
+     "entry_mtime": float 时间戳 或 None,
+     "crc": "8 位大写十六进制" 或 "",
+     "packed_size": int 或 None,
+  }
+
+manifest_fingerprint(members)：成员清单指纹（见下），用于发现「重新打包」的重复压缩包。
+
+嵌套压缩包（configure_nested(depth=N) 开启，默认关闭）：
+  成员本身是压缩包时，从外层流式读出来（zipfile.open / tarfile.extractfile / "7z x -so"），
+  不解压到目标目录，直接列出内部成员，最多 N 层。内层成员的路径为
+  "inner.rar!/track.wav"（相对最外层压缩包，完整路径即 "outer.zip!/inner.rar!/track.wav"），
+  附加 "nested_depth"（1 = 第一层内嵌）。
+  能用 zipfile/tarfile 打开的内层压缩包先读进内存（SpooledTemporaryFile），超过 memory_mb 自动转成临时文件；
+  rar/7z（7z 需要文件路径）直接写到临时目录；用完即删，> spill_mb 的跳过并打印 [WARN]。
+iter_member_streams(archive, members)：流式读出指定成员（包括内嵌成员）解压后的数据，用于成员 hash。
+
+Benchmark（native vs 7z，archives/sec）：
+python src/file_indexer/archive_list.py --root "E:\\BGM_Raw" --bench
+列出一个压缩包（含两层内嵌压缩包）：
+python src/file_indexer/archive_list.py --archive "E:\\BGM_Raw\\pack.zip" --nested-depth 2
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import deque
+from pathlib import Path
+
+ARCHIVE_EXTS = {".zip", ".rar", ".7z", ".tar", ".tgz", ".tar.gz"}
+
+ZIP_EXTS = {".zip"}
+TAR_EXTS = {".tar", ".tgz", ".tar.gz"}
+NATIVE_EXTS = ZIP_EXTS | TAR_EXTS
+
+BACKENDS = ("auto", "native", "7z")
+
+# zipfile compress_type -> 与 7z 输出一致的名字
+ZIP_METHODS = {
+    zipfile.ZIP_STORED: "Store",
+    zipfile.ZIP_DEFLATED: "Deflate",
+    9: "Deflate64",
+    zipfile.ZIP_BZIP2: "BZip2",
+    zipfile.ZIP_LZMA: "LZMA",
+    93: "ZSTD",
+    98: "PPMd",
+    99: "AES",
+}
+
+# 嵌套压缩包：成员路径里的层级分隔符
+NEST_SEP = "!/"
+
+# list_archive_entries() 的嵌套展开参数（CLI 里用 configure_nested() 修改）
+NESTED_OPTIONS = {
+    "depth": 0,                           # 0 = 不展开
+    "memory_bytes": 64 * 1024 * 1024,     # 不超过这个大小的内层压缩包放在内存里
+    "spill_bytes": 4 * 1024 ** 3,         # 超过这个大小的内层压缩包不展开
+    "spill_dir": None,                    # 临时文件目录（None = 系统临时目录）
+}
+COPY_BLOCK = 1024 * 1024
+
+
+def archive_ext(name: str) -> str:
+    """
+    返回压缩包后缀（小写，带点），不是压缩包则返回 ""。
+    Path.suffix 对 "x.tar.gz" 只给 ".gz"，这里按最长后缀匹配。
+    """
+    lower = name.lower()
+    for ext in sorted(ARCHIVE_EXTS, key=len, reverse=True):
+        if lower.endswith(ext):
+            return ext
+    return ""
+
+
+def _console_encoding() -> str:
+    # Windows 下 7z 输出是 GBK / ANSI 代码页；其它平台按 locale（通常 UTF-8）
+    if os.name == "nt":
+        return "mbcs"
+    import locale
+    return locale.getpreferredencoding(False) or "utf-8"
+
+
+# -------------------------------------------------------------
+# native: zipfile / tarfile
+# -------------------------------------------------------------
+def _zip_mtime(date_time):
+    try:
+        return time.mktime(tuple(date_time) + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return None
+
+
+def list_zip(archive: Path):
+    entries = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            entries.append({
+                "entry_path_in_archive": info.filename.rstrip("/"),
+                "entry_size_bytes": info.file_size,
+                "is_dir": 1 if info.is_dir() else 0,
+                "is_encrypted": 1 if info.flag_bits & 0x1 else 0,
+                "method": ZIP_METHODS.get(info.compress_type, str(info.compress_type)),
+                "entry_mtime": _zip_mtime(info.date_time),
+                "crc": f"{info.CRC:08X}",
+                "packed_size": info.compress_size,
+            })
+    return entries
+
+
+def _open_tar(archive):
+    # archive 为路径或（嵌套时）已经读到内存里的文件对象
+    if isinstance(archive, (str, Path)):
+        return tarfile.open(archive, "r:*")
+    return tarfile.open(fileobj=archive, mode="r:*")
+
+
+def list_tar(archive: Path):
+    entries = []
+    # "r:*" 自动识别 gz/bz2/xz；逐个读取 header，不保留 member 列表
+    with _open_tar(archive) as tf:
+        for m in tf:
+            if not (m.isfile() or m.isdir()):
+                continue
+            entries.append({
+                "entry_path_in_archive": m.name.rstrip("/"),
+                "entry_size_bytes": m.size if m.isfile() else 0,
+                "is_dir": 1 if m.isdir() else 0,
+                "is_encrypted": 0,
+                "method": "",
+                "entry_mtime": float(m.mtime) if m.mtime else None,
+                "crc": "",
+                "packed_size": None,
+            })
+            tf.members = []  # 大 tar 也保持常量内存
+    return entries
+
+
+def list_native(archive: Path, name: str = None):
+    """name: archive 为文件对象（嵌套）时用来判断格式的文件名"""
+    name = name or archive.name
+    ext = archive_ext(name)
+    if ext in ZIP_EXTS:
+        return list_zip(archive)
+    if ext in TAR_EXTS:
+        return list_tar(archive)
+    raise ValueError(f"native backend does not support {ext or Path(name).suffix}: {name}")
+
+
+# -------------------------------------------------------------
+# 7z: "7z l -slt"（流式解析）
+# -------------------------------------------------------------
+def _7z_mtime(value: str):
+    """'2024-05-28 08:08:25' 或 '2024-05-28 08:08:25.1234567' -> 本地时间戳"""
+    if not value:
+        return None
+    try:
+        ts = time.mktime(time.strptime(value[:19], "%Y-%m-%d %H:%M:%S"))
+    except (ValueError, OverflowError):
+        return None
+    if len(value) > 20 and value[19] == ".":
+        try:
+            ts += float("0" + value[19:])
+        except ValueError:
+            pass
+    return ts
+
+
+def _7z_entry(block: dict) -> dict:
+    try:
+        entry_size = int(block.get("Size", "0") or 0)
+    except ValueError:
+        entry_size = 0
+    try:
+        packed = int(block["Packed Size"]) if block.get("Packed Size") else None
+    except ValueError:
+        packed = None
+    is_dir = (block.get("Folder") == "+"
+              or block.get("Attributes", "").startswith("D"))
+    return {
+        "entry_path_in_archive": block.get("Path", ""),
+        "entry_size_bytes": entry_size,
+        "is_dir": 1 if is_dir else 0,
+        "is_encrypted": 1 if block.get("Encrypted") == "+" else 0,
+        "method": block.get("Method", ""),
+        "entry_mtime": _7z_mtime(block.get("Modified", "")),
+        "crc": block.get("CRC", "").upper(),
+        "packed_size": packed,
+    }
+
+
+class SevenZipListError(OSError):
+    """找不到 7z，或 7z l 返回非 0（压缩包损坏 / 截断等）：已经列出的成员不完整，不能当作完整清单"""
+
+
+def iter_7z_entries(archive: Path, sevenzip: str = "7z"):
+    """
+    逐个产出成员 dict，边读 7z 输出边解析，不缓存 7z 的全部输出。
+    输出格式：先是压缩包自身的信息块，"----------" 之后才是各成员（空行分隔）。
+    找不到 7z 时抛出 SevenZipListError；7z 返回非 0 时，产出所有成员之后抛出 SevenZipListError。
+    """
+    cmd = [sevenzip, "l", "-slt", str(archive)]
+    encoding = _console_encoding()
+
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except FileNotFoundError as ex:
+        raise SevenZipListError(f"7z not found: {sevenzip}") from ex
+
+    other_lines = deque(maxlen=20)  # 出错时打印最后几行非 key=value 输出
+    in_members = False
+    current = {}
+    try:
+        for raw in proc.stdout:
+            line = raw.decode(encoding, errors="replace").strip()
+            if not in_members:
+                if line == "----------":
+                    in_members = True
+                elif line and "=" not in line:
+                    other_lines.append(line)
+                continue
+
+            if not line:
+                if "Path" in current:
+                    yield _7z_entry(current)
+                current = {}
+                continue
+
+            if "=" in line:
+                k, v = line.split("=", 1)
+                current[k.strip()] = v.strip()
+            else:
+                other_lines.append(line)
+
+        if "Path" in current:
+            yield _7z_entry(current)
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        print(f"[ERROR] 7z list failed: {archive}", file=sys.stderr)
+        for line in other_lines:
+            print(line, file=sys.stderr)
+        raise SevenZipListError(f"7z exited with code {returncode}: {archive}")
+
+
+def list_7z(archive: Path, sevenzip: str = "7z"):
+    """整个列表（O(成员数) 内存，见模块说明）；7z 出错时抛出 SevenZipListError，不返回只有一部分的成员"""
+    return list(iter_7z_entries(archive, sevenzip))
+
+
+# -------------------------------------------------------------
+# 统一入口
+# -------------------------------------------------------------
+NATIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, NotImplementedError, EOFError, OSError)
+
+
+def _list_one(archive: Path, sevenzip: str = "7z", backend: str = "auto"):
+    if backend == "7z":
+        return list_7z(archive, sevenzip)
+    if backend == "native":
+        return list_native(archive)
+
+    # auto
+    if archive_ext(archive.name) in NATIVE_EXTS:
+        try:
+            return list_native(archive)
+        except NATIVE_ERRORS as ex:
+            # 例如改了后缀的 rar、自解压、分卷等，交给 7z
+            print(f"[WARN] native listing failed, fallback to 7z: {archive} ({ex})", file=sys.stderr)
+    return list_7z(archive, sevenzip)
+
+
+def list_archive_entries(archive: Path, sevenzip: str = "7z", backend: str = "auto"):
+    """列出 archive 的成员；configure_nested(depth > 0) 时在后面追加内层压缩包的成员"""
+    entries = _list_one(archive, sevenzip, backend)
+    if NESTED_OPTIONS["depth"] > 0:
+        entries.extend(_expand_nested(archive, archive.name, entries, "", 1, sevenzip, backend))
+    return entries
+
+
+# -------------------------------------------------------------
+# 嵌套压缩包：从外层流式读出内层压缩包，就地列出
+# -------------------------------------------------------------
+def configure_nested(depth: int = None, memory_mb: float = None, spill_mb: float = None,
+                     spill_dir: str = None):
+    """设置 list_archive_entries() 展开嵌套压缩包的层数 / 内存上限 / 临时文件上限和目录"""
+    if depth is not None:
+        if depth < 0:
+            raise ValueError(f"nested depth must be >= 0: {depth}")
+        NESTED_OPTIONS["depth"] = int(depth)
+    if memory_mb is not None:
+        NESTED_OPTIONS["memory_bytes"] = int(memory_mb * 1024 * 1024)
+    if spill_mb is not None:
+        NESTED_OPTIONS["spill_bytes"] = int(spill_mb * 1024 * 1024)
+    if spill_dir:
+        NESTED_OPTIONS["spill_dir"] = spill_dir
+
+
+def _iter_7z_members(archive: Path, names, sevenzip: str):
+    """逐个产出 (member_path, stream)：每个成员一次 "7z x -so"，数据经管道读出，不落盘"""
+    for name in names:
+        # -spd：成员名按字面匹配（不当通配符）；stdin 关闭，加密成员不会卡在密码提示
+        cmd = [sevenzip, "x", "-so", "-spd", "-y", str(archive), name]
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL)
+        except FileNotFoundError as ex:
+            raise SevenZipListError(f"7z not found: {sevenzip}") from ex
+        try:
+            yield name, proc.stdout
+        finally:
+            proc.stdout.close()
+            if proc.wait() != 0:
+                print(f"[WARN] 7z extract failed: {archive} -> {name}", file=sys.stderr)
+
+
+def _iter_members(source, name: str, wanted: set, sevenzip: str, backend: str):
+    """
+    打开外层压缩包（路径或内存中的文件对象），逐个产出 wanted 中成员的 (member_path, stream)。
+    zip 按中央目录直接定位；tar 顺序读一遍；其它（rar/7z，或 native 打不开）用 "7z x -so"。
+    zip 里加密的成员不产出（打印 [WARN]），调用方按「没找到」处理。
+    """
+    ext = archive_ext(name)
+    if backend != "7z" and ext in NATIVE_EXTS:
+        done = set()
+        try:
+            if ext in ZIP_EXTS:
+                with zipfile.ZipFile(source) as zf:
+                    for info in zf.infolist():
+                        member = info.filename.rstrip("/")
+                        if member not in wanted:
+                            continue
+                        done.add(member)
+                        if info.flag_bits & 0x1:
+                            # 加密成员没有密码读不了（交给 7z 也一样），跳过，其它成员照常读
+                            print(f"[WARN] encrypted member skipped: {name}{NEST_SEP}{member}", file=sys.stderr)
+                            continue
+                        try:
+                            stream = zf.open(info)
+                        except RuntimeError as ex:
+                            print(f"[WARN] member not readable: {name}{NEST_SEP}{member} ({ex})", file=sys.stderr)
+                            continue
+                        with stream:
+                            yield member, stream
+                return
+            with _open_tar(source) as tf:
+                for m in tf:
+                    member = m.name.rstrip("/")
+                    if member in wanted and m.isfile():
+                        stream = tf.extractfile(m)
+                        if stream is not None:
+                            done.add(member)
+                            yield member, stream
+                    tf.members = []
+                return
+        except NATIVE_ERRORS:
+            if backend == "native":
+                raise
+        # 已经读出的成员不再交给 7z
+        wanted = wanted - done
+    if not wanted:
+        return
+    if isinstance(source, Path):
+        yield from _iter_7z_members(source, sorted(wanted), sevenzip)
+        return
+    # 内存中的外层 native 打不开：写成临时文件交给 7z
+    source.seek(0)
+    tmp = _spill(source, name, False)
+    try:
+        yield from _iter_7z_members(tmp, sorted(wanted), sevenzip)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _spill(stream, name: str, native: bool):
+    """
+    复制内层压缩包的数据：native（zipfile/tarfile 能打开）时放进 SpooledTemporaryFile，
+    不超过 memory_bytes 留在内存，更大时自动转成临时文件；否则（7z 需要文件路径）写临时文件，返回 Path。
+    超过 spill_bytes 时抛 ValueError（头部声明的大小不可信，按实际读出的字节数判断）。
+    """
+    limit = NESTED_OPTIONS["spill_bytes"]
+    tmp = None
+    if native:
+        out = tempfile.SpooledTemporaryFile(max_size=NESTED_OPTIONS["memory_bytes"],
+                                            dir=NESTED_OPTIONS["spill_dir"])
+    else:
+        fd, tmp = tempfile.mkstemp(prefix="nested_", suffix=archive_ext(name),
+                                   dir=NESTED_OPTIONS["spill_dir"])
+        out = os.fdopen(fd, "wb")
+    try:
+        total = 0
+        while True:
+            chunk = stream.read(COPY_BLOCK)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > limit:
+                raise ValueError(f"nested archive larger than {limit} bytes: {name}")
+            out.write(chunk)
+    except BaseException:
+        out.close()
+        if tmp is not None:
+            Path(tmp).unlink(missing_ok=True)
+        raise
+    if tmp is None:
+        out.seek(0)
+        return out
+    out.close()
+    return Path(tmp)
+
+
+def _close_spill(inner):
+    if isinstance(inner, Path):
+        inner.unlink(missing_ok=True)
+    else:
+        inner.close()
+
+
+def _is_native(name: str, backend: str) -> bool:
+    # 7z 需要文件路径：rar/7z 以及 --archive-backend 7z 总是写临时文件
+    return backend != "7z" and archive_ext(name) in NATIVE_EXTS
+
+
+def _expand_nested(source, name: str, entries, prefix: str, depth: int, sevenzip: str, backend: str):
+    """
+    entries 为 source 的成员列表；对其中的压缩包成员列出内部，成员路径加上 prefix + "内层名!/"。
+    depth 为这些内层成员的层数（1 = 第一层内嵌），不超过 NESTED_OPTIONS["depth"]。
+    """
+    spill_bytes = NESTED_OPTIONS["spill_bytes"]
+    wanted = {}
+    for e in entries:
+        member = e["entry_path_in_archive"]
+        if e["is_dir"] or not archive_ext(member):
+            continue
+        if backend == "native" and archive_ext(member) not in NATIVE_EXTS:
+            print(f"[WARN] nested {archive_ext(member)} needs 7z, not listed with --archive-backend native: "
+                  f"{name}{NEST_SEP}{member}", file=sys.stderr)
+        elif e["is_encrypted"]:
+            print(f"[WARN] nested archive is encrypted, not listed: {name}{NEST_SEP}{member}", file=sys.stderr)
+        elif e["entry_size_bytes"] > spill_bytes:
+            print(f"[WARN] nested archive larger than --nested-spill-mb, not listed: "
+                  f"{name}{NEST_SEP}{member} ({e['entry_size_bytes']} bytes)", file=sys.stderr)
+        else:
+            wanted[member] = e["entry_size_bytes"]
+    if not wanted:
+        return []
+
+    out = []
+    for member, stream in _iter_members(source, name, set(wanted), sevenzip, backend):
+        inner_name = member.replace("\\", "/").rsplit("/", 1)[-1]
+        try:
+            inner = _spill(stream, inner_name, _is_native(inner_name, backend))
+        except (ValueError, OSError) as ex:
+            print(f"[WARN] nested archive not listed: {name}{NEST_SEP}{member} ({ex})", file=sys.stderr)
+            continue
+        try:
+            if isinstance(inner, Path):
+                inner_entries = _list_one(inner, sevenzip, backend)
+            else:
+                inner_entries = list_native(inner, inner_name)
+            inner_prefix = f"{prefix}{member}{NEST_SEP}"
+            for e in inner_entries:
+                out.append(dict(e, entry_path_in_archive=inner_prefix + e["entry_path_in_archive"],
+                                nested_depth=depth))
+            if depth < NESTED_OPTIONS["depth"]:
+                out.extend(_expand_nested(inner, inner_name, inner_entries, inner_prefix, depth + 1,
+                                          sevenzip, backend))
+        except (*NATIVE_ERRORS, ValueError) as ex:
+            print(f"[WARN] nested archive not listed: {name}{NEST_SEP}{member} ({ex})", file=sys.stderr)
+        finally:
+            _close_spill(inner)
+    return out
+
+
+def iter_member_streams(archive: Path, members, sevenzip: str = "7z", backend: str = "auto"):
+    """
+    逐个产出 (member_path, stream)：members 中各成员解压后的数据（按压缩包内的顺序），不写磁盘。
+    成员可以是 list_archive_entries() 给出的内嵌路径 "inner.zip!/x.wav"：内层压缩包按
+    NESTED_OPTIONS 放在内存或临时文件里，再从中读出成员。stream 只在下一次迭代之前有效。
+    """
+    yield from _iter_nested_streams(archive, archive.name, set(members), sevenzip, backend)
+
+
+def _iter_nested_streams(source, name: str, members: set, sevenzip: str, backend: str):
+    direct = {m for m in members if NEST_SEP not in m}
+    inner = {}
+    for m in members - direct:
+        outer, _, rest = m.partition(NEST_SEP)
+        inner.setdefault(outer, set()).add(rest)
+
+    for member, stream in _iter_members(source, name, direct | set(inner), sevenzip, backend):
+        if member not in inner:
+            yield member, stream
+            continue
+        # 内层压缩包本身和它的成员都要读：先复制出来，再分别读取
+        inner_name = member.replace("\\", "/").rsplit("/", 1)[-1]
+        try:
+            spilled = _spill(stream, inner_name, _is_native(inner_name, backend))
+        except (ValueError, OSError) as ex:
+            print(f"[WARN] nested archive not read: {name}{NEST_SEP}{member} ({ex})", file=sys.stderr)
+            continue
+        try:
+            if member in direct:
+                if isinstance(spilled, Path):
+                    with open(spilled, "rb") as f:
+                        yield member, f
+                else:
+                    yield member, spilled
+                    spilled.seek(0)
+            prefix = member + NEST_SEP
+            for rest, inner_stream in _iter_nested_streams(spilled, inner_name, inner[member],
+                                                           sevenzip, backend):
+                yield prefix + rest, inner_stream
+        except (*NATIVE_ERRORS, ValueError) as ex:
+            print(f"[WARN] nested archive not read: {name}{NEST_SEP}{member} ({ex})", file=sys.stderr)
+        finally:
+            _close_spill(spilled)
+
+
+# -------------------------------------------------------------
+# 成员清单指纹
+# -------------------------------------------------------------
+def _norm_member_path(path: str) -> str:
+    # 7z 在 Windows 上输出 "\"，zipfile/tarfile 输出 "/"
+    return path.replace("\\", "/").strip("/")
+
+
+def manifest_fingerprint(members) -> str:
+    """
+    压缩包的内容指纹：排序后的 (member_path, member_size, member_crc) 列表的 sha1。
+    只用文件头里的信息（不读压缩数据），同一批文件换了压缩器 / 压缩级别 / 格式重新打包，
+    只要路径、大小、CRC 相同，指纹就相同。
+
+    members: 可迭代的 (path, size, crc)，只应包含文件（不含目录）
+    没有成员时返回 ""。tar 没有 CRC，这时只按路径和大小计算，是较弱的指纹
+    （archive_report.py 把这类组单独报告为 exact_nocrc）。
+    """
+    lines = sorted(
+        f"{_norm_member_path(path)}\t{int(size or 0)}\t{(crc or '').upper()}"
+        for path, size, crc in members
+    )
+    if not lines:
+        return ""
+    h = hashlib.sha1()
+    for line in lines:
+        h.update(line.encode("utf-8", errors="surrogateescape"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+# -------------------------------------------------------------
+# Benchmark
+# -------------------------------------------------------------
+def bench(root: Path, sevenzip: str, limit: int = 0):
+    archives = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if archive_ext(name) in NATIVE_EXTS:
+                archives.append(Path(dirpath) / name)
+    archives.sort()
+    if limit:
+        archives = archives[:limit]
+
+    print(f"[BENCH] root: {root} | zip/tar archives: {len(archives)}")
+    backends = ["native"]
+    if shutil.which(sevenzip):
+        backends.append("7z")
+    else:
+        print(f"  7z      skipped (not found: {sevenzip})")
+    for backend in backends:
+        members = 0
+        failed = 0
+        t0 = time.perf_counter()
+        for a in archives:
+            try:
+                members += len(list_archive_entries(a, sevenzip, backend))
+            except Exception:
+                failed += 1
+        elapsed = time.perf_counter() - t0
+        rate = len(archives) / elapsed if elapsed > 0 else 0.0
+        print(f"  {backend:<7} {elapsed:8.3f}s | {rate:10.1f} archives/sec | "
+              f"members: {members} | failed: {failed}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List archive members (native zip/tar or 7z)")
+    ap.add_argument("--root", help="Folder with archives (for --bench)")
+    ap.add_argument("--archive", help="Single archive to list")
+    ap.add_argument("--archive-backend", choices=BACKENDS, default="auto")
+    ap.add_argument("--sevenzip", default="7z", help="Path to 7z.exe")
+    ap.add_argument("--bench", action="store_true", help="Compare archives/sec native vs 7z")
+    ap.add_argument("--limit", type=int, default=0, help="Benchmark at most N archives")
+    ap.add_argument("--nested-depth", type=int, default=0, help="Also list archives inside archives, N levels")
+    ap.add_argument("--nested-memory-mb", type=float, help="Inner zip/tar up to this size are read in memory (default: 64)")
+    ap.add_argument("--nested-spill-mb", type=float, help="Inner archives above this size are skipped (default: 4096)")
+    ap.add_argument("--nested-tmp", help="Folder for spilled inner archives (default: system temp)")
+    args = ap.parse_args()
+    try:
+        configure_nested(args.nested_depth, args.nested_memory_mb, args.nested_spill_mb, args.nested_tmp)
+    except ValueError as ex:
+        ap.error(str(ex))
+
+    if args.bench:
+        if not args.root:
+            ap.error("--bench requires --root")
+        bench(Path(args.root), args.sevenzip, args.limit)
+        return
+    if not args.archive:
+        ap.error("need --archive or --root --bench")
+
+    try:
+        entries = list_archive_entries(Path(args.archive), args.sevenzip, args.archive_backend)
+    except SevenZipListError as ex:
+        print(f"[ERROR] {ex}", file=sys.stderr)
+        sys.exit(1)
+    for e in entries:
+        print(f"{e['entry_size_bytes']}\t{e['crc']}\t{e['method']}\t{e['entry_path_in_archive']}")
+
+
+if __name__ == "__main__":
+    main()
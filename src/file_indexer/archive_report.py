@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+按成员清单指纹（entries.manifest_hash）找重复压缩包，不读压缩包内容。
+
+- exact：manifest_hash 相同，即成员的 (路径, 大小, CRC) 完全一致，
+         常见于同一批文件用不同压缩器 / 压缩级别重新打包（整包 hash 不同）
+- exact_nocrc：manifest_hash 相同，但清单里有成员没有 CRC（tar），实际只比较了路径和大小；
+         较弱的匹配，单独列出，不计入 redundant bytes
+- near ：成员 (大小, CRC) 集合的 Jaccard 相似度 >= --min-similarity，
+         例如多 / 少了几个文件，或者改了目录名
+
+加入 manifest_hash 之前扫描的库没有这个值，--backfill 会用 archives 表里已有的
+成员信息补算，同样不需要重新读取压缩包。
+
+用法：
+python src/file_indexer/archive_report.py --db data/workspace/archive_work.db --backfill --out "D:\\archive_dups.csv"
+python src/file_indexer/archive_report.py --db ... --library-id 1 --library-id 2 --min-similarity 0.8
+"""
+
+import argparse
+import csv
+import sqlite3
+import sys
+from collections import Counter, defaultdict
+from itertools import groupby
+from pathlib import Path
+
+from archive_list import NEST_SEP, manifest_fingerprint
+from create_db import ensure_columns
+
+REPORT_HEADER = [
+    "match", "group_id", "similarity",
+    "library_id", "entry_id", "archive_full_path", "size_bytes", "members",
+]
+
+
+def _scope(library_ids, alias="e"):
+    if not library_ids:
+        return "", []
+    marks = ",".join("?" for _ in library_ids)
+    return f" AND {alias}.library_id IN ({marks})", list(library_ids)
+
+
+# -------------------------------------------------------------
+# 旧数据补算 manifest_hash
+# -------------------------------------------------------------
+def backfill_manifests(conn, library_ids=None) -> int:
+    """给 manifest_hash 为空的压缩包补算指纹（用 archives 表中的成员），返回更新的行数。"""
+    where, params = _scope(library_ids)
+    missing = {
+        (lib, path): entry_id
+        for entry_id, lib, path in conn.execute(f"""
+            SELECT e.id, e.library_id, e.full_path FROM entries e
+            WHERE e.is_archive = 1 AND e.is_deleted = 0 AND e.manifest_hash IS NULL
+            {where}
+        """, params)
+    }
+    if not missing:
+        return 0
+
+    where_a, params_a = _scope(library_ids, "a")
+    cur = conn.execute(f"""
+        SELECT a.library_id, a.archive_full_path, a.member_path, a.member_size, a.member_crc
+        FROM archives a
+        WHERE 1 = 1 {where_a}
+        ORDER BY a.library_id, a.archive_full_path
+    """, params_a)
+
+    updates = []
+    for key, rows in groupby(cur, key=lambda r: (r[0], r[1])):
+        entry_id = missing.pop(key, None)
+        if entry_id is None:
+            continue
+        # 和扫描时一样只用第一层成员（不含 --nested-depth 列出的 "inner.zip!/..."）
+        fp = manifest_fingerprint((r[2], r[3], r[4]) for r in rows if NEST_SEP not in r[2])
+        updates.append((fp, entry_id))
+
+    # archives 里没有成员的（空包 / 列表失败）记为 ""，下次不再重算
+    updates.extend(("", entry_id) for entry_id in missing.values())
+    conn.executemany("UPDATE entries SET manifest_hash = ? WHERE id = ?", updates)
+    conn.commit()
+    return len(updates)
+
+
+# -------------------------------------------------------------
+# exact：manifest_hash 相同
+# -------------------------------------------------------------
+def exact_groups(conn, library_ids=None) -> list:
+    """返回 [[(entry_id, library_id, full_path, size_bytes, hash_value, manifest_hash), ...], ...]"""
+    where, params = _scope(library_ids)
+    cur = conn.execute(f"""
+        WITH live AS (
+            SELECT * FROM entries e
+            WHERE e.is_archive = 1 AND e.is_deleted = 0
+              AND e.manifest_hash IS NOT NULL AND e.manifest_hash <> ''
+              {where}
+        )
+        SELECT id, library_id, full_path, size_bytes, hash_value, manifest_hash
+        FROM live
+        WHERE manifest_hash IN (
+            SELECT manifest_hash FROM live GROUP BY manifest_hash HAVING COUNT(*) > 1
+        )
+        ORDER BY manifest_hash, full_path
+    """, params)
+    return [list(rows) for _, rows in groupby(cur, key=lambda r: r[5])]
+
+
+def has_member_crc(conn, library_id: int, full_path: str) -> bool:
+    """压缩包的第一层成员是否都有 CRC（tar 没有：它的指纹只覆盖路径和大小）"""
+    row = conn.execute("""
+        SELECT 1 FROM archives
+        WHERE archive_full_path = ? AND library_id = ?
+          AND (member_crc IS NULL OR member_crc = '')
+          AND instr(member_path, ?) = 0
+        LIMIT 1
+    """, (full_path, library_id, NEST_SEP)).fetchone()
+    return row is None
+
+
+# -------------------------------------------------------------
+# near：成员 (size, crc) 集合相似
+# -------------------------------------------------------------
+def _member_key(path: str, size, crc):
+    # 没有 CRC（tar）时用文件名代替
+    if crc:
+        return (size, crc.upper())
+    return (size, "name:" + path.replace("\\", "/").rsplit("/", 1)[-1])
+
+
+def load_member_sets(conn, library_ids=None) -> dict:
+    """entry_id -> frozenset of member keys（只取未删除的压缩包）"""
+    where, params = _scope(library_ids)
+    cur = conn.execute(f"""
+        SELECT e.id, a.member_path, a.member_size, a.member_crc
+        FROM entries e
+        JOIN archives a
+          ON a.library_id = e.library_id AND a.archive_full_path = e.full_path
+        WHERE e.is_archive = 1 AND e.is_deleted = 0 {where}
+        ORDER BY e.id
+    """, params)
+    return {
+        entry_id: frozenset(_member_key(r[1], r[2], r[3]) for r in rows)
+        for entry_id, rows in groupby(cur, key=lambda r: r[0])
+    }
+
+
+def near_pairs(member_sets: dict, min_similarity: float, max_df: int = 50) -> list:
+    """
+    返回 [(similarity, entry_a, entry_b), ...]，按相似度降序。
+    用倒排索引只比较至少共享一个成员的压缩包；出现在超过 max_df 个压缩包里的成员
+    （空文件、readme 之类）不参与配对。
+    """
+    postings = defaultdict(list)
+    for entry_id, keys in member_sets.items():
+        for k in keys:
+            postings[k].append(entry_id)
+
+    shared = Counter()
+    for ids in postings.values():
+        if len(ids) < 2 or len(ids) > max_df:
+            continue
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                shared[(a, b) if a < b else (b, a)] += 1
+
+    pairs = []
+    for a, b in shared:
+        size_a, size_b = len(member_sets[a]), len(member_sets[b])
+        # Jaccard 上界，先剪枝
+        if min(size_a, size_b) / max(size_a, size_b) < min_similarity:
+            continue
+        sim = len(member_sets[a] & member_sets[b]) / len(member_sets[a] | member_sets[b])
+        if sim >= min_similarity:
+            pairs.append((sim, a, b))
+    pairs.sort(key=lambda x: (-x[0], x[1], x[2]))
+    return pairs
+
+
+# -------------------------------------------------------------
+# 报告
+# -------------------------------------------------------------
+def report(db_path: str, out_csv: str = None, library_ids=None, min_similarity: float = 0.9,
+           max_df: int = 50, backfill: bool = False, near: bool = True) -> dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_columns(conn)
+        if backfill:
+            n = backfill_manifests(conn, library_ids)
+            print(f"[INFO] backfilled manifest_hash for {n} archives")
+
+        groups = exact_groups(conn, library_ids)
+        # 同一组的清单相同，看第一个压缩包就够了
+        matches = ["exact" if has_member_crc(conn, g[0][1], g[0][2]) else "exact_nocrc" for g in groups]
+
+        pairs = []
+        info = {}
+        if near:
+            member_sets = load_member_sets(conn, library_ids)
+            # exact 组只留第一个参与 near 比较，避免同一对关系重复出现
+            for g in groups:
+                for r in g[1:]:
+                    member_sets.pop(r[0], None)
+            pairs = near_pairs(member_sets, min_similarity, max_df)
+            for entry_id in sorted({x for _, a, b in pairs for x in (a, b)}):
+                row = conn.execute(
+                    "SELECT library_id, full_path, size_bytes FROM entries WHERE id = ?", (entry_id,)
+                ).fetchone()
+                info[entry_id] = row + (len(member_sets[entry_id]),)
+    finally:
+        conn.close()
+
+    exact = [g for g, m in zip(groups, matches) if m == "exact"]
+    redundant = sum(sum(r[3] or 0 for r in g[1:]) for g in exact)
+    byte_identical = sum(1 for g in exact if len({r[4] for r in g}) == 1 and g[0][4])
+    print(f"[DONE] exact manifest groups: {len(exact)} ({sum(len(g) for g in exact)} archives, "
+          f"{byte_identical} byte-identical) | redundant bytes: {redundant} | "
+          f"path+size only (no CRC): {len(groups) - len(exact)} | "
+          f"near pairs (>= {min_similarity:.2f}): {len(pairs)}")
+
+    if out_csv:
+        out = Path(out_csv)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with out.open("w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(REPORT_HEADER)
+            for gid, (g, match) in enumerate(zip(groups, matches), start=1):
+                for entry_id, library_id, full_path, size_bytes, _, _ in g:
+                    w.writerow([match, gid, "1.000", library_id, entry_id, full_path, size_bytes, ""])
+            for gid, (sim, a, b) in enumerate(pairs, start=1):
+                for entry_id in (a, b):
+                    library_id, full_path, size_bytes, members = info[entry_id]
+                    w.writerow(["near", gid, f"{sim:.3f}", library_id, entry_id,
+                                full_path, size_bytes, members])
+        print(f"[DONE] report written to {out}")
+    else:
+        for gid, (g, match) in enumerate(zip(groups, matches), start=1):
+            print(f"{match} #{gid}")
+            for r in g:
+                print(f"  [{r[1]}] {r[2]} ({r[3]} bytes)")
+        for gid, (sim, a, b) in enumerate(pairs, start=1):
+            print(f"near #{gid} similarity={sim:.3f}")
+            for entry_id in (a, b):
+                print(f"  [{info[entry_id][0]}] {info[entry_id][1]} ({info[entry_id][3]} members)")
+
+    return {"exact_groups": len(exact), "exact_nocrc_groups": len(groups) - len(exact),
+            "near_pairs": len(pairs), "redundant_bytes": redundant}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Find repacked duplicate archives by member manifest")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--out", help="Write report CSV (default: print)")
+    ap.add_argument("--library-id", type=int, action="append", default=[],
+                    help="Only these libraries (repeatable, default: all)")
+    ap.add_argument("--backfill", action="store_true",
+                    help="Compute manifest_hash for archives scanned before it existed")
+    ap.add_argument("--min-similarity", type=float, default=0.9,
+                    help="Jaccard threshold for near-identical archives (default: 0.9)")
+    ap.add_argument("--max-df", type=int, default=50,
+                    help="Ignore members shared by more than N archives when pairing (default: 50)")
+    ap.add_argument("--no-near", action="store_true", help="Only report exact manifest matches")
+    args = ap.parse_args()
+
+    if not 0 < args.min_similarity <= 1:
+        print("[ERROR] --min-similarity must be in (0, 1]", file=sys.stderr)
+        sys.exit(2)
+
+    report(args.db, args.out, args.library_id, args.min_similarity, args.max_df,
+           args.backfill, not args.no_near)
+
+
+if __name__ == "__main__":
+    main()
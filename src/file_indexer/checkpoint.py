@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+扫描断点（checkpoint journal）：一次扫描中断后（Ctrl-C、云盘掉线、重启）用 --resume 从断点继续。
+
+walker 的输出顺序是确定的（深度优先，目录内按名字排序，先文件后子目录），writer 又按这个顺序写出，
+所以每个 root 只需要记录：
+  done_dirs : 整个子树都已处理完的目录（相对 root，/ 分隔；子目录被父目录合并，列表很短）
+  last_file : 最后一个处理完的文件 / 压缩包（相对 root）
+另外记录 CSV 的字节位置、--db 的 library_id、计数器。
+
+写入时机：writer 每处理 --checkpoint-every 个条目（或每 CHECKPOINT_SECONDS 秒）
+  1. flush + fsync 两个 CSV，记下 tell() 位置
+  2. --db：journal 写进 scan_checkpoint 表，和这批数据在同一个事务里提交
+     只有 CSV：journal 写到 <entries_out>.checkpoint.json（先写 .tmp 再 os.replace）
+--resume 时把 CSV 截断到 journal 里的位置（去掉断点之后写了一半的行），以追加模式重新打开，
+walker 跳过 done_dirs 和 last_file 之前的文件；断点之后的数据库行在事务里没有提交，不会重复。
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+CHECKPOINT_EVERY_DEFAULT = 10000
+CHECKPOINT_SECONDS = 60.0
+JOURNAL_VERSION = 1
+
+CHECKPOINT_SQL = """
+CREATE TABLE IF NOT EXISTS scan_checkpoint (
+    scan_key    TEXT PRIMARY KEY,
+    state       TEXT NOT NULL,
+    updated_at  TEXT
+);
+"""
+
+
+def journal_path(entries_out: Path) -> Path:
+    return entries_out.with_name(entries_out.name + ".checkpoint.json")
+
+
+def scan_key(roots) -> str:
+    return "|".join(str(r) for r in roots)
+
+
+def new_state(roots, config: dict) -> dict:
+    return {
+        "version": JOURNAL_VERSION,
+        "config": config,
+        "roots": {str(r): {"done_dirs": set(), "last_file": None} for r in roots},
+        "entries_offset": 0,
+        "archives_offset": 0,
+        "library_ids": {},
+        "dropped_indexes": [],
+        "counters": {},
+        "scan_done": False,
+    }
+
+
+# -------------------------------------------------------------
+# 读写 journal
+# -------------------------------------------------------------
+def _dumps(state: dict) -> str:
+    data = dict(state)
+    data["roots"] = {
+        root: {"done_dirs": sorted(rs["done_dirs"]), "last_file": rs["last_file"]}
+        for root, rs in state["roots"].items()
+    }
+    data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _loads(text: str) -> dict:
+    state = json.loads(text)
+    for rs in state["roots"].values():
+        rs["done_dirs"] = set(rs["done_dirs"])
+    return state
+
+
+def load_checkpoint(conn, json_file: Path, key: str):
+    """返回 journal 或 None。conn 不为 None 时从 scan_checkpoint 表读，否则读 json_file。"""
+    if conn is not None:
+        conn.executescript(CHECKPOINT_SQL)
+        row = conn.execute("SELECT state FROM scan_checkpoint WHERE scan_key = ?", (key,)).fetchone()
+        return _loads(row[0]) if row else None
+    if json_file is None or not json_file.exists():
+        return None
+    return _loads(json_file.read_text(encoding="utf-8"))
+
+
+def save_checkpoint(conn, json_file: Path, key: str, state: dict):
+    """
+    conn 不为 None：写 scan_checkpoint 并提交（与这批数据同一个事务）。
+    否则原子地替换 json_file。调用前 CSV 必须已经 fsync。
+    """
+    text = _dumps(state)
+    if conn is not None:
+        conn.execute("""
+            INSERT INTO scan_checkpoint (scan_key, state, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (scan_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        """, (key, text, datetime.now().isoformat(timespec="seconds")))
+        conn.commit()
+        return
+    tmp = json_file.with_name(json_file.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, json_file)
+
+
+def clear_checkpoint(conn, json_file: Path, key: str):
+    if conn is not None:
+        conn.execute("DELETE FROM scan_checkpoint WHERE scan_key = ?", (key,))
+        conn.commit()
+    if json_file is not None and json_file.exists():
+        json_file.unlink()
+
+
+def sync_csv(f) -> int:
+    """flush + fsync 一个文本文件，返回当前字节位置"""
+    f.flush()
+    os.fsync(f.fileno())
+    return f.tell()
+
+
+def truncate_csv(path: Path, offset: int):
+    """去掉断点之后写入的内容（可能是半行）"""
+    with open(path, "r+b") as f:
+        f.truncate(offset)
+
+
+# -------------------------------------------------------------
+# 进度推进 / 跳过判断（rel 都是相对 root、用 / 分隔的路径）
+# -------------------------------------------------------------
+def _parent(rel: str) -> str:
+    return rel.rpartition("/")[0]
+
+
+def _chain(d: str) -> list:
+    """'a/b/c' -> ['a', 'a/b', 'a/b/c']；'' -> []"""
+    if not d:
+        return []
+    parts = d.split("/")
+    return ["/".join(parts[:i + 1]) for i in range(len(parts))]
+
+
+def _is_under(path: str, d: str) -> bool:
+    return d == "" or path == d or path.startswith(d + "/")
+
+
+def advance(root_state: dict, rel: str):
+    """
+    writer 处理完 rel 之后调用。离开的目录（上一个文件所在目录中不是新目录祖先的部分）
+    整个子树都已处理完，记入 done_dirs，同时去掉它下面已记录的子目录。
+    """
+    last = root_state["last_file"]
+    if last is not None:
+        old_parent, new_parent = _parent(last), _parent(rel)
+        if old_parent != new_parent:
+            keep = set(_chain(new_parent))
+            done = root_state["done_dirs"]
+            # 从深到浅，父目录完成时合并掉子目录
+            for d in reversed(_chain(old_parent)):
+                if d in keep:
+                    break
+                done.difference_update([x for x in done if x.startswith(d + "/")])
+                done.add(d)
+    root_state["last_file"] = rel
+
+
+def make_skip(root_state: dict):
+    """返回 walker 用的 skip(rel, is_dir) -> bool"""
+    done = root_state["done_dirs"]
+    last = root_state["last_file"]
+    last_parent, _, last_name = (last or "").rpartition("/")
+
+    def skip(rel: str, is_dir: bool) -> bool:
+        if is_dir:
+            return rel in done
+        if last is None:
+            return False
+        parent, _, name = rel.rpartition("/")
+        if parent == last_parent:
+            return name <= last_name
+        # 祖先目录的文件在进入子目录之前就处理完了
+        return _is_under(last_parent, parent)
+    return skip
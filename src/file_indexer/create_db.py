@@ -30,7 +30,11 @@ CREATE TABLE IF NOT EXISTS entries (
     mtime       REAL,
     hash_algo   TEXT,
     hash_value  TEXT,
+    partial_hash TEXT,
+    manifest_hash TEXT,
+    is_deleted  INTEGER NOT NULL DEFAULT 0,
     extra_meta  TEXT,
+    crc32       TEXT,
     FOREIGN KEY (library_id) REFERENCES library(id)
 );
 
@@ -54,6 +58,8 @@ CREATE TABLE IF NOT EXISTS archives (
     member_path       TEXT NOT NULL,
     member_size       INTEGER,
     member_mtime      REAL,
+    member_crc        TEXT,
+    member_packed_size INTEGER,
     hash_algo         TEXT,
     hash_value        TEXT,
     extra_meta        TEXT,
@@ -68,6 +74,261 @@ CREATE INDEX IF NOT EXISTS idx_archives_archive
     ON archives(archive_full_path);
 """
 
+# 旧库升级：CREATE TABLE IF NOT EXISTS 不会给已有表补列，这里按需 ALTER TABLE
+EXTRA_COLUMNS = [
+    ("entries", "partial_hash", "TEXT"),
+    ("entries", "is_deleted", "INTEGER NOT NULL DEFAULT 0"),
+    ("entries", "manifest_hash", "TEXT"),
+    ("entries", "crc32", "TEXT"),
+    ("archives", "member_crc", "TEXT"),
+    ("archives", "member_packed_size", "INTEGER"),
+]
+
+# 依赖上面新增列的索引（必须在补列之后创建）
+EXTRA_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_archives_size_crc
+    ON archives(member_size, member_crc);
+
+-- 去重分组用的覆盖索引：GROUP BY (size_bytes, hash_value) 只扫索引，不回表
+CREATE INDEX IF NOT EXISTS idx_entries_size_hash
+    ON entries(size_bytes, hash_value, hash_algo, library_id, is_dir, is_deleted);
+
+-- 压缩包内容指纹（archive_report.py 按它分组）
+CREATE INDEX IF NOT EXISTS idx_entries_manifest
+    ON entries(manifest_hash);
+
+-- --hash 含 crc32 时（crc32,sha256）：和 archives(member_size, member_crc) 对照压缩包成员
+CREATE INDEX IF NOT EXISTS idx_entries_size_crc32
+    ON entries(size_bytes, crc32) WHERE crc32 IS NOT NULL;
+"""
+
+# 与 sql/Delete_Plan_Create.sql 相同（dedupe.py 会自动创建）
+DELETE_PLAN_SQL = """
+CREATE TABLE IF NOT EXISTS delete_plan (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    -- group identity
+    hash_value        TEXT    NOT NULL,
+    library_id        INTEGER NOT NULL,
+    entry_id          INTEGER NOT NULL,
+
+    -- file info
+    full_path         TEXT    NOT NULL,
+    rn                INTEGER NOT NULL,   -- ranking from dup_ranked
+    size_bytes        INTEGER,
+
+    -- role in group
+    is_keep           INTEGER NOT NULL DEFAULT 0,  -- 1 if rn = 1
+    delete_flag       INTEGER NOT NULL DEFAULT 0,  -- 1 if planned to delete
+    verify_flag       INTEGER NOT NULL DEFAULT 0,  -- 1 after you manually approve
+
+    -- logic/safety explanation
+    reason            TEXT,                       -- "auto: rn>1", etc.
+    safety_status     TEXT,                       -- 'OK', 'ERROR_NO_KEEP', 'ERROR_MULTI_KEEP', ...
+
+    -- group-level stats (same across all rows in the same hash)
+    group_size        INTEGER,
+    group_has_rn1     INTEGER,
+    group_multi_rn1   INTEGER,
+    group_bytes_total INTEGER,
+    bytes_to_free     INTEGER,                    -- = size_bytes if delete_flag=1 else 0
+
+    -- audit info
+    created_at        TEXT NOT NULL DEFAULT (datetime('now')),
+    deleted_at        TEXT,                       -- filled after actual deletion
+    error_msg         TEXT,                       -- if deletion failed
+
+    FOREIGN KEY (library_id) REFERENCES library(id),
+    FOREIGN KEY (entry_id)  REFERENCES entries(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_delete_plan_hash
+    ON delete_plan(hash_value);
+
+CREATE INDEX IF NOT EXISTS idx_delete_plan_delete
+    ON delete_plan(delete_flag, verify_flag, safety_status);
+
+CREATE INDEX IF NOT EXISTS idx_delete_plan_entry
+    ON delete_plan(entry_id);
+"""
+
+
+# -------------------------------------------------------------
+# schema v2（migrate_v2.py 生成，与 sql/schema_v2.sql 相同）
+#   - 目录只存一次：dirs(id, parent_id, name)，entries_v2.dir_id 引用它；
+#     dirs.path（带结尾分隔符的绝对路径）/ dirs.rel（相对 root，根目录为 '.'）
+#     是按目录缓存的拼接结果，兼容视图不需要递归 CTE
+#   - hash / crc32 存 BLOB（md5 16 字节，hex TEXT 是 32 字节 + 更大的索引）
+#   - mtime 存整数秒
+# 兼容视图 entries 给出 v1 的全部列，用于查看和临时查询（比 v1 慢，查重用 sql/Dup_Check_v2.sql）；
+# 视图只有 is_deleted / extra_meta / manifest_hash 可以 UPDATE（INSTEAD OF 触发器）。
+# v2 是从 v1 单向迁移出来的快照：扫描 / 导入 / reindex / watch / dedupe 只写 v1（见 require_v1）。
+# -------------------------------------------------------------
+SCHEMA_V2_SQL = """
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS library (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    name       TEXT NOT NULL,
+    root_path  TEXT NOT NULL,
+    note       TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dirs (
+    id          INTEGER PRIMARY KEY,
+    parent_id   INTEGER,                   -- NULL = 扫描根目录
+    library_id  INTEGER NOT NULL,
+    name        TEXT NOT NULL,             -- 根目录为完整路径
+    path        TEXT NOT NULL,             -- 绝对路径，带结尾分隔符
+    rel         TEXT NOT NULL,             -- 相对 root 的路径（v1 的 parent_path），根目录为 '.'
+    FOREIGN KEY (parent_id)  REFERENCES dirs(id),
+    FOREIGN KEY (library_id) REFERENCES library(id)
+);
+
+CREATE TABLE IF NOT EXISTS entries_v2 (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,   -- 与 v1 的 entries.id 相同
+    library_id    INTEGER NOT NULL,
+    dir_id        INTEGER NOT NULL,
+    name          TEXT NOT NULL,
+    ext           TEXT,
+    is_dir        INTEGER NOT NULL,
+    is_archive    INTEGER NOT NULL DEFAULT 0,
+    size_bytes    INTEGER,
+    mtime         INTEGER,                             -- 整数秒
+    hash_algo     TEXT,
+    hash_value    BLOB,                                -- 不是 hex 的值原样存 TEXT
+    partial_hash  BLOB,
+    manifest_hash BLOB,
+    is_deleted    INTEGER NOT NULL DEFAULT 0,
+    extra_meta    TEXT,
+    crc32         BLOB,                                -- 4 字节
+    FOREIGN KEY (library_id) REFERENCES library(id),
+    FOREIGN KEY (dir_id)     REFERENCES dirs(id)
+);
+
+CREATE TABLE IF NOT EXISTS archives (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    library_id        INTEGER NOT NULL,
+    archive_full_path TEXT NOT NULL,
+    archive_entry_id  INTEGER,
+    member_path       TEXT NOT NULL,
+    member_size       INTEGER,
+    member_mtime      REAL,
+    member_crc        TEXT,
+    member_packed_size INTEGER,
+    hash_algo         TEXT,
+    hash_value        TEXT,
+    extra_meta        TEXT,
+    FOREIGN KEY (library_id)       REFERENCES library(id),
+    FOREIGN KEY (archive_entry_id) REFERENCES entries_v2(id)
+);
+"""
+
+# 数据写完之后再建（迁移时比边插边维护索引快）
+SCHEMA_V2_INDEXES_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dirs_path
+    ON dirs(library_id, path);
+
+CREATE INDEX IF NOT EXISTS idx_dirs_parent
+    ON dirs(parent_id, name);
+
+CREATE INDEX IF NOT EXISTS idx_v2_lib
+    ON entries_v2(library_id);
+
+CREATE INDEX IF NOT EXISTS idx_v2_dir
+    ON entries_v2(dir_id, name);
+
+CREATE INDEX IF NOT EXISTS idx_v2_hash
+    ON entries_v2(hash_value);
+
+CREATE INDEX IF NOT EXISTS idx_v2_size_hash
+    ON entries_v2(size_bytes, hash_value, hash_algo, library_id, is_dir, is_deleted);
+
+CREATE INDEX IF NOT EXISTS idx_v2_manifest
+    ON entries_v2(manifest_hash);
+
+CREATE INDEX IF NOT EXISTS idx_v2_size_crc32
+    ON entries_v2(size_bytes, crc32) WHERE crc32 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_archives_hash
+    ON archives(hash_value);
+
+CREATE INDEX IF NOT EXISTS idx_archives_archive
+    ON archives(archive_full_path);
+
+CREATE INDEX IF NOT EXISTS idx_archives_size_crc
+    ON archives(member_size, member_crc);
+"""
+
+# BLOB 按算法还原成 v1 的写法：crc32 大写，其它小写；TEXT（迁移时不是 hex 的值）原样返回
+SCHEMA_V2_VIEW_SQL = """
+CREATE VIEW IF NOT EXISTS entries AS
+SELECT
+    e.id,
+    e.library_id,
+    d.path || e.name AS full_path,
+    d.rel            AS parent_path,
+    e.name,
+    e.ext,
+    e.is_dir,
+    e.is_archive,
+    e.size_bytes,
+    e.mtime,
+    e.hash_algo,
+    CASE WHEN typeof(e.hash_value) = 'blob'
+         THEN CASE WHEN e.hash_algo = 'crc32' THEN hex(e.hash_value) ELSE lower(hex(e.hash_value)) END
+         ELSE e.hash_value END AS hash_value,
+    CASE WHEN typeof(e.partial_hash) = 'blob'
+         THEN CASE WHEN e.hash_algo = 'crc32' THEN hex(e.partial_hash) ELSE lower(hex(e.partial_hash)) END
+         ELSE e.partial_hash END AS partial_hash,
+    CASE WHEN typeof(e.manifest_hash) = 'blob'
+         THEN lower(hex(e.manifest_hash))
+         ELSE e.manifest_hash END AS manifest_hash,
+    e.is_deleted,
+    e.extra_meta,
+    CASE WHEN typeof(e.crc32) = 'blob' THEN hex(e.crc32) ELSE e.crc32 END AS crc32
+FROM entries_v2 e
+JOIN dirs d ON d.id = e.dir_id;
+
+-- delete_exec.py 标记 is_deleted，archive_report.py --backfill 写 manifest_hash（存 TEXT）
+CREATE TRIGGER IF NOT EXISTS entries_update
+INSTEAD OF UPDATE OF is_deleted, extra_meta, manifest_hash ON entries
+BEGIN
+    UPDATE entries_v2
+       SET is_deleted = NEW.is_deleted,
+           extra_meta = NEW.extra_meta,
+           manifest_hash = CASE WHEN NEW.manifest_hash IS OLD.manifest_hash
+                                THEN manifest_hash ELSE NEW.manifest_hash END
+     WHERE id = OLD.id;
+END;
+"""
+
+
+def schema_version(conn) -> int:
+    """entries 是视图（migrate_v2.py 生成的库）时为 2，否则为 1"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'entries'").fetchone()
+    return 2 if row and row[0] == "view" else 1
+
+
+def require_v1(conn, db_path=""):
+    """写 entries 的工具（扫描 / 导入 / reindex / watch / dedupe）只支持 v1"""
+    if schema_version(conn) == 2:
+        raise SystemExit(f"[ERROR] {db_path or 'database'} uses schema v2 (read-only view "
+                         f"'entries'); run this tool on the v1 database")
+
+
+def ensure_columns(conn):
+    # v2 的 entries 是视图，不能 ALTER / 建索引；archives 表在 v2 里已经是最新的
+    if schema_version(conn) == 2:
+        return
+    for table, column, decl in EXTRA_COLUMNS:
+        cols = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    conn.executescript(EXTRA_INDEXES_SQL)
+
+
 def create_db(db_path: str = DB_PATH_DEFAULT):
     db_path = Path(db_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure folder exists
@@ -75,6 +336,8 @@ def create_db(db_path: str = DB_PATH_DEFAULT):
     conn = sqlite3.connect(str(db_path))
     try:
         conn.executescript(SCHEMA_SQL)
+        ensure_columns(conn)
+        conn.executescript(DELETE_PLAN_SQL)
         conn.commit()
         print(f"[OK] Database initialized at: {db_path}")
     finally:
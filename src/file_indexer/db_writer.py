@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+把 index_archives_v2.process_file() 的结果直接写入 SQLite 的 entries / archives 表。
+
+CSV 流程里这些字段由 import_csv.py 负责转换，这里做同样的事情，
+供增量扫描（reindex.py）等直接写库的场景使用。
+"""
+
+from index_archives_v2 import ENTRIES_HEADER, ARCHIVES_HEADER
+
+
+def _int_or_none(v):
+    return int(v) if v not in (None, "") else None
+
+
+def _float_or_none(v):
+    return float(v) if v not in (None, "") else None
+
+
+def entry_values(res: dict) -> dict:
+    """process_file 结果 -> entries 表字段 dict（不含 id / library_id）"""
+    row = dict(zip(ENTRIES_HEADER, res["entry_row"]))
+    return {
+        "full_path": row["full_path"],
+        "parent_path": row["parent_path"],
+        "name": row["name"],
+        "ext": row["ext"] or None,
+        "is_dir": int(row["is_dir"] or 0),
+        "is_archive": int(row["is_archive"] or 0),
+        "size_bytes": _int_or_none(row["size_bytes"]),
+        "mtime": _float_or_none(row["mtime"]),
+        "hash_algo": row["hash_algo"] or None,
+        "hash_value": row["hash_value"] or None,
+        "partial_hash": row["partial_hash"] or None,
+        "manifest_hash": row["manifest_hash"] or None,
+        "crc32": row["crc32"] or None,
+        "extra_meta": row["extra_meta"] or None,
+    }
+
+
+def insert_entry(cur, library_id: int, res: dict) -> int:
+    v = entry_values(res)
+    cur.execute("""
+        INSERT INTO entries (
+            library_id, full_path, parent_path, name,
+            ext, is_dir, is_archive,
+            size_bytes, mtime,
+            hash_algo, hash_value, partial_hash, manifest_hash, extra_meta, crc32
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        library_id, v["full_path"], v["parent_path"], v["name"],
+        v["ext"], v["is_dir"], v["is_archive"],
+        v["size_bytes"], v["mtime"],
+        v["hash_algo"], v["hash_value"], v["partial_hash"], v["manifest_hash"],
+        v["extra_meta"], v["crc32"],
+    ))
+    return cur.lastrowid
+
+
+def update_entry(cur, entry_id: int, res: dict):
+    v = entry_values(res)
+    cur.execute("""
+        UPDATE entries
+        SET parent_path = ?, name = ?, ext = ?, is_dir = ?, is_archive = ?,
+            size_bytes = ?, mtime = ?,
+            hash_algo = ?, hash_value = ?, partial_hash = ?, manifest_hash = ?,
+            extra_meta = ?, crc32 = ?, is_deleted = 0
+        WHERE id = ?
+    """, (
+        v["parent_path"], v["name"], v["ext"], v["is_dir"], v["is_archive"],
+        v["size_bytes"], v["mtime"],
+        v["hash_algo"], v["hash_value"], v["partial_hash"], v["manifest_hash"],
+        v["extra_meta"], v["crc32"],
+        entry_id,
+    ))
+
+
+def insert_archive_rows(cur, library_id: int, entry_id, res: dict):
+    rows = []
+    for r in res["archive_rows"]:
+        a = dict(zip(ARCHIVES_HEADER, r))
+        rows.append((
+            library_id,
+            a["archive_full_path"],
+            entry_id,
+            a["member_path"],
+            _int_or_none(a["member_size"]),
+            _float_or_none(a["member_mtime"]),
+            a["member_crc"] or None,
+            _int_or_none(a["member_packed_size"]),
+            a["hash_algo"] or None,
+            a["hash_value"] or None,
+        ))
+    cur.executemany("""
+        INSERT INTO archives (
+            library_id, archive_full_path, archive_entry_id,
+            member_path, member_size, member_mtime,
+            member_crc, member_packed_size,
+            hash_algo, hash_value, extra_meta
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+    """, rows)
+    return len(rows)
+
+
+def upsert_entry(cur, library_id: int, entry_id, res: dict, stats=None) -> int:
+    """
+    entry_id 为 None 时新建 entries 行，否则原地更新并重建该压缩包的 archives 行。
+    返回 entry id。（reindex.py / watch.py 共用）stats: stats.StatsDelta，记录统计的变化
+    """
+    if entry_id is None:
+        entry_id = insert_entry(cur, library_id, res)
+    else:
+        if stats is not None:
+            stats.add_id(cur, entry_id, -1)
+        update_entry(cur, entry_id, res)
+        cur.execute(
+            "DELETE FROM archives WHERE library_id = ? AND archive_full_path = ?",
+            (library_id, res["entry_row"][1]),
+        )
+    if stats is not None:
+        stats.add_id(cur, entry_id, 1)
+    if res["is_archive"]:
+        insert_archive_rows(cur, library_id, entry_id, res)
+    return entry_id
+
+
+def mark_deleted(cur, library_id: int, entry_id: int, full_path: str, stats=None):
+    """文件已消失：entries.is_deleted = 1，并删除其 archives 成员行"""
+    cur.execute("DELETE FROM archives WHERE library_id = ? AND archive_full_path = ?",
+                (library_id, full_path))
+    if stats is not None:
+        stats.add_id(cur, entry_id, -1)
+    cur.execute("UPDATE entries SET is_deleted = 1 WHERE id = ?", (entry_id,))
+
+
+# -------------------------------------------------------------
+# 批量导入：调优 PRAGMA + 导入期间去掉二级索引，导入后一次性重建
+# -------------------------------------------------------------
+BULK_TABLES = ("entries", "archives")
+DEFER_INDEX_RATIO = 0.5
+
+
+def should_defer_indexes(conn, expected_rows: int = 0) -> bool:
+    """
+    导入期间要不要去掉索引：重建要把整张表再扫一遍，只有 entries 还是空的、
+    或者预计写入的行数（expected_rows，不知道时给 0）至少是已有行数的 DEFER_INDEX_RATIO 时才划算。
+    大库上的小扫描保留索引，同时运行的 dedupe.py（INDEXED BY）/ reindex / lookup 也不受影响。
+    """
+    existing = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+    return existing == 0 or expected_rows >= existing * DEFER_INDEX_RATIO
+
+
+def bulk_load_begin(conn, cache_mb: int = 256, defer_indexes: bool = True) -> list:
+    """
+    进入批量写入模式，返回被暂时删除的索引 SQL 列表（交给 bulk_load_end 重建）。
+    """
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"PRAGMA cache_size = -{int(cache_mb) * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+    dropped = []
+    if defer_indexes:
+        placeholders = ",".join("?" for _ in BULK_TABLES)
+        rows = conn.execute(f"""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL
+              AND tbl_name IN ({placeholders})
+        """, BULK_TABLES).fetchall()
+        for name, sql in rows:
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            dropped.append(sql)
+        conn.commit()
+    return dropped
+
+
+def bulk_load_end(conn, dropped: list):
+    """重建 bulk_load_begin 删除的索引，并恢复 synchronous。"""
+    conn.commit()
+    for sql in dropped:
+        conn.execute(sql)
+    conn.commit()
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA optimize")
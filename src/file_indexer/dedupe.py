@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+去重引擎：替代手工执行的 Dup_Check.sql -> Dup_Ranked_v2.sql -> Delete_Plan_Insert_Data.sql
+
+- 一次索引扫描（idx_entries_size_hash 覆盖索引）找出所有 (size_bytes, hash_value) 重复组，
+  可以跨多个 library
+- 全程使用 entry_id，不再用 folder_path || '\\' || filename 拼路径回表
+- 保留优先级规则从 JSON 配置文件读取（不再硬编码 D:\\...）
+- 结果写入 delete_plan，列与原 SQL 相同；每组恰好一个 rn = 1，所以 safety_status 总是 OK
+- hash_algo 不够强的组（crc32 / xxh* / 64 位以下，见 hashers.is_strong）不生成删除计划，只给出 [WARN]
+- 增量：每个组的签名 (count, sum(id), min(id), max(id), 成员 id 的散列和) 存在 dedupe_groups 表里，
+  再次运行时只重算签名有变化（新增 / 变化 / 消失）的组；已执行删除（deleted_at 非空）的行保留
+
+配置示例见 config/dedupe_rules.example.json：
+{
+  "rules": [
+    {"under": "D:\\\\整理完成", "rank": 1},
+    {"library": "主库2", "rank": 2},
+    {"glob": "*\\\\temp\\\\*", "rank": 200}
+  ],
+  "default_rank": 99
+}
+  under   : 所在文件夹等于该路径或位于其下（对应原 SQL 的 folder_path = X OR LIKE 'X\\%'）
+  library : library.name 或 library.root_path 相同
+  glob    : fnmatch 匹配 full_path
+多条规则命中时取最小 rank；之后依次按 目录深度、目录长度、目录、文件名 排序（与 Dup_Ranked_v2 相同）。
+
+用法：
+python src/file_indexer/dedupe.py --db data/workspace/archive_work.db --config config/dedupe_rules.json
+python src/file_indexer/dedupe.py --db ... --config ... --library-id 1 --library-id 3 --full
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from collections import Counter
+from itertools import groupby
+
+from create_db import DELETE_PLAN_SQL, ensure_columns, require_v1
+from hashers import is_strong
+
+DEDUPE_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS dedupe_groups (
+    size_bytes INTEGER NOT NULL,
+    hash_value TEXT    NOT NULL,
+    n          INTEGER NOT NULL,
+    id_sum     INTEGER NOT NULL,
+    id_min     INTEGER NOT NULL,
+    id_max     INTEGER NOT NULL,
+    id_hash    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (size_bytes, hash_value)
+);
+
+CREATE TABLE IF NOT EXISTS dedupe_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_delete_plan_size_hash
+    ON delete_plan(size_bytes, hash_value);
+"""
+
+REASON = "auto: rn>1, single keep per hash"
+
+# 与顺序无关的成员 id 散列：每个 id 做 32 位整数混合（x * K, x ^ (x >> 16), * K2）后求和。
+# count / sum / min / max 相同的不同成员集合（例如 {3,5,6,10} 和 {3,4,7,10}）这一项几乎不会相同；
+# SQLite 没有 XOR：a ^ b = (a | b) - (a & b)
+_ID_MIX = "((e.id * 2654435761) % 4294967296)"
+ID_HASH_SQL = (f"SUM(((({_ID_MIX} | ({_ID_MIX} >> 16)) - ({_ID_MIX} & ({_ID_MIX} >> 16)))"
+               f" * 73244475) % 4294967296)")
+
+
+# -------------------------------------------------------------
+# 规则
+# -------------------------------------------------------------
+def load_rules(path: str) -> dict:
+    if not path:
+        return {"rules": [], "default_rank": 99}
+    with open(path, encoding="utf-8-sig") as f:
+        cfg = json.load(f)
+    cfg.setdefault("rules", [])
+    cfg.setdefault("default_rank", 99)
+    return cfg
+
+
+def _norm(path: str) -> str:
+    return path.replace("/", "\\").rstrip("\\").lower()
+
+
+def _under(folder: str, base: str) -> bool:
+    folder, base = _norm(folder), _norm(base)
+    return folder == base or folder.startswith(base + "\\")
+
+
+def pref_rank(rules: dict, folder: str, full_path: str, lib_name: str, lib_root: str) -> int:
+    best = None
+    for r in rules["rules"]:
+        hit = False
+        if "under" in r:
+            hit = _under(folder, r["under"])
+        elif "library" in r:
+            hit = r["library"] in (lib_name, lib_root)
+        elif "glob" in r:
+            hit = fnmatch.fnmatch(full_path, r["glob"])
+        if hit and (best is None or r["rank"] < best):
+            best = r["rank"]
+    return rules["default_rank"] if best is None else best
+
+
+def _folder(full_path: str, name: str) -> str:
+    if name and full_path.endswith(name):
+        return full_path[:-len(name)].rstrip("\\/")
+    return full_path.replace("/", "\\").rsplit("\\", 1)[0]
+
+
+def rank_group(rules: dict, members: list) -> list:
+    """
+    members: [(entry_id, library_id, full_path, name, size_bytes, lib_name, lib_root), ...]
+    返回按保留优先级排好序的 members（第一个 rn = 1）
+    """
+    def key(m):
+        entry_id, _, full_path, name, _, lib_name, lib_root = m
+        folder = _folder(full_path, name)
+        depth = folder.count("\\") + folder.count("/")
+        return (
+            pref_rank(rules, folder, full_path, lib_name, lib_root),
+            depth,
+            len(folder),
+            folder,
+            name,
+            entry_id,
+        )
+    return sorted(members, key=key)
+
+
+# -------------------------------------------------------------
+# 分组（增量）
+# -------------------------------------------------------------
+def _scope_filter(library_ids):
+    if not library_ids:
+        return "", []
+    marks = ",".join("?" for _ in library_ids)
+    return f" AND e.library_id IN ({marks})", list(library_ids)
+
+
+def _scope_key(library_ids, rules: dict) -> str:
+    raw = json.dumps({"libs": sorted(library_ids or []), "rules": rules}, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def find_touched_groups(conn, library_ids, full: bool) -> tuple:
+    """
+    计算当前所有重复组的签名，放入 temp.cur_groups；
+    与上次 (dedupe_groups) 对比，变化的组放入 temp.touched。
+    返回 (当前组数, 变化组数)
+    """
+    where, params = _scope_filter(library_ids)
+    weak = Counter()
+
+    def strong_hash(algo):
+        # 没有 hash_algo 的旧数据按 md5 处理（与 delete_exec 相同）
+        if not algo or is_strong(algo):
+            return 1
+        weak[algo] += 1
+        return 0
+
+    conn.create_function("strong_hash", 1, strong_hash)
+    conn.executescript("""
+        DROP TABLE IF EXISTS temp.cur_groups;
+        DROP TABLE IF EXISTS temp.touched;
+        CREATE TEMP TABLE cur_groups (
+            size_bytes INTEGER, hash_value TEXT,
+            n INTEGER, id_sum INTEGER, id_min INTEGER, id_max INTEGER, id_hash INTEGER,
+            PRIMARY KEY (size_bytes, hash_value)
+        );
+        CREATE TEMP TABLE touched (
+            size_bytes INTEGER, hash_value TEXT,
+            PRIMARY KEY (size_bytes, hash_value)
+        );
+    """)
+
+    # 一次按 (size_bytes, hash_value) 顺序的覆盖索引扫描
+    conn.execute(f"""
+        INSERT INTO temp.cur_groups
+        SELECT e.size_bytes, e.hash_value,
+               COUNT(*), SUM(e.id), MIN(e.id), MAX(e.id), {ID_HASH_SQL}
+        FROM entries e INDEXED BY idx_entries_size_hash
+        WHERE e.size_bytes IS NOT NULL
+          AND e.hash_value IS NOT NULL AND e.hash_value <> ''
+          AND e.is_dir = 0 AND e.is_deleted = 0
+          {where}
+        GROUP BY e.size_bytes, e.hash_value
+        -- 混用多种 hash 算法的库：不同算法的 hash 值相同只可能是碰撞，不算重复
+        HAVING COUNT(*) > 1
+           AND MIN(COALESCE(e.hash_algo, '')) = MAX(COALESCE(e.hash_algo, ''))
+           AND strong_hash(MIN(e.hash_algo))
+    """, params)
+    if weak:
+        algos = ", ".join(f"{a}: {n}" for a, n in weak.most_common())
+        print(f"[WARN] duplicate groups skipped, hash too weak to delete on ({algos}); "
+              f"rescan with --hash md5 / sha256 / blake2b-128", file=sys.stderr)
+
+    if full:
+        conn.execute("INSERT INTO temp.touched SELECT size_bytes, hash_value FROM temp.cur_groups")
+        conn.execute("INSERT OR IGNORE INTO temp.touched SELECT size_bytes, hash_value FROM dedupe_groups")
+    else:
+        # 新增或签名变化的组
+        conn.execute("""
+            INSERT INTO temp.touched
+            SELECT c.size_bytes, c.hash_value
+            FROM temp.cur_groups c
+            LEFT JOIN dedupe_groups g
+              ON g.size_bytes = c.size_bytes AND g.hash_value = c.hash_value
+            WHERE g.size_bytes IS NULL
+               OR g.n <> c.n OR g.id_sum <> c.id_sum
+               OR g.id_min <> c.id_min OR g.id_max <> c.id_max OR g.id_hash <> c.id_hash
+        """)
+        # 不再重复的组（成员被删除 / 改变）
+        conn.execute("""
+            INSERT OR IGNORE INTO temp.touched
+            SELECT g.size_bytes, g.hash_value
+            FROM dedupe_groups g
+            LEFT JOIN temp.cur_groups c
+              ON c.size_bytes = g.size_bytes AND c.hash_value = g.hash_value
+            WHERE c.size_bytes IS NULL
+        """)
+
+    n_groups = conn.execute("SELECT COUNT(*) FROM temp.cur_groups").fetchone()[0]
+    n_touched = conn.execute("SELECT COUNT(*) FROM temp.touched").fetchone()[0]
+    return n_groups, n_touched
+
+
+# -------------------------------------------------------------
+# delete_plan
+# -------------------------------------------------------------
+def plan_rows(rules: dict, hash_value: str, members: list) -> list:
+    """一个重复组 -> delete_plan 行（与 Delete_Plan_Insert_Data.sql 的规则一致）"""
+    ranked = rank_group(rules, members)
+    group_size = len(ranked)
+    total_bytes = sum(m[4] or 0 for m in ranked)
+    # Python 排序给出唯一的 rn，组也不会为空：每组恰好一个 rn = 1，
+    # 原 SQL 的 ERROR_NO_KEEP / ERROR_MULTI_KEEP 不会出现，这几列照旧写常量
+    has_rn1, multi_rn1, safety = 1, 0, "OK"
+
+    rows = []
+    for rn, (entry_id, library_id, full_path, _, size_bytes, _, _) in enumerate(ranked, start=1):
+        delete_flag = 1 if rn > 1 else 0
+        rows.append((
+            hash_value, library_id, entry_id, full_path, rn, size_bytes,
+            1 if rn == 1 else 0,    # is_keep
+            delete_flag,
+            0,                      # verify_flag：人工确认后再改为 1
+            REASON,
+            safety,
+            group_size, has_rn1, multi_rn1, total_bytes,
+            size_bytes if delete_flag else 0,   # bytes_to_free
+        ))
+    return rows
+
+
+def rebuild_plan(conn, rules: dict, library_ids) -> dict:
+    where, params = _scope_filter(library_ids)
+    stats = {"plan_rows": 0, "delete_rows": 0, "bytes_to_free": 0}
+
+    # 受影响的组：先删掉尚未执行的旧计划
+    conn.execute("""
+        DELETE FROM delete_plan
+        WHERE deleted_at IS NULL
+          AND EXISTS (
+              SELECT 1 FROM temp.touched t
+              WHERE t.size_bytes = delete_plan.size_bytes
+                AND t.hash_value = delete_plan.hash_value
+          )
+    """)
+
+    cur = conn.execute(f"""
+        SELECT t.size_bytes, t.hash_value,
+               e.id, e.library_id, e.full_path, e.name, e.size_bytes,
+               l.name, l.root_path
+        FROM temp.touched t
+        JOIN temp.cur_groups c
+          ON c.size_bytes = t.size_bytes AND c.hash_value = t.hash_value
+        JOIN entries e INDEXED BY idx_entries_size_hash
+          ON e.size_bytes = t.size_bytes AND e.hash_value = t.hash_value
+        JOIN library l ON l.id = e.library_id
+        WHERE e.is_dir = 0 AND e.is_deleted = 0
+          {where}
+        ORDER BY t.size_bytes, t.hash_value
+    """, params)
+
+    insert = conn.cursor()
+    for (_, hash_value), grp in groupby(cur, key=lambda r: (r[0], r[1])):
+        members = [r[2:] for r in grp]
+        rows = plan_rows(rules, hash_value, members)
+        insert.executemany("""
+            INSERT INTO delete_plan (
+                hash_value, library_id, entry_id, full_path, rn, size_bytes,
+                is_keep, delete_flag, verify_flag, reason, safety_status,
+                group_size, group_has_rn1, group_multi_rn1, group_bytes_total, bytes_to_free
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        stats["plan_rows"] += len(rows)
+        stats["delete_rows"] += sum(r[7] for r in rows)
+        stats["bytes_to_free"] += sum(r[15] or 0 for r in rows)
+
+    # 记录新的组签名
+    conn.execute("""
+        DELETE FROM dedupe_groups
+        WHERE EXISTS (
+            SELECT 1 FROM temp.touched t
+            WHERE t.size_bytes = dedupe_groups.size_bytes
+              AND t.hash_value = dedupe_groups.hash_value
+        )
+    """)
+    conn.execute("""
+        INSERT INTO dedupe_groups (size_bytes, hash_value, n, id_sum, id_min, id_max, id_hash)
+        SELECT c.size_bytes, c.hash_value, c.n, c.id_sum, c.id_min, c.id_max, c.id_hash
+        FROM temp.cur_groups c
+        JOIN temp.touched t
+          ON t.size_bytes = c.size_bytes AND t.hash_value = c.hash_value
+    """)
+    return stats
+
+
+def run_dedupe(db_path: str, config: str = None, library_ids=None, full: bool = False) -> dict:
+    rules = load_rules(config)
+    conn = sqlite3.connect(db_path)
+    try:
+        # 分组查询用 INDEXED BY idx_entries_size_hash，v2 没有这个索引
+        require_v1(conn, db_path)
+        ensure_columns(conn)
+        conn.executescript(DELETE_PLAN_SQL)
+        conn.executescript(DEDUPE_STATE_SQL)
+        if "id_hash" not in {row[1] for row in conn.execute("PRAGMA table_info(dedupe_groups)")}:
+            # 旧库：补列，签名都是 0，下一次运行把所有组当作变化重算一遍
+            conn.execute("ALTER TABLE dedupe_groups ADD COLUMN id_hash INTEGER NOT NULL DEFAULT 0")
+
+        # 库范围或规则变了 -> 全量重算
+        scope = _scope_key(library_ids, rules)
+        row = conn.execute("SELECT value FROM dedupe_state WHERE key = 'scope'").fetchone()
+        if row is None or row[0] != scope:
+            full = True
+
+        t0 = time.time()
+        n_groups, n_touched = find_touched_groups(conn, library_ids, full)
+        stats = rebuild_plan(conn, rules, library_ids)
+        conn.execute(
+            "INSERT OR REPLACE INTO dedupe_state (key, value) VALUES ('scope', ?)", (scope,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    stats.update({"groups": n_groups, "touched": n_touched, "full": full})
+    print(f"[DONE] dup groups: {n_groups} | recomputed: {n_touched}{' (full)' if full else ''} | "
+          f"plan rows: {stats['plan_rows']} | to delete: {stats['delete_rows']} | "
+          f"bytes_to_free: {stats['bytes_to_free']} | {time.time() - t0:.1f}s")
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build duplicate groups and populate delete_plan")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--config", help="JSON preference rules (see config/dedupe_rules.example.json)")
+    ap.add_argument("--library-id", type=int, action="append", default=[],
+                    help="Only these libraries (repeatable, default: all)")
+    ap.add_argument("--full", action="store_true", help="Recompute all groups")
+    args = ap.parse_args()
+
+    run_dedupe(args.db, args.config, args.library_id, args.full)
+
+
+if __name__ == "__main__":
+    main()
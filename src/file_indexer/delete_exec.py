@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+执行 delete_plan：真正删除 delete_flag = 1 AND verify_flag = 1 AND safety_status = 'OK' 的文件。
+
+每个文件删除前重新确认：
+- 文件仍存在，size 与 entries 一致，mtime 一致（允许 MTIME_TOLERANCE 秒误差，旧 CSV 只有秒）
+- 同组的保留文件（rn = 1）仍存在、size 相同、本身没有被删除
+- --verify partial（默认）：待删文件与保留文件的头尾 partial hash 相同
+  --verify full           ：两者的完整 hash 都等于 delete_plan.hash_value
+  --verify none           ：只做上面的 stat 检查
+- hash_algo 不够强（crc32 / xxh* / 64 位以下，见 hashers.is_strong）的行一律不删：同 size 的碰撞会变成误删
+
+按 --batch-size 分批，每批用线程池并行删除（同一设备最多 --per-device 个并发，
+机械盘不会被随机 IO 拖垮），一批结束后在同一个事务里写 deleted_at / error_msg，
+并把 entries.is_deleted 置 1。中断后直接重新运行即可：已记录的行会跳过；
+删掉了但还没来得及记录的文件，再次运行时发现已不存在，记 deleted_at 并在 error_msg 注明。
+
+用法：
+python src/file_indexer/delete_exec.py --db data/workspace/archive_work.db --dry-run
+python src/file_indexer/delete_exec.py --db data/workspace/archive_work.db --workers 8 --per-device 2
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from create_db import DELETE_PLAN_SQL, ensure_columns
+from hashers import hash_file, is_strong
+from staged_hash import partial_hash
+from stats import open_stats
+
+BATCH_SIZE_DEFAULT = 1000
+MTIME_TOLERANCE = 1.0
+VERIFY_MODES = ("partial", "full", "none")
+GONE_MSG = "already missing before delete"
+
+SELECT_BATCH = """
+    SELECT d.id, d.entry_id, d.full_path, d.size_bytes, d.hash_value,
+           e.mtime, e.hash_algo,
+           k.full_path, k.size_bytes, k.deleted_at
+    FROM delete_plan d
+    LEFT JOIN entries e ON e.id = d.entry_id
+    LEFT JOIN delete_plan k
+           ON k.hash_value = d.hash_value
+          AND k.size_bytes IS d.size_bytes
+          AND k.is_keep = 1
+    WHERE d.delete_flag = 1 AND d.verify_flag = 1 AND d.safety_status = 'OK'
+      AND d.is_keep = 0
+      AND d.deleted_at IS NULL
+      {error_filter}
+      {library_filter}
+      AND d.id > ?
+    ORDER BY d.id
+    LIMIT ?
+"""
+
+
+# -------------------------------------------------------------
+# 单个文件：校验 + 删除（在线程池里运行）
+# -------------------------------------------------------------
+def device_limiter(per_device: int):
+    """返回 get(st_dev) -> 该设备的信号量（每个设备最多 per_device 个并发）"""
+    sems = {}
+    lock = threading.Lock()
+
+    def get(dev):
+        with lock:
+            sem = sems.get(dev)
+            if sem is None:
+                sem = sems[dev] = threading.BoundedSemaphore(max(1, per_device))
+            return sem
+    return get
+
+
+def _verify(row, st, verify: str):
+    """返回错误信息，校验通过返回 None"""
+    (_, _, path, size, hash_value, mtime, hash_algo,
+     keep_path, keep_size, keep_deleted_at) = row
+
+    if size is not None and st.st_size != size:
+        return f"size changed: {st.st_size} != {size}"
+    if mtime is not None and abs(st.st_mtime - mtime) > MTIME_TOLERANCE:
+        return f"mtime changed: {st.st_mtime} != {mtime}"
+
+    if not keep_path:
+        return "keep row not found in delete_plan"
+    if keep_deleted_at:
+        return f"keep file was deleted at {keep_deleted_at}: {keep_path}"
+    if os.path.normcase(os.path.abspath(keep_path)) == os.path.normcase(os.path.abspath(path)):
+        return "keep file is the file to delete"
+    try:
+        keep_st = os.stat(keep_path)
+    except OSError as ex:
+        return f"keep file missing: {keep_path} ({ex})"
+    if keep_st.st_size != st.st_size or (keep_size is not None and keep_st.st_size != keep_size):
+        return f"keep file size differs: {keep_path}"
+
+    if hash_algo and not is_strong(hash_algo):
+        return f"hash_algo {hash_algo} is too weak to delete on"
+    algo = hash_algo or "md5"
+    if verify == "partial":
+        if partial_hash(path, algo, st.st_size) != partial_hash(keep_path, algo, keep_st.st_size):
+            return "partial hash differs from keep file"
+    elif verify == "full":
+        if not hash_algo:
+            return "no hash_algo in entries, cannot verify full hash"
+        if hash_file(path, algo) != hash_value:
+            return "full hash changed"
+        if hash_file(keep_path, algo) != hash_value:
+            return "keep file full hash changed"
+    return None
+
+
+def delete_one(row, verify: str, limiter, dry_run: bool):
+    """返回 (plan_id, status, freed_bytes, error_msg)；status: deleted / gone / error"""
+    plan_id, path = row[0], row[2]
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return plan_id, "gone", 0, GONE_MSG
+    except OSError as ex:
+        return plan_id, "error", 0, str(ex)
+
+    with limiter(st.st_dev):
+        try:
+            err = _verify(row, st, verify)
+            if err:
+                return plan_id, "error", 0, err
+            if not dry_run:
+                os.remove(path)
+        except OSError as ex:
+            return plan_id, "error", 0, str(ex)
+    return plan_id, "deleted", st.st_size, None
+
+
+# -------------------------------------------------------------
+# 分批执行
+# -------------------------------------------------------------
+def _record_batch(conn, results, entry_ids: dict, index_stats):
+    now = datetime.now().isoformat(timespec="seconds")
+    done = [r for r in results if r[1] in ("deleted", "gone")]
+    failed = [r for r in results if r[1] == "error"]
+    conn.executemany(
+        "UPDATE delete_plan SET deleted_at = ?, error_msg = ? WHERE id = ?",
+        [(now, err, plan_id) for plan_id, _, _, err in done],
+    )
+    conn.executemany(
+        "UPDATE delete_plan SET error_msg = ? WHERE id = ?",
+        [(err, plan_id) for plan_id, _, _, err in failed],
+    )
+    deleted_ids = [entry_ids[plan_id] for plan_id, _, _, _ in done if entry_ids.get(plan_id)]
+    for entry_id in deleted_ids:
+        index_stats.add_id(conn, entry_id, -1)
+    conn.executemany("UPDATE entries SET is_deleted = 1 WHERE id = ?", [(i,) for i in deleted_ids])
+    index_stats.commit(conn)
+
+
+def execute_plan(db_path: str,
+                 verify: str = "partial",
+                 workers: int = 8,
+                 per_device: int = 2,
+                 batch_size: int = BATCH_SIZE_DEFAULT,
+                 library_ids=None,
+                 retry_errors: bool = False,
+                 dry_run: bool = False,
+                 limit: int = 0) -> dict:
+    conn = sqlite3.connect(db_path, timeout=60)
+    ensure_columns(conn)
+    conn.executescript(DELETE_PLAN_SQL)
+    # entries.is_deleted 的变化同步到统计表（stats.py）
+    index_stats = open_stats(conn)
+
+    error_filter = "" if retry_errors else "AND d.error_msg IS NULL"
+    library_filter = ""
+    params = []
+    if library_ids:
+        library_filter = "AND d.library_id IN (%s)" % ",".join("?" for _ in library_ids)
+        params = list(library_ids)
+    sql = SELECT_BATCH.format(error_filter=error_filter, library_filter=library_filter)
+
+    planned_files, planned_bytes = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(d.bytes_to_free), 0) FROM delete_plan d
+        WHERE d.delete_flag = 1 AND d.verify_flag = 1 AND d.safety_status = 'OK'
+          AND d.is_keep = 0 AND d.deleted_at IS NULL
+          {error_filter} {library_filter}
+    """, params).fetchone()
+    if limit:
+        planned_files = min(planned_files, limit)
+    print(f"[INFO] {'DRY RUN: ' if dry_run else ''}{planned_files} files | "
+          f"bytes_to_free: {planned_bytes} | verify: {verify} | workers: {workers} | per-device: {per_device}")
+
+    stats = {"deleted": 0, "gone": 0, "error": 0, "freed_bytes": 0}
+    limiter = device_limiter(per_device)
+    last_id = 0
+    processed = 0
+    t0 = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="delete") as pool:
+            while not limit or processed < limit:
+                n = batch_size if not limit else min(batch_size, limit - processed)
+                rows = conn.execute(sql, params + [last_id, n]).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                processed += len(rows)
+
+                results = list(pool.map(lambda r: delete_one(r, verify, limiter, dry_run), rows))
+                for plan_id, status, freed, err in results:
+                    stats[status] += 1
+                    stats["freed_bytes"] += freed
+                    if status == "error":
+                        print(f"[ERROR] delete_plan.id={plan_id}: {err}", file=sys.stderr)
+                if not dry_run:
+                    _record_batch(conn, results, {r[0]: r[1] for r in rows}, index_stats)
+
+                elapsed = time.time() - t0
+                rate = stats["freed_bytes"] / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+                print(f"  {processed}/{planned_files} files | freed {stats['freed_bytes']}"
+                      f"/{planned_bytes} bytes | {rate:.1f} MB/s")
+    finally:
+        conn.close()
+
+    elapsed = time.time() - t0
+    files_rate = processed / elapsed if elapsed > 0 else 0.0
+    bytes_rate = stats["freed_bytes"] / elapsed if elapsed > 0 else 0.0
+    pct = 100.0 * stats["freed_bytes"] / planned_bytes if planned_bytes else 0.0
+    print(f"[DONE] {'would delete' if dry_run else 'deleted'}: {stats['deleted']} | "
+          f"already missing: {stats['gone']} | errors: {stats['error']} | "
+          f"freed: {stats['freed_bytes']} bytes ({pct:.1f}% of bytes_to_free) | "
+          f"{files_rate:.0f} files/sec | {bytes_rate / 1024 / 1024:.1f} MB/s | {elapsed:.1f}s")
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Execute verified rows of delete_plan")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--verify", choices=VERIFY_MODES, default="partial",
+                    help="Content check before delete (default: partial head+tail hash)")
+    ap.add_argument("--workers", type=int, default=8, help="Delete threads (default: 8)")
+    ap.add_argument("--per-device", type=int, default=2,
+                    help="Max concurrent deletes per device (st_dev), default: 2")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE_DEFAULT,
+                    help=f"Rows per committed batch (default: {BATCH_SIZE_DEFAULT})")
+    ap.add_argument("--library-id", type=int, action="append", default=[],
+                    help="Only these libraries (repeatable, default: all)")
+    ap.add_argument("--retry-errors", action="store_true", help="Also retry rows with error_msg")
+    ap.add_argument("--limit", type=int, default=0, help="Process at most N rows")
+    ap.add_argument("--dry-run", action="store_true", help="Verify only, do not delete or record")
+    args = ap.parse_args()
+
+    execute_plan(args.db, args.verify, args.workers, args.per_device, args.batch_size,
+                 args.library_id, args.retry_errors, args.dry_run, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+"""
+Hash 算法注册表：所有需要算文件 hash 的地方（扫描、分阶段 hash、删除前校验）都从这里取。
+
+支持的名字（--hash 的取值，也是写入 entries.hash_algo 的值）：
+- hashlib 的任意算法：md5 / sha1 / sha256 / blake2b / blake2s ...
+- blake2b-<bits> / blake2s-<bits>：指定摘要长度，例如 blake2b-128、blake2s-256
+- crc32：zlib.crc32，8 位大写十六进制（与 archives.member_crc 同格式），只适合快速比对，不适合单独用于去重
+- shake_128 / shake_256 需要指定输出长度，不支持（用 blake2b-<bits>）
+
+is_strong()：密码学 hash 且摘要超过 64 位才能作为去重 / 删除的依据（dedupe.py / delete_exec.py 检查），
+crc32、xxh*（非密码学）和 blake2b-64 这类短摘要只能用来比对，不能单独决定删除。
+- xxh32 / xxh64 / xxh3_64 / xxh3_128 / xxh128：需要 pip install xxhash
+- blake3：需要 pip install blake3
+
+多个算法用逗号分隔（例如 crc32,sha256）：hash_file_digests() 读一遍文件，每块数据依次交给各个 hasher。
+写入 entries 时 primary_algo() 给出的算法（第一个不是 crc32 的）进 hash_algo / hash_value，
+crc32 进 entries.crc32（和 archives.member_crc 对照），其余的进 extra_meta。
+
+可选模块没有安装时自动回退到标准库（xxh* -> blake2b-128，blake3 -> blake2b-256），
+并打印一次 [WARN]。调用方应使用 resolve_algo() 的返回值写 hash_algo，
+这样同一个库里混用多种算法时，每行记录的都是实际使用的算法。
+
+读文件（hash_file）：
+- readinto（默认）：每个线程复用一块预分配的 bytearray，用 memoryview 交给 hash，不再每次 read() 分配新 bytes
+- mmap          ：>= MMAP_MIN_SIZE 的文件用 mmap，按块把 memoryview 交给 hash；小文件仍走 readinto
+- read          ：旧实现（f.read(block)）
+- Linux 上调用 posix_fadvise(SEQUENTIAL)，并且每读完一段就 DONTNEED，
+  扫描几十 TB 时不会把页缓存里其它进程的数据挤出去（--keep-cache 关闭）
+- 块大小可配置（--read-block-kb）；configure_io() 设置进程内默认值
+
+测速（内存中 hash，不含磁盘 IO；--file 可测包含 IO 的速度）：
+python src/file_indexer/hashers.py bench-hash
+python src/file_indexer/hashers.py bench-hash --size-mb 512 --algos md5,sha256,blake2b-128,crc32,xxh3_64
+
+读文件方式对比（吞吐量 + 峰值 RSS，每种方式在独立子进程中运行）：
+python src/file_indexer/hashers.py bench-io
+python src/file_indexer/hashers.py bench-io --dir "E:\\BGM_Raw\\some_folder" --algo blake2b-128
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from functools import lru_cache
+
+CHUNK_SIZE = 1024 * 1024
+MMAP_MIN_SIZE = 64 * 1024 * 1024
+DONTNEED_EVERY = 64 * 1024 * 1024
+READ_MODES = ("readinto", "mmap", "read")
+
+# hash_file() 的默认读文件参数（CLI 里用 configure_io() 修改）
+IO_OPTIONS = {
+    "block_size": CHUNK_SIZE,
+    "mode": "readinto",
+    "drop_cache": True,
+}
+
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+XXHASH_ALGOS = ("xxh32", "xxh64", "xxh3_64", "xxh3_128", "xxh128")
+# 非密码学 hash：碰撞可以构造，不能单独作为删除依据（见 is_strong）
+NON_CRYPTO_ALGOS = ("crc32",) + XXHASH_ALGOS
+STRONG_MIN_BITS = 65
+
+# 可选模块缺失时的回退
+FALLBACKS = {name: "blake2b-128" for name in XXHASH_ALGOS}
+FALLBACKS["blake3"] = "blake2b-256"
+
+BENCH_DEFAULT = ("md5", "sha1", "sha256", "blake2b", "blake2b-128", "blake2s",
+                 "crc32", "xxh64", "xxh3_64", "xxh3_128", "blake3")
+
+
+class _Crc32:
+    """让 zlib.crc32 有和 hashlib 对象一样的 update() / hexdigest()"""
+    name = "crc32"
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self) -> str:
+        return f"{self._crc & 0xFFFFFFFF:08X}"
+
+
+def _blake2_sized(name: str):
+    """'blake2b-128' -> (hashlib.blake2b, 16)；不是这种格式返回 None"""
+    base, sep, bits = name.partition("-")
+    if not sep or base not in ("blake2b", "blake2s") or not bits.isdigit():
+        return None
+    fn = getattr(hashlib, base)
+    size = int(bits) // 8
+    if int(bits) % 8 or not 1 <= size <= fn.MAX_DIGEST_SIZE:
+        raise ValueError(f"invalid digest size for {base}: {bits} bits")
+    return fn, size
+
+
+def _available(name: str) -> bool:
+    if name.startswith("shake_"):
+        # hexdigest() 需要输出长度
+        return False
+    if name == "crc32" or name in hashlib.algorithms_available:
+        return True
+    if name in XXHASH_ALGOS:
+        return xxhash is not None
+    if name == "blake3":
+        return blake3 is not None
+    try:
+        return _blake2_sized(name) is not None
+    except ValueError:
+        return False
+
+
+_warned = set()
+
+
+def resolve_algo(name: str) -> str:
+    """
+    规范化算法名并处理回退，返回实际使用的算法名（写入 hash_algo）。
+    空字符串表示不算 hash；未知算法抛 ValueError。
+    """
+    name = (name or "").strip().lower()
+    if not name:
+        return ""
+    if "," in name:
+        # 多个算法：逐个解析，去掉重复（回退后可能重名），保持顺序
+        return ",".join(dict.fromkeys(resolve_algo(n) for n in name.split(",") if n.strip()))
+    if _available(name):
+        return name
+    fallback = FALLBACKS.get(name)
+    if fallback:
+        if name not in _warned:
+            _warned.add(name)
+            module = "blake3" if name == "blake3" else "xxhash"
+            print(f"[WARN] {name} needs the '{module}' module, falling back to {fallback}",
+                  file=sys.stderr)
+        return fallback
+    _blake2_sized(name)  # 摘要长度写错时给出更具体的错误
+    if name.startswith("shake_"):
+        raise ValueError(f"{name} needs an output length, use blake2b-<bits> instead")
+    raise ValueError(f"unknown hash algorithm: {name}")
+
+
+def split_algos(spec: str) -> list:
+    """'crc32,sha256' -> ['crc32', 'sha256']；spec 应是 resolve_algo() 的结果"""
+    return [a for a in (spec or "").split(",") if a]
+
+
+def primary_algo(spec: str) -> str:
+    """写进 hash_algo / hash_value 的算法：第一个不是 crc32 的，只有 crc32 时就是 crc32"""
+    algos = split_algos(spec)
+    return next((a for a in algos if a != "crc32"), algos[0] if algos else "")
+
+
+@lru_cache(maxsize=None)
+def is_strong(algo: str) -> bool:
+    """algo（entries.hash_algo）能不能单独作为去重 / 删除的依据：密码学 hash 且摘要至少 STRONG_MIN_BITS 位"""
+    if not algo or algo in NON_CRYPTO_ALGOS:
+        return False
+    if algo == "blake3":
+        # 本机没装 blake3 模块时也能判断别处扫描的行
+        return True
+    try:
+        return new_hasher(algo).digest_size * 8 >= STRONG_MIN_BITS
+    except (ValueError, TypeError):
+        return False
+
+
+class _MultiHasher:
+    """同一块数据依次交给几个 hasher（一次读文件得到多个摘要）"""
+
+    def __init__(self, algos):
+        self.hashers = {a: new_hasher(a) for a in algos}
+        self._updates = [h.update for h in self.hashers.values()]
+
+    def update(self, data):
+        for update in self._updates:
+            update(data)
+
+    def hexdigests(self) -> dict:
+        return {a: h.hexdigest() for a, h in self.hashers.items()}
+
+
+def new_hasher(algo: str):
+    """返回带 update() / hexdigest() 的对象；algo 应是 resolve_algo() 的结果"""
+    if algo == "crc32":
+        return _Crc32()
+    if algo in XXHASH_ALGOS and xxhash is not None:
+        return getattr(xxhash, algo)()
+    if algo == "blake3" and blake3 is not None:
+        return blake3.blake3()
+    sized = _blake2_sized(algo)
+    if sized:
+        fn, size = sized
+        return fn(digest_size=size)
+    return hashlib.new(algo)
+
+
+def configure_io(block_size: int = None, mode: str = None, drop_cache: bool = None):
+    """设置 hash_file() 的默认块大小 / 读取方式 / 是否丢弃页缓存"""
+    if block_size:
+        IO_OPTIONS["block_size"] = int(block_size)
+    if mode:
+        if mode not in READ_MODES:
+            raise ValueError(f"unknown read mode: {mode}")
+        IO_OPTIONS["mode"] = mode
+    if drop_cache is not None:
+        IO_OPTIONS["drop_cache"] = bool(drop_cache)
+
+
+# -------------------------------------------------------------
+# 读文件
+# -------------------------------------------------------------
+_local = threading.local()
+
+
+def _buffer(block_size: int) -> memoryview:
+    """当前线程复用的读缓冲区（worker 线程各自一块）"""
+    buf = getattr(_local, "buf", None)
+    if buf is None or len(buf) != block_size:
+        buf = _local.buf = memoryview(bytearray(block_size))
+    return buf
+
+
+def _fadvise(fd, offset, length, advice: str):
+    """advice: "SEQUENTIAL" / "DONTNEED"；Windows / macOS 上没有 posix_fadvise，直接跳过"""
+    if _HAS_FADVISE:
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, "POSIX_FADV_" + advice))
+        except OSError:
+            pass
+
+
+def _read_legacy(f, h, block_size):
+    for chunk in iter(lambda: f.read(block_size), b""):
+        h.update(chunk)
+
+
+def _read_into(f, h, block_size, drop_cache):
+    fd = f.fileno()
+    buf = _buffer(block_size)
+    done = 0
+    dropped = 0
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        h.update(buf[:n])
+        done += n
+        if drop_cache and done - dropped >= DONTNEED_EVERY:
+            _fadvise(fd, dropped, done - dropped, "DONTNEED")
+            dropped = done
+
+
+def _read_mmap(f, h, block_size, size):
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mm)
+        try:
+            for off in range(0, size, block_size):
+                h.update(view[off:off + block_size])
+        finally:
+            view.release()
+
+
+def hash_file(path, algo: str, block_size: int = None, mode: str = None,
+              drop_cache: bool = None) -> str:
+    """完整文件 hash；algo 为空时返回 ""。未给出的参数使用 IO_OPTIONS。"""
+    if not algo:
+        return ""
+    h = new_hasher(algo)
+    _hash_path(path, h, block_size, mode, drop_cache)
+    return h.hexdigest()
+
+
+def hash_file_digests(path, spec: str, block_size: int = None, mode: str = None,
+                      drop_cache: bool = None) -> dict:
+    """spec 中每个算法的摘要 {algo: hex}，文件只读一遍；spec 为空时返回 {}"""
+    algos = split_algos(spec)
+    if not algos:
+        return {}
+    if len(algos) == 1:
+        return {algos[0]: hash_file(path, algos[0], block_size, mode, drop_cache)}
+    h = _MultiHasher(algos)
+    _hash_path(path, h, block_size, mode, drop_cache)
+    return h.hexdigests()
+
+
+def _hash_path(path, h, block_size: int = None, mode: str = None, drop_cache: bool = None):
+    block_size = block_size or IO_OPTIONS["block_size"]
+    mode = mode or IO_OPTIONS["mode"]
+    drop_cache = IO_OPTIONS["drop_cache"] if drop_cache is None else drop_cache
+
+    # buffering=0：直接读进我们的缓冲区，不经过 BufferedReader 再拷贝一次
+    with open(path, "rb", buffering=0 if mode != "read" else -1) as f:
+        fd = f.fileno()
+        if drop_cache:
+            _fadvise(fd, 0, 0, "SEQUENTIAL")
+        if mode == "read":
+            _read_legacy(f, h, block_size)
+        elif mode == "mmap" and os.fstat(fd).st_size >= MMAP_MIN_SIZE:
+            _read_mmap(f, h, block_size, os.fstat(fd).st_size)
+        else:
+            _read_into(f, h, block_size, drop_cache)
+        if drop_cache:
+            _fadvise(fd, 0, 0, "DONTNEED")
+
+
+def hash_stream(f, algo: str, block_size: int = None) -> str:
+    """从文件对象（压缩包成员的解压数据流等）读到结尾并计算 hash"""
+    block_size = block_size or IO_OPTIONS["block_size"]
+    h = new_hasher(algo)
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            break
+        h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------------------------------------------------
+# bench-hash
+# -------------------------------------------------------------
+def bench_hash(algos, size_mb: int = 256, repeat: int = 3, path: str = None):
+    """
+    测量每种算法的 MB/s。默认 hash 一块内存里的随机数据（只测 CPU），
+    给 path 时改为完整读取该文件（包含磁盘 IO / 页缓存的影响）。
+    "crc32+sha256" 测一次读取同时算几个摘要（--hash crc32,sha256）的速度。
+    """
+    if path:
+        total = os.path.getsize(path)
+        print(f"[BENCH] file: {path} ({total / 1024 / 1024:.1f} MB), best of {repeat}")
+    else:
+        buf = os.urandom(CHUNK_SIZE)
+        # 重复同一块 1 MiB 随机数据，避免生成 size_mb 的随机数太慢
+        chunks = [buf] * size_mb
+        total = size_mb * CHUNK_SIZE
+        print(f"[BENCH] in-memory: {size_mb} MB, best of {repeat}")
+
+    results = []
+    for name in algos:
+        try:
+            algo = resolve_algo(name.replace("+", ","))
+        except ValueError as ex:
+            print(f"  {name:<14} skipped ({ex})")
+            continue
+        best = None
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            if path:
+                hash_file_digests(path, algo)
+            else:
+                h = _MultiHasher(split_algos(algo))
+                for c in chunks:
+                    h.update(c)
+                h.hexdigests()
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        rate = total / 1024 / 1024 / best if best else 0.0
+        label = name if algo.replace(",", "+") == name else f"{name}->{algo.replace(',', '+')}"
+        results.append((label, rate))
+
+    for label, rate in sorted(results, key=lambda x: -x[1]):
+        print(f"  {label:<24} {rate:10.1f} MB/s")
+    return results
+
+
+# -------------------------------------------------------------
+# bench-io：读文件方式对比（每种方式一个子进程，分别统计峰值 RSS）
+# -------------------------------------------------------------
+IO_CASES = [
+    # (标签, mode, drop_cache)
+    ("read (old)", "read", False),
+    ("readinto", "readinto", False),
+    ("readinto+fadvise", "readinto", True),
+    ("mmap+fadvise", "mmap", True),
+]
+
+
+def _make_bench_files(folder: str, large_mb: int, small_count: int, small_kb: int):
+    block = os.urandom(CHUNK_SIZE)
+    large = os.path.join(folder, "large.bin")
+    with open(large, "wb") as f:
+        for _ in range(large_mb):
+            f.write(block)
+    small_dir = os.path.join(folder, "small")
+    os.makedirs(small_dir, exist_ok=True)
+    small = []
+    for i in range(small_count):
+        p = os.path.join(small_dir, f"{i:06d}.bin")
+        with open(p, "wb") as f:
+            f.write(block[(i * 7919) % CHUNK_SIZE:][:small_kb * 1024].ljust(small_kb * 1024, b"\0"))
+        small.append(p)
+    return [large], small
+
+
+def _evict(paths):
+    """尽量把文件从页缓存里丢掉，让每种方式都从磁盘读（不需要 root；Windows 上无效）"""
+    for p in paths:
+        try:
+            fd = os.open(p, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            _fadvise(fd, 0, 0, "DONTNEED")
+        finally:
+            os.close(fd)
+
+
+def _io_run(list_file: str, algo: str, mode: str, block_size: int, drop_cache: bool):
+    """子进程：hash 列表里的所有文件，输出一行 JSON"""
+    with open(list_file, encoding="utf-8") as f:
+        paths = [line.rstrip("\n") for line in f if line.strip()]
+    total = 0
+    t0 = time.perf_counter()
+    for p in paths:
+        hash_file(p, algo, block_size, mode, drop_cache)
+        total += os.path.getsize(p)
+    elapsed = time.perf_counter() - t0
+    try:
+        import resource
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            rss_kb //= 1024
+    except ImportError:
+        rss_kb = None
+    print(json.dumps({"bytes": total, "seconds": elapsed, "maxrss_kb": rss_kb}))
+
+
+def bench_io(folder: str = None, algo: str = "md5", block_size: int = CHUNK_SIZE,
+             large_mb: int = 512, small_count: int = 2000, small_kb: int = 64):
+    tmp = None
+    if folder:
+        files = sorted(os.path.join(d, n) for d, _, names in os.walk(folder) for n in names)
+        large = [p for p in files if os.path.getsize(p) >= MMAP_MIN_SIZE]
+        small = [p for p in files if os.path.getsize(p) < MMAP_MIN_SIZE]
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench_io_")
+        print(f"[BENCH] creating test files in {tmp} ...")
+        large, small = _make_bench_files(tmp, large_mb, small_count, small_kb)
+        # 脏页不会被 DONTNEED 丢弃，先落盘
+        if hasattr(os, "sync"):
+            os.sync()
+
+    algo = resolve_algo(algo)
+    print(f"[BENCH] algo: {algo} | block: {block_size // 1024} KiB | "
+          f"large files: {len(large)} | small files: {len(small)}")
+    try:
+        for label, paths in (("large", large), ("small", small)):
+            if not paths:
+                continue
+            list_file = os.path.join(tmp or tempfile.gettempdir(), f"bench_io_{label}.txt")
+            with open(list_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths))
+            for case, mode, drop in IO_CASES:
+                _evict(paths)
+                cmd = [sys.executable, os.path.abspath(__file__), "_io-run", list_file,
+                       "--algo", algo, "--mode", mode, "--block", str(block_size)]
+                if drop:
+                    cmd.append("--drop-cache")
+                out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                rate = r["bytes"] / 1024 / 1024 / r["seconds"] if r["seconds"] else 0.0
+                rss = f"{r['maxrss_kb'] / 1024:8.1f} MB" if r["maxrss_kb"] else "     n/a"
+                print(f"  {label:<6} {case:<18} {rate:10.1f} MB/s | peak RSS {rss}")
+            if not tmp:
+                os.remove(list_file)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Hash algorithm registry")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("bench-hash", help="Measure MB/s per hash algorithm on this machine")
+    b.add_argument("--algos", default=",".join(BENCH_DEFAULT),
+                   help="Comma separated algorithms, a+b = both digests in one pass "
+                        "(default: common + optional fast ones)")
+    b.add_argument("--size-mb", type=int, default=256, help="In-memory data size (default: 256)")
+    b.add_argument("--repeat", type=int, default=3, help="Repetitions, best time wins (default: 3)")
+    b.add_argument("--file", help="Hash this file instead of in-memory data (includes IO)")
+
+    b = sub.add_parser("bench-io", help="Compare file read modes: throughput and peak RSS")
+    b.add_argument("--dir", help="Use files under this folder (default: generate temp files)")
+    b.add_argument("--algo", default="md5", help="Hash algorithm (default: md5)")
+    b.add_argument("--read-block-kb", type=int, default=CHUNK_SIZE // 1024, help="Block size in KiB")
+    b.add_argument("--large-mb", type=int, default=512, help="Generated large file size (default: 512)")
+    b.add_argument("--small-count", type=int, default=2000, help="Generated small files (default: 2000)")
+    b.add_argument("--small-kb", type=int, default=64, help="Generated small file size (default: 64)")
+
+    # bench-io 内部使用的子进程入口
+    b = sub.add_parser("_io-run")
+    b.add_argument("list_file")
+    b.add_argument("--algo", required=True)
+    b.add_argument("--mode", choices=READ_MODES, required=True)
+    b.add_argument("--block", type=int, required=True)
+    b.add_argument("--drop-cache", action="store_true")
+
+    sub.add_parser("list", help="List algorithms usable with --hash")
+    args = ap.parse_args()
+
+    if args.cmd == "bench-hash":
+        algos = [a.strip() for a in args.algos.split(",") if a.strip()]
+        bench_hash(algos, args.size_mb, args.repeat, args.file)
+        return
+    if args.cmd == "bench-io":
+        bench_io(args.dir, args.algo, args.read_block_kb * 1024,
+                 args.large_mb, args.small_count, args.small_kb)
+        return
+    if args.cmd == "_io-run":
+        _io_run(args.list_file, args.algo, args.mode, args.block, args.drop_cache)
+        return
+
+    names = sorted(n for n in hashlib.algorithms_guaranteed if _available(n))
+    names += ["blake2b-<bits>", "blake2s-<bits>", "crc32 (compare only, not for dedupe)"]
+    names += [f"{n} (xxhash{'' if xxhash else ', not installed -> ' + FALLBACKS[n]})" for n in XXHASH_ALGOS]
+    names.append(f"blake3 (blake3{'' if blake3 else ', not installed -> ' + FALLBACKS['blake3']})")
+    for n in names:
+        print(n)
+
+
+if __name__ == "__main__":
+    main()
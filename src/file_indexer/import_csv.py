@@ -1,8 +1,42 @@
 # import_csv.py
+#
+# CSV -> SQLite，分批流式导入：
+# - csv 行按 --batch-size 分批 executemany，每批一个事务
+# - 每批提交时把 CSV 的读取位置（byte offset）记录到 import_progress 表，
+#   中断后用 --library-id N 重新运行即可从上次提交的位置继续
+# - mtime / mtime_iso / member_mtime 统一转成 REAL 时间戳
+# - entries 每批的统计变化（扩展名 / 目录 / hash 分组，见 stats.py）和数据在同一个事务里提交
+# - 每批的进度行带百分比和 ETA（按 CSV 字节数），--metrics-out 写 read_csv / convert / insert / stats / commit
+#   各阶段耗时的 JSON，--profile STAGE 对某个阶段开启 cProfile（见 metrics.py）
 import sqlite3
 import csv
 import argparse
+import os
+import time
+from contextlib import nullcontext
 from datetime import datetime
+from pathlib import Path
+
+from create_db import ensure_columns, require_v1
+from metrics import Metrics, _fmt_seconds
+from stats import open_stats
+
+PROFILE_STAGES = ["read_csv", "convert", "insert", "stats", "commit", "all"]
+
+BATCH_SIZE_DEFAULT = 50000
+
+PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS import_progress (
+    library_id  INTEGER NOT NULL,
+    table_name  TEXT    NOT NULL,
+    csv_path    TEXT    NOT NULL,
+    byte_offset INTEGER NOT NULL DEFAULT 0,
+    rows_done   INTEGER NOT NULL DEFAULT 0,
+    finished    INTEGER NOT NULL DEFAULT 0,
+    updated_at  TEXT,
+    PRIMARY KEY (library_id, table_name, csv_path)
+);
+"""
 
 def add_library(conn, name: str, root_path: str, note: str = None) -> int:
     cur = conn.cursor()
@@ -14,86 +48,233 @@ def add_library(conn, name: str, root_path: str, note: str = None) -> int:
     conn.commit()
     return cur.lastrowid
 
-def import_entries(conn, library_id: int, entries_csv: str):
-    cur = conn.cursor()
-    with open(entries_csv, newline='', encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = [
-            (
-                library_id,
-                row["full_path"],
-                row["parent_path"],
-                row["name"],
-                row.get("ext") or None,
-                int(row.get("is_dir", "0") or 0),
-                int(row.get("is_archive", "0") or 0),
-                int(row["size_bytes"]) if row.get("size_bytes") else None,
-                float(row["mtime"]) if row.get("mtime") else None,
-                row.get("hash_algo") or None,
-                row.get("hash_value") or None,
-                None,  # extra_meta 先为空
-            )
-            for row in reader
-        ]
-
-    cur.executemany("""
-        INSERT INTO entries (
-            library_id, full_path, parent_path, name,
-            ext, is_dir, is_archive,
-            size_bytes, mtime,
-            hash_algo, hash_value, extra_meta
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, rows)
-    conn.commit()
-    print(f"Imported {len(rows)} rows into entries for library_id={library_id}")
+def to_epoch(value):
+    """'1716854905.25' / '2024-05-28T08:08:25' / '' -> float 或 None"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def _entry_tuple(library_id: int, row: dict) -> tuple:
+    return (
+        library_id,
+        row["full_path"],
+        row["parent_path"],
+        row["name"],
+        row.get("ext") or None,
+        int(row.get("is_dir", "0") or 0),
+        int(row.get("is_archive", "0") or 0),
+        int(row["size_bytes"]) if row.get("size_bytes") else None,
+        # 新 CSV 有 mtime（时间戳）；旧 CSV 只有 mtime_iso
+        to_epoch(row.get("mtime")) or to_epoch(row.get("mtime_iso")),
+        row.get("hash_algo") or None,
+        row.get("hash_value") or None,
+        row.get("partial_hash") or None,
+        row.get("manifest_hash") or None,
+        row.get("extra_meta") or None,  # --hash 有多个算法时的其它摘要
+        row.get("crc32") or None,
+    )
+
+def _archive_tuple(library_id: int, row: dict) -> tuple:
+    return (
+        library_id,
+        row["archive_full_path"],
+        None,  # archive_entry_id 后面可用 UPDATE 补充
+        row["member_path"],
+        int(row["member_size"]) if row.get("member_size") else None,
+        to_epoch(row.get("member_mtime")),
+        row.get("member_crc") or None,
+        int(row["member_packed_size"]) if row.get("member_packed_size") else None,
+        row.get("hash_algo") or None,
+        row.get("hash_value") or None,
+        None,  # extra_meta
+    )
+
+ENTRIES_INSERT = """
+    INSERT INTO entries (
+        library_id, full_path, parent_path, name,
+        ext, is_dir, is_archive,
+        size_bytes, mtime,
+        hash_algo, hash_value, partial_hash, manifest_hash, extra_meta, crc32
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+ARCHIVES_INSERT = """
+    INSERT INTO archives (
+        library_id, archive_full_path, archive_entry_id,
+        member_path, member_size, member_mtime,
+        member_crc, member_packed_size,
+        hash_algo, hash_value, extra_meta
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# -------------------------------------------------------------
+# 分批读取 CSV，并给出每批结束时的文件位置
+# -------------------------------------------------------------
+def iter_csv_batches(csv_path: str, start_offset: int, batch_size: int):
+    """
+    产出 (rows: list[dict], offset)，offset 是这一批之后的读取位置，
+    下次可以直接 seek 过去继续读。
+    用 readline 而不是逐行迭代文件对象，这样 f.tell() 才可用。
+    """
+    with open(csv_path, newline='', encoding="utf-8-sig") as f:
+        header = next(csv.reader([f.readline()]))
+        if start_offset:
+            f.seek(start_offset)
+        reader = csv.reader(iter(f.readline, ""))
+        batch = []
+        for values in reader:
+            batch.append(dict(zip(header, values)))
+            if len(batch) >= batch_size:
+                yield batch, f.tell()
+                batch = []
+        if batch:
+            yield batch, f.tell()
+
+def _get_progress(conn, library_id: int, table_name: str, csv_path: str):
+    row = conn.execute("""
+        SELECT byte_offset, rows_done, finished FROM import_progress
+        WHERE library_id = ? AND table_name = ? AND csv_path = ?
+    """, (library_id, table_name, csv_path)).fetchone()
+    return row or (0, 0, 0)
+
+def _save_progress(cur, library_id: int, table_name: str, csv_path: str,
+                   offset: int, rows_done: int, finished: int):
+    cur.execute("""
+        INSERT INTO import_progress (
+            library_id, table_name, csv_path, byte_offset, rows_done, finished, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (library_id, table_name, csv_path) DO UPDATE SET
+            byte_offset = excluded.byte_offset,
+            rows_done   = excluded.rows_done,
+            finished    = excluded.finished,
+            updated_at  = excluded.updated_at
+    """, (library_id, table_name, csv_path, offset, rows_done, finished,
+          datetime.now().isoformat(timespec="seconds")))
+
+def _timed(metrics, name: str):
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+def _import_csv(conn, library_id: int, csv_path: str, table_name: str,
+                insert_sql: str, to_tuple, batch_size: int, metrics=None, stats=None):
+    conn.executescript(PROGRESS_SQL)
+    csv_path = str(Path(csv_path).resolve())
+    offset, rows_done, finished = _get_progress(conn, library_id, table_name, csv_path)
+    if finished:
+        print(f"[SKIP] {table_name}: {csv_path} already imported ({rows_done} rows)")
+        return rows_done
+    if offset:
+        print(f"[RESUME] {table_name}: continue at byte {offset} ({rows_done} rows done)")
 
-def import_archives(conn, library_id: int, archives_csv: str):
     cur = conn.cursor()
-    with open(archives_csv, newline='', encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = [
-            (
-                library_id,
-                row["archive_full_path"],
-                None,  # archive_entry_id 后面可用 UPDATE 补充
-                row["member_path"],
-                int(row["member_size"]) if row.get("member_size") else None,
-                float(row["member_mtime"]) if row.get("member_mtime") else None,
-                row.get("hash_algo") or None,
-                row.get("hash_value") or None,
-                None,  # extra_meta
-            )
-            for row in reader
-        ]
-
-    cur.executemany("""
-        INSERT INTO archives (
-            library_id, archive_full_path, archive_entry_id,
-            member_path, member_size, member_mtime,
-            hash_algo, hash_value, extra_meta
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, rows)
+    t0 = time.time()
+    imported = 0
+    file_size = os.path.getsize(csv_path)
+    start_offset = prev_offset = offset
+    batches = iter_csv_batches(csv_path, offset, batch_size)
+    if metrics is not None:
+        batches = metrics.timed_iter("read_csv", batches)
+    for batch, offset in batches:
+        with _timed(metrics, "convert"):
+            rows = [to_tuple(library_id, row) for row in batch]
+        with _timed(metrics, "insert"):
+            cur.executemany(insert_sql, rows)
+        if stats is not None:
+            with _timed(metrics, "stats"):
+                for r in rows:
+                    if not r[5]:
+                        stats.add(r[0], r[2], r[4], r[7], r[10], r[6])
+                stats.flush(conn)
+        imported += len(batch)
+        rows_done += len(batch)
+        # 数据和进度在同一个事务里提交，中断后不会重复也不会丢
+        _save_progress(cur, library_id, table_name, csv_path, offset, rows_done, 0)
+        with _timed(metrics, "commit"):
+            conn.commit()
+        if metrics is not None:
+            metrics.tick(len(batch), offset - prev_offset)
+        prev_offset = offset
+        elapsed = time.time() - t0
+        rate = imported / elapsed if elapsed > 0 else 0.0
+        # ETA：按这次运行读过的 CSV 字节数推算剩余部分
+        byte_rate = (offset - start_offset) / elapsed if elapsed > 0 else 0.0
+        eta = _fmt_seconds((file_size - offset) / byte_rate) if byte_rate > 0 else "?"
+        pct = offset * 100.0 / file_size if file_size else 100.0
+        print(f"  {table_name}: {rows_done} rows | {rate:.0f} rows/sec | {pct:.1f}% | ETA {eta}")
+
+    _save_progress(cur, library_id, table_name, csv_path, offset, rows_done, 1)
     conn.commit()
-    print(f"Imported {len(rows)} rows into archives for library_id={library_id}")
+    elapsed = time.time() - t0
+    rate = imported / elapsed if elapsed > 0 else 0.0
+    print(f"Imported {imported} rows into {table_name} for library_id={library_id} "
+          f"({elapsed:.1f}s, {rate:.0f} rows/sec)")
+    return rows_done
+
+def import_entries(conn, library_id: int, entries_csv: str, batch_size: int = BATCH_SIZE_DEFAULT,
+                   metrics=None):
+    stats = open_stats(conn)
+    return _import_csv(conn, library_id, entries_csv, "entries",
+                       ENTRIES_INSERT, _entry_tuple, batch_size, metrics, stats)
+
+def import_archives(conn, library_id: int, archives_csv: str, batch_size: int = BATCH_SIZE_DEFAULT,
+                    metrics=None):
+    return _import_csv(conn, library_id, archives_csv, "archives",
+                       ARCHIVES_INSERT, _archive_tuple, batch_size, metrics)
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--db", default="archive_work.db")
-    parser.add_argument("--library-name", required=True)
-    parser.add_argument("--root-path", required=True)
+    parser.add_argument("--library-name")
+    parser.add_argument("--root-path")
+    parser.add_argument("--library-id", type=int,
+                        help="导入到已有 library（中断后用同一个 id 重新运行即可续传）")
     parser.add_argument("--entries-csv", required=True)
     parser.add_argument("--archives-csv")  # 可选
     parser.add_argument("--note")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE_DEFAULT,
+                        help=f"rows per transaction (default: {BATCH_SIZE_DEFAULT})")
+    parser.add_argument("--metrics-out", help="write per-stage timings (read_csv/convert/insert/stats/commit) to JSON")
+    parser.add_argument("--profile", choices=PROFILE_STAGES, help="run cProfile for this stage")
+    parser.add_argument("--profile-out", default="import_profile.prof")
     args = parser.parse_args()
+    if args.library_id is None and not (args.library_name and args.root_path):
+        parser.error("--library-name and --root-path are required unless --library-id is given")
 
+    # 每批已经打印进度，这里不再定时打印
+    metrics = Metrics(progress_every=0, profile_stage=args.profile, label="import_csv", unit="rows")
     conn = sqlite3.connect(args.db)
+    metrics.profile_all_begin()
     try:
-        library_id = add_library(conn, args.library_name, args.root_path, args.note)
-        import_entries(conn, library_id, args.entries_csv)
+        require_v1(conn, args.db)
+        ensure_columns(conn)
+        if args.library_id is not None:
+            library_id = args.library_id
+            if conn.execute("SELECT 1 FROM library WHERE id = ?", (library_id,)).fetchone() is None:
+                raise SystemExit(f"[ERROR] library_id={library_id} not found in {args.db}")
+        else:
+            library_id = add_library(conn, args.library_name, args.root_path, args.note)
+            print(f"[INFO] library_id={library_id} (if interrupted, rerun with --library-id {library_id})")
+        entries_rows = import_entries(conn, library_id, args.entries_csv, args.batch_size, metrics)
+        archives_rows = 0
         if args.archives_csv:
-            import_archives(conn, library_id, args.archives_csv)
+            archives_rows = import_archives(conn, library_id, args.archives_csv, args.batch_size, metrics)
     finally:
+        metrics.profile_all_end()
         conn.close()
 
+    metrics.counters.update(entries_rows=entries_rows, archives_rows=archives_rows)
+    metrics.print_stages()
+    if args.metrics_out:
+        metrics.dump(args.metrics_out, completed=True, library_id=library_id,
+                     csv=[args.entries_csv, args.archives_csv])
+    if args.profile:
+        metrics.write_profile(args.profile_out)
+
 if __name__ == "__main__":
     main()
@@ -6,241 +6,723 @@ Index files & archives and export to TWO CSV files:
 1) entries CSV  -> 对应 SQLite 的 entries 表
 2) archives CSV -> 对应 SQLite 的 archives 表（压缩包内部成员）
 
-- 递归扫描 root 目录
+或者用 --db 直接流式写入 SQLite（跳过中间 CSV，CSV 变为可选的附带输出）。
+
+- 递归扫描 root 目录（os.scandir，见 walker.py）
 - 普通文件与压缩包（zip/rar/7z/tar/tgz）
-- 使用 7z ("7z l -slt") 列出压缩包内部内容
-- 可选对文件/压缩包本身计算 hash (md5/sha1/sha256...)
+- zip/tar 用 zipfile/tarfile 进程内列出内部内容，rar/7z 及失败时使用 7z ("7z l -slt")，见 archive_list.py
+- 可选 --nested-depth N：压缩包里的压缩包从外层流式读出（内存或临时文件，不解压到磁盘），最多列出 N 层
+- 可选对文件/压缩包本身计算 hash (md5/sha1/sha256...)；--hash crc32,sha256 读一遍文件同时算多个摘要
+- 可选 --hash-mode dedupe：size -> partial hash -> 完整 hash 分阶段计算，只读可能重复的文件
+- 可选 --workers N：walker -> hash/7z worker 池 -> 单 writer 的流水线模式
+- 可选 --io-scheduler：按设备（st_dev）分队列，每块盘独立的并发数，设备内按 inode 排序（见 io_scheduler.py）
+- --root 可重复：一次扫描多个 root（每个 root 在 --db 模式下是一个 library）
+- 可选 --shard K/N：只扫描第 K 个分片（按第一层子目录或路径 hash 拆分），多个进程 / 机器各写一个库，
+  再用 shard.py merge 合并
+- 断点续扫（见 checkpoint.py）：每 --checkpoint-every 个文件记录一次断点，中断后 --resume 继续
+- 运行指标（见 metrics.py）：每隔 --progress-every 秒打印进度 + ETA，--metrics-out 写各阶段耗时 / 最慢文件，
+  --profile STAGE 对某个阶段开启 cProfile
 """
 
 import argparse
 import csv
-import hashlib
-import subprocess
+import json
+import sqlite3
 import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
-ARCHIVE_EXTS = {".zip", ".rar", ".7z", ".tar", ".tgz", ".tar.gz"}
+from checkpoint import (CHECKPOINT_EVERY_DEFAULT, CHECKPOINT_SECONDS, advance, clear_checkpoint,
+                        journal_path, load_checkpoint, make_skip, new_state, save_checkpoint,
+                        scan_key, sync_csv, truncate_csv)
+from hashers import (READ_MODES, configure_io, hash_file, hash_file_digests, primary_algo, resolve_algo,
+                     split_algos)
+from io_scheduler import WINDOW_DEFAULT, device_limits, parse_device_limits, run_device_pipeline
+from metrics import PROGRESS_EVERY_DEFAULT, Metrics, load_expected
+from scan_pipeline import run_pipeline
+from shard import SHARD_BY, make_shard_skip, parse_shard, record_shard
+from stats import open_stats
+from archive_list import (ARCHIVE_EXTS, BACKENDS, NESTED_OPTIONS, archive_ext, configure_nested,
+                          list_archive_entries, manifest_fingerprint)
+from create_db import SCHEMA_SQL, ensure_columns, require_v1
+from import_csv import add_library
+from staged_hash import (
+    finalize_staged_hashes, staged_hashes, db_size_candidates, apply_staged_hashes_db, _read_rows,
+)
+from walker import is_filtered, walk_files, parse_exts
+
+# CSV 列（process_file 返回的 entry_row / archive_rows 也按这个顺序）
+ENTRIES_HEADER = [
+    "root_path", "full_path", "parent_path", "name",
+    "ext", "is_dir", "is_archive",
+    "size_bytes", "mtime", "mtime_iso",
+    "hash_algo", "hash_value", "partial_hash", "manifest_hash",
+    "crc32", "extra_meta",
+]
+
+ARCHIVES_HEADER = [
+    "root_path",
+    "archive_full_path",
+    "member_path",
+    "member_size",
+    "member_mtime",
+    "hash_algo",
+    "hash_value",
+    "member_crc",
+    "member_packed_size",
+]
+
+# --profile 可选的阶段（名字与 metrics 里的阶段相同）
+PROFILE_STAGES = ["walk", "stat", "hash", "archive_list", "write_csv", "write_db",
+                  "staged_hash", "all"]
+# --defer-indexes
+DEFER_INDEXES = ("auto", "always", "never")
 
 # -------------------------------------------------------------
 # 计算文件 hash
 # -------------------------------------------------------------
 def compute_hash(path: Path, method: str = "") -> str:
-    if not method:
-        return ""
-    h = hashlib.new(method)
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    # method 为 hashers.resolve_algo() 的结果（md5 / blake2b-128 / crc32 / xxh3_64 ...）；
+    # 多个算法（crc32,sha256）时返回 primary_algo 的摘要，全部摘要见 hash_file_digests
+    if "," in method:
+        return hash_file_digests(path, method)[primary_algo(method)]
+    return hash_file(path, method)
+
+
+def digest_columns(method: str, digests: dict) -> list:
+    """
+    {algo: hex} -> [hash_algo, hash_value, crc32, extra_meta]（entries_row 的对应列）：
+    primary_algo() 进 hash_algo / hash_value，crc32 单独一列，其余写进 extra_meta 的 "digests"
+    """
+    primary = primary_algo(method)
+    others = {a: digests[a] for a in split_algos(method) if a not in (primary, "crc32") and a in digests}
+    return [
+        primary,
+        digests.get(primary, ""),
+        digests.get("crc32", ""),
+        json.dumps({"digests": others}, sort_keys=True) if others else "",
+    ]
+
+
+def _timed(metrics, name: str, path=None, size: int = 0):
+    return metrics.stage(name, path, size) if metrics is not None else nullcontext()
 
 
 # -------------------------------------------------------------
-# 调用 7z 列出压缩包内容
+# 单个文件处理（worker 中执行：stat / hash / 7z）
 # -------------------------------------------------------------
-def list_archive_entries(archive: Path, sevenzip: str = "7z"):
+def process_file(p: Path, root: Path, hash_method: str, sevenzip: str, st=None,
+                 archive_backend: str = "auto", metrics=None) -> dict:
     """
-    返回 entries 列表，每个 entry 是 dict:
+    处理单个文件（st 为 walker 已经拿到的 stat 结果，避免重复 stat），返回:
       {
-         "entry_path_in_archive": "...",
-         "entry_size_bytes": int,
-         "is_dir": 0/1,
-         "is_encrypted": 0/1,
-         "method": "Deflate" 等
+         "entry_row": [...] 或 None（读取失败）,
+         "archive_rows": [[...], ...],
+         "is_archive": 0/1,
+         "errors": int,
       }
+    只做计算，不写文件，可以在任意线程中调用。
+    archive_rows 是一个压缩包的全部成员行，内存 O(成员数)（见 archive_list 的模块说明）。
+    metrics 不为 None 时记录 stat / hash / archive_list 的耗时（见 metrics.py）。
     """
-    cmd = [sevenzip, "l", "-slt", str(archive)]
+    arc_ext = archive_ext(p.name)
+    suffix = arc_ext or p.suffix.lower()
+    is_archive = 1 if arc_ext else 0
+    result = {"entry_row": None, "archive_rows": [], "is_archive": is_archive, "errors": 0}
 
     try:
-        raw = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
-    except FileNotFoundError:
-        print(f"[ERROR] 7z not found: {sevenzip}", file=sys.stderr)
-        return []
-    except subprocess.CalledProcessError as ex:
-        print(f"[ERROR] 7z list failed: {archive}", file=sys.stderr)
-        print(ex.output.decode("mbcs", "ignore"))
-        return []
-
-    text = raw.decode("mbcs", errors="replace")
-
-    entries = []
-    current = {}
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            if "Path" in current:
-                path_in_arc = current.get("Path", "")
-                size_str = current.get("Size", "0")
-                method = current.get("Method", "")
-                encrypted = current.get("Encrypted", "0")
-                is_dir = 1 if current.get("Attributes", "").startswith("D") else 0
-
-                try:
-                    entry_size = int(size_str)
-                except Exception:
-                    entry_size = 0
-
-                entries.append({
-                    "entry_path_in_archive": path_in_arc,
-                    "entry_size_bytes": entry_size,
-                    "is_dir": is_dir,
-                    "is_encrypted": 1 if encrypted == "+" else 0,
-                    "method": method,
-                })
-
-            current = {}
-            continue
-
-        if "=" in line:
-            k, v = line.split("=", 1)
-            current[k.strip()] = v.strip()
-
-    return entries
+        if st is None:
+            with _timed(metrics, "stat"):
+                st = p.stat()
+        size_bytes = st.st_size
+        if hash_method:
+            with _timed(metrics, "hash", p, size_bytes):
+                # hash_method 可以是逗号分隔的多个算法（crc32,sha256），文件只读一遍
+                digests = hash_file_digests(p, hash_method)
+            if metrics is not None:
+                metrics.count("bytes_hashed", size_bytes)
+        else:
+            digests = {}
+    except Exception as ex:
+        print(f"[ERROR] read file: {p}", file=sys.stderr)
+        print(ex, file=sys.stderr)
+        result["errors"] += 1
+        return result
+
+    # 计算相对路径 / 父目录
+    try:
+        rel = p.relative_to(root)
+        parent_path = str(rel.parent) if str(rel.parent) != "." else "."
+    except ValueError:
+        # 理论上不会发生，防御性处理
+        parent_path = "."
+
+    mtime_ts = st.st_mtime
+    mtime_iso = datetime.fromtimestamp(mtime_ts).isoformat(timespec="seconds")
+    hash_algo, hash_value, crc32, extra_meta = digest_columns(hash_method, digests)
+
+    result["entry_row"] = [
+        str(root),              # root_path
+        str(p),                 # full_path
+        parent_path,            # parent_path (相对 root)
+        p.name,                 # name
+        suffix.lstrip("."),     # ext
+        0,                      # is_dir (目前只写文件)
+        is_archive,             # is_archive
+        size_bytes,             # size_bytes
+        mtime_ts,               # mtime (timestamp，导入为 REAL)
+        mtime_iso,              # mtime_iso
+        hash_algo,              # hash_algo (多个算法时为 primary_algo)
+        hash_value,             # hash_value
+        "",                     # partial_hash (只在 --hash-mode dedupe 时填写)
+        "",                     # manifest_hash (压缩包成员清单指纹，见下)
+        crc32,                  # crc32 (--hash 含 crc32 时，大写十六进制，和 archives.member_crc 相同)
+        extra_meta,             # extra_meta ({"digests": {...}}，其它算法的摘要)
+    ]
+
+    if is_archive:
+        # 列出压缩包内部
+        try:
+            with _timed(metrics, "archive_list", p, size_bytes):
+                entries = list_archive_entries(p, sevenzip, archive_backend)
+            for e in entries:
+                if e["is_dir"]:
+                    # archives 里我们只记录文件，不记录目录
+                    continue
+                result["archive_rows"].append([
+                    str(root),          # root_path
+                    str(p),             # archive_full_path
+                    e["entry_path_in_archive"],  # member_path（内嵌压缩包的成员为 "inner.zip!/x.wav"）
+                    e["entry_size_bytes"],
+                    e.get("entry_mtime") or "",  # member_mtime (timestamp)
+                    "",                 # hash_algo 暂不算
+                    "",                 # hash_value
+                    e.get("crc") or "",  # member_crc (CRC32, 大写十六进制)
+                    e.get("packed_size") if e.get("packed_size") is not None else "",
+                ])
+            # 指纹只用第一层成员：开不开 --nested-depth，同一个压缩包的指纹都相同
+            result["entry_row"][13] = manifest_fingerprint(
+                (e["entry_path_in_archive"], e["entry_size_bytes"], e.get("crc"))
+                for e in entries if not e["is_dir"] and not e.get("nested_depth")
+            )
+        except Exception as ex:
+            print(f"[ERROR] listing archive: {p}", file=sys.stderr)
+            print(ex, file=sys.stderr)
+            result["errors"] += 1
+
+    return result
+
+
+def iter_files(root: Path, exclude=(), file_exts=None, walk_threads: int = 0, skip=None):
+    """
+    产出 (Path, stat_result)。目录本身不产出（v1 阶段我们不把目录写入 entries，避免复杂度）。
+    file_exts 只过滤普通文件，压缩包总是保留。
+    """
+    for path, st in walk_files(root, exclude, _walk_exts(file_exts), walk_threads, skip=skip):
+        yield Path(path), st
+
+
+def _walk_exts(file_exts):
+    return tuple(file_exts) + tuple(ARCHIVE_EXTS) if file_exts else None
+
+
+def is_filtered_path(path, root: Path, exclude=(), file_exts=None) -> bool:
+    """path 会不会被 iter_files(root, exclude, file_exts) 过滤掉；不在 root 下的路径不算"""
+    if not exclude and not file_exts:
+        return False
+    try:
+        rel = Path(path).relative_to(root).as_posix()
+    except ValueError:
+        return False
+    return is_filtered(rel, exclude, _walk_exts(file_exts))
+
+
+def iter_roots(roots, exclude=(), file_exts=None, walk_threads: int = 0, chunk: int = 256,
+               skips=None):
+    """
+    多个 root 轮流各取 chunk 个文件，产出 (Path, stat_result, root)。
+    root 在不同的盘上时，调度器可以同时给每块盘派活；顺序仍然是确定的。
+    skips: {str(root): skip(rel, is_dir)}，--resume 时跳过已完成的部分。
+    """
+    skips = skips or {}
+    walkers = [(root, iter_files(root, exclude, file_exts, walk_threads, skips.get(str(root))))
+               for root in roots]
+    while walkers:
+        alive = []
+        for root, it in walkers:
+            n = 0
+            for p, st in islice(it, chunk):
+                n += 1
+                yield p, st, root
+            if n == chunk:
+                alive.append((root, it))
+        walkers = alive
 
 
 # -------------------------------------------------------------
 # 主扫描逻辑
 # -------------------------------------------------------------
-def scan(root: Path,
+def scan(root,
          entries_out: Path,
          archives_out: Path,
          include_files: bool,
          hash_method: str,
-         sevenzip: str):
-
-    root = root.resolve()
-    entries_out.parent.mkdir(parents=True, exist_ok=True)
-    archives_out.parent.mkdir(parents=True, exist_ok=True)
-
-    # 打开两个 CSV
-    f_entries = entries_out.open("w", newline="", encoding="utf-8-sig")
-    f_archives = archives_out.open("w", newline="", encoding="utf-8-sig")
-
-    entries_writer = csv.writer(f_entries)
-    archives_writer = csv.writer(f_archives)
-
-    # 写表头
-    entries_writer.writerow([
-        "root_path", "full_path", "parent_path", "name",
-        "ext", "is_dir", "is_archive",
-        "size_bytes", "mtime_iso",
-        "hash_algo", "hash_value",
-    ])
-
-    archives_writer.writerow([
-        "root_path",
-        "archive_full_path",
-        "member_path",
-        "member_size",
-        "member_mtime",
-        "hash_algo",
-        "hash_value",
-    ])
-
-    scanned_files = 0
-    scanned_archives = 0
-    errors = 0
-
-    for p in root.rglob("*"):
-        if p.is_dir():
-            # v1 阶段我们不把目录写入 entries，避免复杂度
-            continue
-
-        suffix = p.suffix.lower()
-        is_archive = 1 if suffix in ARCHIVE_EXTS else 0
+         sevenzip: str,
+         workers: int = 0,
+         hash_mode: str = "full",
+         exclude=(),
+         file_exts=None,
+         walk_threads: int = 0,
+         db_path: str = None,
+         library_name: str = None,
+         note: str = None,
+         commit_every: int = 50000,
+         archive_backend: str = "auto",
+         io_scheduler: bool = False,
+         device_limit=None,
+         metrics_out: str = None,
+         progress_every: float = PROGRESS_EVERY_DEFAULT,
+         precount: bool = False,
+         profile: str = None,
+         profile_out: str = "scan_profile.prof",
+         checkpoint_every: int = CHECKPOINT_EVERY_DEFAULT,
+         resume: bool = False,
+         shard=None,
+         shard_by: str = "top",
+         defer_indexes: str = "auto"):
+    """
+    root 可以是一个 Path 或 Path 列表。
+    entries_out / archives_out 为 None 时不写 CSV（此时必须给 db_path）。
+    db_path 不为 None 时，直接把结果流式写入 SQLite（每个 root 新建一个 library）。
+    io_scheduler 为 True 时按设备调度 hash / 7z（device_limit 见 io_scheduler.device_limits）。
+    metrics_out / progress_every / precount / profile 见 metrics.py。
+    checkpoint_every / resume 见 checkpoint.py（checkpoint_every=0 不写断点）。
+    shard = (K, N) 时只扫描第 K 个分片（shard_by: top / hash，见 shard.py）。
+    defer_indexes: auto / always / never，--db 写入期间是否去掉索引、结束后重建（见 db_writer.should_defer_indexes）。
+    """
+    # db_writer 依赖本模块的 ENTRIES_HEADER，这里延迟导入避免循环
+    from db_writer import (insert_entry, insert_archive_rows, bulk_load_begin, bulk_load_end,
+                           should_defer_indexes)
+
+    roots = [Path(r).resolve() for r in (root if isinstance(root, (list, tuple)) else [root])]
+    write_csv = entries_out is not None
+    # 可选算法（xxhash / blake3）未安装时回退，hash_algo 记录实际使用的算法
+    hash_method = resolve_algo(hash_method)
+
+    # dedupe 模式：扫描阶段只记录 size，之后再分阶段补 hash
+    staged = hash_mode == "dedupe" and bool(hash_method)
+    scan_hash_method = "" if staged else hash_method
+    sizes = Counter()
+
+    # ---- 分片：walker 跳过其它分片的文件 / 第一层子目录
+    shard_skips = {str(r): make_shard_skip(shard, shard_by) for r in roots} if shard else None
+
+    # ---- 进度的总量：--precount 先数一遍，否则用上一次同样 roots 的 metrics
+    if precount:
+        t = time.perf_counter()
+        expected_files = expected_bytes = 0
+        for _, st, _ in iter_roots(roots, exclude, file_exts, walk_threads, skips=shard_skips):
+            expected_files += 1
+            expected_bytes += st.st_size
+        print(f"[INFO] precount: {expected_files} files | {expected_bytes} bytes | "
+              f"{time.perf_counter() - t:.1f}s")
+    elif metrics_out:
+        expected_files, expected_bytes = load_expected(metrics_out, roots)
+    else:
+        expected_files = expected_bytes = 0
+    # 不算 hash 时每个文件只读元数据，按文件数估算更准
+    metrics = Metrics(expected_files, expected_bytes if scan_hash_method else 0,
+                      progress_every, profile)
+
+    # ---- 断点 journal（--db 时存在 scan_checkpoint 表里，和数据同一个事务；否则是 CSV 旁边的 JSON）
+    conn = None
+    if db_path:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(db_path)
+        require_v1(conn, db_path)
+        conn.executescript(SCHEMA_SQL)
+        ensure_columns(conn)
+        # 统计表和数据在同一个事务里提交（见 stats.py）
+        stats = open_stats(conn)
+    checkpointing = bool(checkpoint_every) and checkpoint_every > 0
+    journal_file = journal_path(entries_out) if write_csv and conn is None else None
+    key = scan_key(roots)
+    config = {"roots": [str(r) for r in roots], "entries_out": str(entries_out or ""),
+              "archives_out": str(archives_out or ""), "db": str(Path(db_path).resolve()) if db_path else "",
+              "hash": hash_method, "hash_mode": hash_mode, "exclude": list(exclude or ()),
+              "file_exts": list(file_exts or ())}
+    if NESTED_OPTIONS["depth"]:
+        config["nested_depth"] = NESTED_OPTIONS["depth"]
+    if shard:
+        config["shard"] = f"{shard[0]}/{shard[1]} {shard_by}"
+    state = load_checkpoint(conn, journal_file, key) if checkpointing or resume else None
+    if resume:
+        if state is None:
+            raise SystemExit("[ERROR] --resume: no checkpoint found for these roots / outputs")
+        if state["config"] != config:
+            raise SystemExit("[ERROR] --resume: checkpoint was written with different options: "
+                             f"{json.dumps(state['config'], ensure_ascii=False)}")
+        print(f"[RESUME] {state['counters'].get('files', 0)} files / "
+              f"{state['counters'].get('archives', 0)} archives already done"
+              f"{' (scan finished, continue with hashing)' if state['scan_done'] else ''}")
+    else:
+        if state is not None:
+            print("[WARN] an unfinished scan checkpoint exists for these roots, starting over "
+                  "(use --resume to continue it)", file=sys.stderr)
+        state = new_state(roots, config)
+
+    # ---- CSV 输出（dedupe 模式下 entries 先写到临时 CSV）
+    if write_csv:
+        entries_out.parent.mkdir(parents=True, exist_ok=True)
+        archives_out.parent.mkdir(parents=True, exist_ok=True)
+        entries_target = entries_out.with_name(entries_out.name + ".stage1") if staged else entries_out
+
+        if resume:
+            # 去掉断点之后写入的行，再以追加模式打开
+            truncate_csv(entries_target, state["entries_offset"])
+            truncate_csv(archives_out, state["archives_offset"])
+            f_entries = entries_target.open("a", newline="", encoding="utf-8-sig")
+            f_archives = archives_out.open("a", newline="", encoding="utf-8-sig")
+        else:
+            f_entries = entries_target.open("w", newline="", encoding="utf-8-sig")
+            f_archives = archives_out.open("w", newline="", encoding="utf-8-sig")
 
-        try:
-            st = p.stat()
-            size_bytes = st.st_size
-            mtime_ts = st.st_mtime
-            hash_value = compute_hash(p, hash_method)
-        except Exception as ex:
-            print(f"[ERROR] read file: {p}", file=sys.stderr)
-            print(ex, file=sys.stderr)
-            errors += 1
-            continue
+        entries_writer = csv.writer(f_entries)
+        archives_writer = csv.writer(f_archives)
 
-        # 计算相对路径 / 父目录
-        try:
-            rel = p.relative_to(root)
-            parent_path = str(rel.parent) if str(rel.parent) != "." else "."
-        except ValueError:
-            # 理论上不会发生，防御性处理
-            parent_path = "."
-
-        mtime_ts = st.st_mtime
-        mtime_iso = datetime.fromtimestamp(mtime_ts).isoformat(timespec="seconds")
-
-        entries_writer.writerow([
-            str(root),              # root_path
-            str(p),                 # full_path
-            parent_path,            # parent_path (相对 root)
-            p.name,                 # name
-            suffix.lstrip("."),     # ext
-            0,                      # is_dir (目前只写文件)
-            is_archive,             # is_archive
-            size_bytes,             # size_bytes
-            # mtime_ts,               # mtime (timestamp)
-            mtime_iso,              # mtime_iso
-            hash_method or "",      # hash_algo
-            hash_value or "",       # hash_value
-        ])
-
-        if is_archive:
-            scanned_archives += 1
-            # 列出压缩包内部
-            try:
-                entries = list_archive_entries(p, sevenzip)
-                for e in entries:
-                    if e["is_dir"]:
-                        # archives 里我们只记录文件，不记录目录
-                        continue
-                    archives_writer.writerow([
-                        str(root),          # root_path
-                        str(p),             # archive_full_path
-                        e["entry_path_in_archive"],  # member_path
-                        e["entry_size_bytes"],
-                        "",                 # member_mtime 暂不填
-                        "",                 # hash_algo 暂不算
-                        "",                 # hash_value
-                    ])
-            except Exception as ex:
-                print(f"[ERROR] listing archive: {p}", file=sys.stderr)
-                print(ex, file=sys.stderr)
-                errors += 1
+        if not resume:
+            # 写表头
+            entries_writer.writerow(ENTRIES_HEADER)
+            archives_writer.writerow(ARCHIVES_HEADER)
+
+    # ---- SQLite 输出
+    if conn is not None:
+        if resume:
+            library_ids = state["library_ids"]
+        else:
+            library_ids = {}
+            for r in roots:
+                if len(roots) == 1:
+                    name = library_name or r.name
+                else:
+                    name = f"{library_name} - {r.name}" if library_name else r.name
+                library_ids[str(r)] = add_library(conn, name, str(r), note)
+            state["library_ids"] = library_ids
+            if shard:
+                record_shard(conn, library_ids.values(), shard, shard_by)
+        # auto：空库 / 写入量相对已有数据很大时才去掉索引（预计文件数来自 --precount 或上一次的 metrics）
+        defer = defer_indexes == "always" or (defer_indexes == "auto"
+                                              and should_defer_indexes(conn, expected_files))
+        # 上次中断时已经删掉的索引不会再出现在 sqlite_master 里，从 journal 里补回来
+        dropped_indexes = state["dropped_indexes"] + [
+            sql for sql in bulk_load_begin(conn, defer_indexes=defer) if sql not in state["dropped_indexes"]]
+        state["dropped_indexes"] = dropped_indexes
+        if checkpointing:
+            # 断点要在掉电后也有效：WAL + NORMAL 保证已提交的事务（连同 journal）一致
+            conn.execute("PRAGMA synchronous = NORMAL")
+        cur = conn.cursor()
+
+    counters = {"files": 0, "archives": 0, "errors": 0, "pending": 0}
+    counters.update(state["counters"])
+    if resume and staged:
+        # 分阶段 hash 需要所有文件的 size 计数，从已经写出的结果里重建
+        if write_csv:
+            rows = _read_rows(entries_target)
+            i_size = next(rows).index("size_bytes")
+            sizes.update(int(row[i_size]) for row in rows)
+        else:
+            for library_id in library_ids.values():
+                sizes.update(dict(conn.execute(
+                    "SELECT size_bytes, COUNT(*) FROM entries WHERE library_id = ? GROUP BY size_bytes",
+                    (library_id,))))
+    last_checkpoint = {"items": 0, "time": time.perf_counter()}
+
+    def checkpoint():
+        """CSV fsync -> journal（--db 时 journal 和数据一起提交）"""
+        with metrics.stage("checkpoint"):
+            if write_csv:
+                state["entries_offset"] = sync_csv(f_entries)
+                state["archives_offset"] = sync_csv(f_archives)
+            state["counters"] = {k: v for k, v in counters.items() if k != "pending"}
+            if conn is not None:
+                stats.flush(conn)
+            save_checkpoint(conn, journal_file, key, state)
+        counters["pending"] = 0
+        last_checkpoint["items"] = 0
+        last_checkpoint["time"] = time.perf_counter()
+
+    def work(item) -> dict:
+        p, st, r = item
+        res = process_file(p, r, scan_hash_method, sevenzip, st, archive_backend, metrics)
+        res["root"] = str(r)
+        res["rel"] = p.relative_to(r).as_posix()
+        return res
+
+    # 唯一的 writer：只有它会碰 CSV / DB
+    def write(res: dict):
+        counters["errors"] += res["errors"]
+        if res["entry_row"] is not None:
+            write_row(res)
+        if checkpointing:
+            advance(state["roots"][res["root"]], res["rel"])
+            last_checkpoint["items"] += 1
+            if (counters["pending"] >= commit_every
+                    or last_checkpoint["items"] >= checkpoint_every
+                    or time.perf_counter() - last_checkpoint["time"] >= CHECKPOINT_SECONDS):
+                checkpoint()
+        elif conn is not None and counters["pending"] >= commit_every:
+            with metrics.stage("commit"):
+                stats.commit(conn)
+            counters["pending"] = 0
+
+    def write_row(res: dict):
+        size_bytes = res["entry_row"][7]
+        sizes[size_bytes] += 1
+        if write_csv:
+            with metrics.stage("write_csv"):
+                entries_writer.writerow(res["entry_row"])
+                if res["is_archive"]:
+                    archives_writer.writerows(res["archive_rows"])
+        if conn is not None:
+            with metrics.stage("write_db"):
+                library_id = library_ids[res["entry_row"][0]]
+                entry_id = insert_entry(cur, library_id, res)
+                row = res["entry_row"]
+                stats.add(library_id, row[2], row[4], row[7], row[11], row[6])
+                counters["pending"] += 1
+                if res["is_archive"]:
+                    counters["pending"] += insert_archive_rows(cur, library_id, entry_id, res)
+        if res["is_archive"]:
+            counters["archives"] += 1
+            metrics.count("archive_members", len(res["archive_rows"]))
         else:
-            scanned_files += 1
+            counters["files"] += 1
+        metrics.tick(1, size_bytes)
+
+    if state["scan_done"]:
+        files = []
+    else:
+        if resume:
+            skips = {str(r): make_skip(state["roots"][str(r)]) for r in roots}
+            if shard:
+                skips = {str(r): make_shard_skip(shard, shard_by, skips[str(r)]) for r in roots}
+        else:
+            skips = shard_skips
+        files = metrics.timed_iter("walk", iter_roots(roots, exclude, file_exts, walk_threads,
+                                                      skips=skips))
 
-    f_entries.close()
-    f_archives.close()
+    def on_device(dev, kind, n):
+        print(f"[INFO] device {dev}: {kind}, {n} workers")
+
+    metrics.profile_all_begin()
+    try:
+        if io_scheduler:
+            # walker -> 每个设备各自的 worker 组 -> 单 writer
+            run_device_pipeline(files, work, write, device_limits(device_limit),
+                                WINDOW_DEFAULT, on_device)
+        elif workers and workers > 0:
+            # walker -> hash/7z workers -> 单 writer
+            run_pipeline(files, work, write, workers)
+        else:
+            for item in files:
+                write(work(item))
+        if checkpointing and not state["scan_done"]:
+            state["scan_done"] = True
+            checkpoint()
+    except BaseException:
+        if checkpointing and conn is not None:
+            # 断点之后的行不提交，--resume 时会重新处理
+            conn.rollback()
+            stats.clear()
+        raise
+    finally:
+        if write_csv:
+            f_entries.close()
+            f_archives.close()
+        if conn is not None:
+            # 无论成功与否都把索引建回来（bulk_load_end 会提交已写入的行，统计跟着一起提交）
+            stats.flush(conn)
+            with metrics.stage("rebuild_index"):
+                bulk_load_end(conn, dropped_indexes)
+    if metrics.progress_every:
+        metrics.print_progress()
+
+    if staged:
+        with metrics.stage("staged_hash"):
+            if write_csv:
+                partials, fulls, st = finalize_staged_hashes(
+                    entries_target, entries_out, sizes, hash_method, workers)
+                entries_target.unlink()
+            else:
+                candidates = []
+                for library_id in library_ids.values():
+                    candidates.extend(db_size_candidates(conn, library_id, sizes))
+                partials, fulls, st = staged_hashes(candidates, hash_method, workers)
+        if conn is not None:
+            with metrics.stage("write_db"):
+                # 只有算出完整 hash 的行在统计里有变化（进入 hash 分组）
+                for path in fulls:
+                    stats.add_query(conn, "full_path = ?", (path,), -1)
+                for library_id in library_ids.values():
+                    apply_staged_hashes_db(conn, library_id, partials, fulls, hash_method)
+                for path in fulls:
+                    stats.add_query(conn, "full_path = ?", (path,), 1)
+                stats.commit(conn)
+        metrics.count("bytes_hashed", st["bytes_read"])
+        print(f"[HASH] files: {sum(sizes.values())} | size collisions: {st['size_candidates']} | "
+              f"partial hashed: {st['partial_hashed']} | full hashed: {st['full_hashed']} | "
+              f"bytes read: {st['bytes_read']} | errors: {st['errors']}")
+        counters["errors"] += st["errors"]
+
+    metrics.profile_all_end()
+
+    if checkpointing or resume:
+        clear_checkpoint(conn, journal_file, key)
+    if conn is not None:
+        conn.close()
 
     print("")
-    print(f"[DONE] Scanned files: {scanned_files} | archives: {scanned_archives} | errors: {errors}")
-    print(f"[INFO] Entries CSV : {entries_out}")
-    print(f"[INFO] Archives CSV: {archives_out}")
+    metrics.print_stages()
+    print(f"[DONE] Scanned files: {counters['files']} | archives: {counters['archives']} | errors: {counters['errors']}")
+    if write_csv:
+        print(f"[INFO] Entries CSV : {entries_out}")
+        print(f"[INFO] Archives CSV: {archives_out}")
+    if db_path:
+        ids = ", ".join(str(i) for i in library_ids.values())
+        print(f"[INFO] SQLite DB   : {db_path} (library_id={ids})")
+    metrics.counters.update(files=counters["files"], archives=counters["archives"],
+                            errors=counters["errors"])
+    if metrics_out:
+        metrics.dump(metrics_out, completed=True, roots=[str(r) for r in roots],
+                     config={"hash": hash_method, "hash_mode": hash_mode, "workers": workers,
+                             "io_scheduler": io_scheduler, "archive_backend": archive_backend,
+                             "nested_depth": NESTED_OPTIONS["depth"]})
+    if profile:
+        metrics.write_profile(profile_out)
 
 
 # -------------------------------------------------------------
 # CLI
 # -------------------------------------------------------------
 def main():
-    ap = argparse.ArgumentParser(description="Index files & archives to entries/archives CSV")
-    ap.add_argument("--root", required=True, help="Root folder to scan")
-    ap.add_argument("--entries-out", required=True, help="Output CSV for entries table")
-    ap.add_argument("--archives-out", required=True, help="Output CSV for archives table")
+    ap = argparse.ArgumentParser(description="Index files & archives to entries/archives CSV and/or SQLite")
+    ap.add_argument("--root", action="append", required=True,
+                    help="Root folder to scan (repeatable: several roots / disks in one run)")
+    ap.add_argument("--entries-out", help="Output CSV for entries table")
+    ap.add_argument("--archives-out", help="Output CSV for archives table")
+    ap.add_argument("--db", help="直接写入 SQLite（可与 CSV 同时使用，CSV 变为可选）")
+    ap.add_argument("--library-name", help="--db 模式下新建 library 的名字（默认 root 文件夹名）")
+    ap.add_argument("--note", help="--db 模式下 library.note")
     ap.add_argument("--include-files", action="store_true",
                     help="(保留参数以兼容旧用法，目前总是扫描普通文件，可忽略)")
-    ap.add_argument("--hash", default="", help="Hash method: md5/sha1/sha256")
+    ap.add_argument("--file-exts", default="",
+                    help='只扫描这些后缀的普通文件（压缩包总是扫描），例如 ".mp3,.wav"')
+    ap.add_argument("--exclude", action="append", default=[],
+                    help="跳过匹配的文件/目录（fnmatch，匹配名字或相对路径），可重复")
+    ap.add_argument("--walk-threads", type=int, default=0,
+                    help="并行遍历目录的线程数（网络盘 / 云盘挂载时有用）")
+    ap.add_argument("--hash", default="",
+                    help="Hash method: md5/sha1/sha256/blake2b-128/crc32/xxh3_64/blake3 ... "
+                         "(python src/file_indexer/hashers.py list / bench-hash); "
+                         "comma list = one read, several digests, e.g. crc32,sha256")
+    ap.add_argument("--read-block-kb", type=int, default=1024,
+                    help="hash 读文件的块大小 KiB（默认 1024）")
+    ap.add_argument("--read-mode", choices=READ_MODES, default="readinto",
+                    help="readinto: 复用缓冲区（默认）；mmap: 大文件用 mmap；read: 旧实现")
+    ap.add_argument("--keep-cache", action="store_true",
+                    help="不调用 posix_fadvise(DONTNEED)，读过的文件留在页缓存里")
+    ap.add_argument("--hash-mode", choices=["full", "dedupe"], default="full",
+                    help="full: 每个文件都算完整 hash；"
+                         "dedupe: size 冲突才算 partial hash，partial 冲突才算完整 hash")
     ap.add_argument("--sevenzip", default="7z", help="Path to 7z.exe")
+    ap.add_argument("--archive-backend", choices=BACKENDS, default="auto",
+                    help="auto: zip/tar 用 zipfile/tarfile，其它及失败时用 7z；native: 只用 zipfile/tarfile；7z: 总是 7z")
+    ap.add_argument("--nested-depth", type=int, default=0,
+                    help="列出压缩包里的压缩包，最多 N 层（0 = 不展开，默认）；成员路径为 inner.zip!/x.wav")
+    ap.add_argument("--nested-memory-mb", type=float, default=NESTED_OPTIONS["memory_bytes"] / 1024 ** 2,
+                    help="不超过这个大小的内层 zip/tar 在内存里读取（默认 64），更大的写临时文件")
+    ap.add_argument("--nested-spill-mb", type=float, default=NESTED_OPTIONS["spill_bytes"] / 1024 ** 2,
+                    help="超过这个大小的内层压缩包不展开（默认 4096）")
+    ap.add_argument("--nested-tmp", help="内层压缩包临时文件的目录（默认系统临时目录）")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="并行 hash/7z worker 线程数（0 = 单线程，输出顺序与并行模式一致）")
+    ap.add_argument("--io-scheduler", action="store_true",
+                    help="按设备调度 hash/7z：每块盘独立并发数（机械盘少、SSD / 网络盘多），设备内按 inode 顺序")
+    ap.add_argument("--device-limit", action="append", default=[],
+                    help='设备并发数：PATH=N（按该路径所在设备）或 hdd/ssd/remote/unknown=N，可重复；隐含 --io-scheduler')
+    ap.add_argument("--progress-every", type=float, default=PROGRESS_EVERY_DEFAULT,
+                    help=f"Print [PROGRESS] every N seconds, 0 = off (default: {PROGRESS_EVERY_DEFAULT:g})")
+    ap.add_argument("--precount", action="store_true",
+                    help="先遍历一遍统计文件数 / 字节数，用于进度百分比和 ETA")
+    ap.add_argument("--metrics-out",
+                    help="结束时写各阶段耗时 / 计数 / 最慢文件的 JSON；下次同样 roots 的运行用它估算 ETA")
+    ap.add_argument("--profile", choices=PROFILE_STAGES,
+                    help="对这个阶段开启 cProfile（all = 整个运行的调用方线程）")
+    ap.add_argument("--profile-out", default="scan_profile.prof",
+                    help="cProfile 结果文件（默认 scan_profile.prof，可用 snakeviz / pstats 查看）")
+    ap.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY_DEFAULT,
+                    help=f"Write a resume checkpoint every N files (default: {CHECKPOINT_EVERY_DEFAULT}, 0 = off)")
+    ap.add_argument("--resume", action="store_true",
+                    help="从上次中断的断点继续（同样的 --root / 输出 / 选项），CSV 以追加模式打开")
+    ap.add_argument("--shard", help="只扫描第 K 个分片（K/N，例如 2/4），每个分片写自己的 --db，之后用 shard.py merge 合并")
+    ap.add_argument("--shard-by", choices=SHARD_BY, default="top",
+                    help="top: 按 root 下第一层的名字拆分（默认，整个子目录属于一个分片）；hash: 按每个文件的路径拆分")
+    ap.add_argument("--defer-indexes", choices=DEFER_INDEXES, default="auto",
+                    help="--db 写入期间去掉索引、结束后重建：auto（默认，库为空或这次写入量不小于已有行数一半时，"
+                         "行数按 --precount / 上次的 metrics 估计）/ always / never")
     args = ap.parse_args()
+    if bool(args.entries_out) != bool(args.archives_out):
+        ap.error("--entries-out and --archives-out must be given together")
+    if not args.entries_out and not args.db:
+        ap.error("need --entries-out/--archives-out and/or --db")
+    if args.hash_mode == "dedupe" and not args.hash:
+        ap.error("--hash-mode dedupe requires --hash (e.g. --hash md5)")
+    if args.hash_mode == "dedupe" and args.shard:
+        # 每个分片只看到自己的 size，跨分片的重复找不到
+        ap.error("--hash-mode dedupe cannot be used with --shard, use --hash-mode full")
+    try:
+        algos = split_algos(resolve_algo(args.hash))
+        if args.hash_mode == "dedupe" and len(algos) > 1:
+            ap.error("--hash-mode dedupe takes a single hash method")
+        shard = parse_shard(args.shard)
+        parse_device_limits(args.device_limit)
+        configure_nested(args.nested_depth, args.nested_memory_mb, args.nested_spill_mb, args.nested_tmp)
+    except ValueError as ex:
+        ap.error(str(ex))
+    configure_io(args.read_block_kb * 1024, args.read_mode, not args.keep_cache)
 
     scan(
-        Path(args.root),
-        Path(args.entries_out),
-        Path(args.archives_out),
+        [Path(r) for r in args.root],
+        Path(args.entries_out) if args.entries_out else None,
+        Path(args.archives_out) if args.archives_out else None,
         args.include_files,
         args.hash,
         args.sevenzip,
+        workers=args.workers,
+        hash_mode=args.hash_mode,
+        exclude=args.exclude,
+        file_exts=parse_exts(args.file_exts),
+        walk_threads=args.walk_threads,
+        db_path=args.db,
+        library_name=args.library_name,
+        note=args.note,
+        archive_backend=args.archive_backend,
+        io_scheduler=args.io_scheduler or bool(args.device_limit),
+        device_limit=args.device_limit,
+        metrics_out=args.metrics_out,
+        progress_every=args.progress_every,
+        precount=args.precount,
+        profile=args.profile,
+        profile_out=args.profile_out,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume,
+        shard=shard,
+        shard_by=args.shard_by,
+        defer_indexes=args.defer_indexes,
     )
 
 
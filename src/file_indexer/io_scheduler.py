@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+按设备（st_dev）调度的流水线：每块盘各自的并发数，多块盘同时满速。
+
+    walker 线程 -> 按窗口分组（设备 -> inode 排序）-> 每个设备 N 个 worker -> writer（调用方线程，按 seq 写出）
+
+- 每个设备一个队列和一组 worker 线程，并发数由 device_limits() 决定：
+    机械盘（/sys/block/*/queue/rotational = 1）默认 2，避免磁头来回跳
+    SSD / NVMe 默认 8，FUSE / 网络盘（nfs、cifs、rclone ...）默认 16（延迟高，靠并发）
+    其它平台识别不了的设备默认 4
+  也可以按挂载点 / 路径指定：--device-limit "E:\\=1" --device-limit hdd=1
+- 每 window 个条目为一批，批内按设备分组、设备内按 inode 排序（近似磁盘上的物理顺序）
+- writer 仍按输入顺序写出，输出与单线程完全一致；在途条目最多 2 * window 个
+
+用法见 index_archives_v2.py --io-scheduler / --device-limit。
+"""
+
+import os
+import queue
+import sys
+import threading
+
+from scan_pipeline import _FAILED, _STOP, _WALK_DONE
+
+WINDOW_DEFAULT = 4096
+
+DEFAULT_KIND_LIMITS = {
+    "hdd": 2,
+    "ssd": 8,
+    "remote": 16,
+    "unknown": 4,
+}
+
+# mountinfo 里这些文件系统按「远程 / 高延迟」处理
+REMOTE_FSTYPES = ("fuse", "nfs", "cifs", "smb", "sshfs", "9p", "davfs", "afs", "ceph", "glusterfs")
+
+
+# -------------------------------------------------------------
+# 设备识别
+# -------------------------------------------------------------
+def _mount_fstypes() -> dict:
+    """Linux: 'major:minor' -> fstype（来自 /proc/self/mountinfo）"""
+    result = {}
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                left, _, right = line.partition(" - ")
+                parts = left.split()
+                if len(parts) < 3 or not right:
+                    continue
+                result.setdefault(parts[2], right.split()[0])
+    except OSError:
+        pass
+    return result
+
+
+def _rotational(major: int, minor: int):
+    """读 /sys/dev/block/M:m/queue/rotational（分区取所在磁盘），读不到返回 None"""
+    base = os.path.realpath(f"/sys/dev/block/{major}:{minor}")
+    for d in (base, os.path.dirname(base)):
+        try:
+            with open(os.path.join(d, "queue", "rotational"), encoding="ascii") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def device_kind(dev: int, fstypes: dict = None) -> str:
+    """返回 'hdd' / 'ssd' / 'remote' / 'unknown'"""
+    if not sys.platform.startswith("linux"):
+        return "unknown"
+    major, minor = os.major(dev), os.minor(dev)
+    fstype = (fstypes if fstypes is not None else _mount_fstypes()).get(f"{major}:{minor}", "")
+    if fstype.startswith(REMOTE_FSTYPES):
+        return "remote"
+    if major == 0:
+        # tmpfs / overlay 等没有块设备的文件系统
+        return "ssd" if fstype in ("tmpfs", "ramfs", "overlay") else "unknown"
+    rot = _rotational(major, minor)
+    if rot is None:
+        return "unknown"
+    return "hdd" if rot else "ssd"
+
+
+def parse_device_limits(specs) -> tuple:
+    """
+    ["hdd=1", "E:\\=2", "/mnt/cloud=32"] -> (kind_limits, path_limits)
+    kind_limits: {"hdd": 1, ...}；path_limits: {"E:\\": 2, ...}
+    """
+    kinds = dict(DEFAULT_KIND_LIMITS)
+    paths = {}
+    for spec in specs or ():
+        key, sep, value = spec.rpartition("=")
+        if not sep or not key or not value.isdigit() or int(value) < 1:
+            raise ValueError(f"invalid --device-limit {spec!r}, expected PATH=N or hdd/ssd/remote/unknown=N")
+        if key.lower() in kinds:
+            kinds[key.lower()] = int(value)
+        else:
+            paths[key] = int(value)
+    return kinds, paths
+
+
+def device_limits(specs=None):
+    """
+    返回 limit_for(dev) -> (kind, 并发数)。
+    路径规则按 os.stat(path).st_dev 匹配，优先于按类型的默认值。
+    """
+    kinds, paths = parse_device_limits(specs)
+    by_dev = {}
+    for path, n in paths.items():
+        try:
+            by_dev[os.stat(path).st_dev] = n
+        except OSError as ex:
+            print(f"[WARN] --device-limit {path}: {ex}", file=sys.stderr)
+    fstypes = _mount_fstypes() if sys.platform.startswith("linux") else {}
+    cache = {}
+
+    def limit_for(dev):
+        if dev not in cache:
+            kind = device_kind(dev, fstypes)
+            cache[dev] = (kind, by_dev.get(dev, kinds[kind]))
+        return cache[dev]
+    return limit_for
+
+
+# -------------------------------------------------------------
+# 调度
+# -------------------------------------------------------------
+def _locality_key(item):
+    # item = (Path, stat_result, ...)：设备内按 inode，其次按路径
+    st = item[1]
+    return (st.st_ino, str(item[0]))
+
+
+def run_device_pipeline(items, work_fn, write_fn, limit_for, window: int = WINDOW_DEFAULT,
+                        on_device=None):
+    """
+    items     : 可迭代对象，每项为 (Path, stat_result, ...)，在独立线程中遍历
+    work_fn   : work_fn(item) -> result，在对应设备的 worker 线程中执行
+    write_fn  : write_fn(result)，只在调用方线程中按输入顺序执行
+    limit_for : limit_for(st_dev) -> (kind, 并发数)，见 device_limits()
+    window    : 每批条目数（批内按设备分组、按 inode 排序）
+    on_device : 发现新设备时回调 on_device(dev, kind, n)
+
+    返回处理的条目总数。
+    """
+    window = max(1, int(window))
+    max_in_flight = window * 2
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    result_q = queue.Queue()
+    stop_event = threading.Event()
+
+    dev_queues = {}   # dev -> (queue, worker 数)
+    threads = []
+
+    def worker(q):
+        while True:
+            seq, item = q.get()
+            if item is _STOP:
+                return
+            if stop_event.is_set():
+                continue
+            try:
+                result_q.put((seq, work_fn(item)))
+            except BaseException as ex:
+                result_q.put((_FAILED, ex))
+
+    def device_queue(dev):
+        if dev not in dev_queues:
+            kind, n = limit_for(dev)
+            q = queue.Queue()
+            dev_queues[dev] = (q, n)
+            for i in range(n):
+                t = threading.Thread(target=worker, args=(q,), name=f"io-{dev}-{i}", daemon=True)
+                t.start()
+                threads.append(t)
+            if on_device:
+                on_device(dev, kind, n)
+        return dev_queues[dev][0]
+
+    def dispatch(batch):
+        groups = {}
+        for seq, item in batch:
+            groups.setdefault(item[1].st_dev, []).append((seq, item))
+        for dev, group in groups.items():
+            group.sort(key=lambda x: _locality_key(x[1]))
+            q = device_queue(dev)
+            for entry in group:
+                q.put(entry)
+
+    def walker():
+        count = 0
+        batch = []
+        try:
+            for item in items:
+                # 背压：writer 没写完之前不再继续产出
+                while not in_flight.acquire(timeout=0.5):
+                    if stop_event.is_set():
+                        return
+                if stop_event.is_set():
+                    return
+                batch.append((count, item))
+                count += 1
+                if len(batch) >= window:
+                    dispatch(batch)
+                    batch = []
+            if batch:
+                dispatch(batch)
+        except BaseException as ex:  # 交给 writer 线程抛出
+            result_q.put((_FAILED, ex))
+            return
+        finally:
+            for q, n in dev_queues.values():
+                for _ in range(n):
+                    q.put((None, _STOP))
+        result_q.put((_WALK_DONE, count))
+
+    walk_thread = threading.Thread(target=walker, name="io-walker", daemon=True)
+    walk_thread.start()
+
+    total = None
+    next_seq = 0
+    pending = {}
+    try:
+        while total is None or next_seq < total:
+            seq, res = result_q.get()
+            if seq is _WALK_DONE:
+                total = res
+                continue
+            if seq is _FAILED:
+                raise res
+
+            pending[seq] = res
+            while next_seq in pending:
+                write_fn(pending.pop(next_seq))
+                next_seq += 1
+                in_flight.release()
+    finally:
+        stop_event.set()
+        for _ in range(max_in_flight):
+            try:
+                in_flight.release()
+            except ValueError:
+                break
+
+    walk_thread.join(timeout=1.0)
+    for t in threads:
+        t.join(timeout=1.0)
+
+    return next_seq
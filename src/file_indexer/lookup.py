@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""
+入库前查重：新下载的文件是不是已经在某个 library 里（包括压缩包里的成员）。
+
+启动时从库里读出一个紧凑的内存索引，之后每个文件：
+  1. stat 拿 size；库里没有这个 size -> new（不读文件）
+  2. size 对上了才读文件，一遍算出 --hash 和 crc32（hashers.hash_file_digests）
+  3. (size, hash 前 8 字节) 在索引里 -> 回库确认：exists，给出已有的文件 / 压缩包成员
+     (size, CRC32) 和还没有内容 hash 的压缩包成员相同 -> crc_match（只比了 CRC，可以先跑 member_hash.py）
+     库里同样 size 的文件没有 hash（--hash-mode dedupe 扫描时 size 唯一的文件）-> size_only（无法确认）
+     都不是 -> new
+  内存里只有 hash 前缀，第 3 步回库确认时排除前缀相同的误报和已经删除的文件。
+
+内存索引（5000 万行约 0.5 ~ 1 GB）：
+  sizes                    所有出现过的 size，升序（array 'q'）
+  hash_starts / hash_keys  每个 size 下 hash 前 8 字节的有序数组（CSR 布局，array 'Q'），每行 8 字节
+  crc_starts / crc_keys    还没有 --hash 内容 hash 的压缩包成员 / 文件的 CRC32（array 'I'），每行 4 字节
+  no_hash                  这个 size 下有没有缺少 hash 的文件（array 'b'）
+数组按 SQLite 索引的顺序（ORDER BY size_bytes, hash_value）流式填充，不在 Python 里排序。
+
+增量刷新（refresh，--stdin 模式下每 --refresh-every 秒一次）：只读 id 大于上次的 entries / archives 新行，
+放进一个小 dict，新行超过 REBUILD_RATIO 时整体重建。reindex / watch 原地修改的行在下一次重建时才进索引。
+
+用法：
+python src/file_indexer/lookup.py --db data/workspace/archive_work.db --hash md5 "D:\\Downloads\\new_pack"
+python src/file_indexer/lookup.py --db ... --hash md5 "D:\\Downloads" --workers 8 --out "D:\\lookup.csv" --only new
+downloader_script | python src/file_indexer/lookup.py --db ... --hash md5 --stdin --refresh-every 60
+
+在 Python 里使用：
+    from lookup import LookupIndex
+    index = LookupIndex("data/workspace/archive_work.db", "md5")
+    index.lookup("D:\\Downloads\\track01.wav")    # {"status": "exists", "matches": [...], ...}
+"""
+
+import argparse
+import csv
+import heapq
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import accumulate
+from pathlib import Path
+
+from archive_list import NEST_SEP
+from hashers import hash_file_digests, resolve_algo
+from scan_pipeline import run_pipeline
+from walker import parse_exts, walk_files
+
+STATUSES = ("exists", "crc_match", "size_only", "new", "error")
+LOOKUP_HEADER = ["path", "size_bytes", "status", "hash_algo", "hash_value", "crc32", "matches"]
+MAX_MATCHES_DEFAULT = 5
+REBUILD_RATIO = 0.05      # 增量的新行超过索引行数的 5% 时整体重建
+REBUILD_MIN = 100000
+
+
+class _Unsorted(Exception):
+    """hash 的大小写不统一时 ORDER BY hash_value 不等于按数值排序"""
+
+
+def _key(value, digits: int = 16):
+    """hex 文本的前 digits 位 -> int；不是 hex 时返回 None"""
+    try:
+        return int(value[:digits], 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def _csr(sizes, rows, typecode: str):
+    """
+    rows: 按 (size, key) 升序的迭代器 -> (starts, keys)；
+    size 为 sizes[i] 的 key 是 keys[starts[i]:starts[i + 1]]（升序、去重）。
+    """
+    counts = array("Q", bytes(8 * (len(sizes) + 1)))
+    keys = array(typecode)
+    i, n, last = 0, len(sizes), None
+    for row in rows:
+        if row[1] is None or row == last:
+            continue
+        if last is not None and row < last:
+            raise _Unsorted()
+        last = row
+        size = row[0]
+        while i < n and sizes[i] < size:
+            i += 1
+        if i == n or sizes[i] != size:
+            continue
+        keys.append(row[1])
+        counts[i + 1] += 1
+    return array("Q", accumulate(counts)), keys
+
+
+def _in_range(keys, starts, i: int, key) -> bool:
+    lo, hi = starts[i], starts[i + 1]
+    j = bisect_left(keys, key, lo, hi)
+    return j < hi and keys[j] == key
+
+
+# -------------------------------------------------------------
+# 内存索引
+# -------------------------------------------------------------
+class LookupIndex:
+    """见模块说明。probe() 只用内存（可以在多个线程里调用），confirm() 回库查询（只在一个线程里调用）"""
+
+    def __init__(self, db_path: str, hash_method: str, max_matches: int = MAX_MATCHES_DEFAULT):
+        self.algo = resolve_algo(hash_method)
+        if not self.algo or "," in self.algo:
+            raise ValueError("lookup needs a single hash method, the one used for the scan")
+        self.max_matches = max_matches
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        cols = {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        # 普通文件的 CRC：entries.crc32（--hash crc32,...），更早的库只有 hash_algo = 'crc32' 的行
+        self.entry_crc = "CASE WHEN hash_algo = 'crc32' THEN hash_value END"
+        if "crc32" in cols:
+            self.entry_crc = f"COALESCE(crc32, {self.entry_crc})"
+        self.load()
+
+    # ---- 读取
+    def _max_ids(self):
+        return (self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0],
+                self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM archives").fetchone()[0])
+
+    def _hash_rows(self, order: str):
+        e = self.conn.execute(f"""
+            SELECT COALESCE(size_bytes, 0), hash_value FROM entries
+            WHERE is_dir = 0 AND is_deleted = 0 AND hash_algo = ? AND hash_value <> '' AND id <= ?
+            ORDER BY size_bytes, {order}
+        """, (self.algo, self.last_ids[0]))
+        a = self.conn.cursor().execute(f"""
+            SELECT COALESCE(member_size, 0), hash_value FROM archives
+            WHERE hash_algo = ? AND hash_value <> '' AND id <= ?
+            ORDER BY member_size, {order}
+        """, (self.algo, self.last_ids[1]))
+        return heapq.merge(((s, _key(h)) for s, h in e), ((s, _key(h)) for s, h in a))
+
+    def _crc_rows(self, order: str):
+        """还没有 --hash 内容 hash 的成员 / 文件的 CRC"""
+        e = self.conn.execute(f"""
+            SELECT COALESCE(size_bytes, 0), {self.entry_crc} AS crc FROM entries
+            WHERE is_dir = 0 AND is_deleted = 0 AND id <= ?
+              AND (hash_value IS NULL OR hash_value = '' OR hash_algo IS NOT ?) AND crc IS NOT NULL
+            ORDER BY 1, {order.replace("hash_value", "crc")}
+        """, (self.last_ids[0], self.algo))
+        a = self.conn.cursor().execute(f"""
+            SELECT COALESCE(member_size, 0), member_crc FROM archives
+            WHERE member_crc <> '' AND id <= ?
+              AND (hash_value IS NULL OR hash_value = '' OR hash_algo IS NOT ?)
+            ORDER BY 1, {order.replace("hash_value", "member_crc")}
+        """, (self.last_ids[1], self.algo))
+        return heapq.merge(((s, _key(c, 8)) for s, c in e), ((s, _key(c, 8)) for s, c in a))
+
+    def _sorted_csr(self, rows_fn, typecode: str):
+        try:
+            return _csr(self.sizes, rows_fn("hash_value"), typecode)
+        except _Unsorted:
+            # 导入的旧数据大小写混用：按小写排序（不走索引，慢一些）
+            return _csr(self.sizes, rows_fn("lower(hash_value)"), typecode)
+
+    def load(self):
+        """从库里全量读出索引"""
+        t0 = time.perf_counter()
+        self.last_ids = self._max_ids()
+        e_max, a_max = self.last_ids
+        self.sizes = array("q", (row[0] for row in self.conn.execute("""
+            SELECT COALESCE(size_bytes, 0) AS size FROM entries WHERE is_dir = 0 AND is_deleted = 0 AND id <= ?
+            UNION
+            SELECT COALESCE(member_size, 0) FROM archives WHERE id <= ?
+            ORDER BY size
+        """, (e_max, a_max))))
+        self.hash_starts, self.hash_keys = self._sorted_csr(self._hash_rows, "Q")
+        self.crc_starts, self.crc_keys = self._sorted_csr(self._crc_rows, "I")
+
+        self.no_hash = array("b", bytes(len(self.sizes)))
+        for (size,) in self.conn.execute(f"""
+            SELECT COALESCE(size_bytes, 0) FROM entries
+            WHERE is_dir = 0 AND is_deleted = 0 AND id <= ?
+              AND (hash_value IS NULL OR hash_value = '' OR hash_algo IS NOT ?) AND {self.entry_crc} IS NULL
+            UNION
+            SELECT COALESCE(member_size, 0) FROM archives
+            WHERE id <= ? AND (member_crc IS NULL OR member_crc = '')
+              AND (hash_value IS NULL OR hash_value = '' OR hash_algo IS NOT ?)
+        """, (e_max, self.algo, a_max, self.algo)):
+            i = bisect_left(self.sizes, size)
+            if i < len(self.sizes) and self.sizes[i] == size:
+                self.no_hash[i] = 1
+
+        self.extra = defaultdict(set)     # refresh() 读到的新行：size -> {("h", key), ("c", crc), ("n", None)}
+        self.extra_rows = 0
+        self.load_seconds = time.perf_counter() - t0
+
+    def refresh(self) -> int:
+        """读入上次之后新增的行，返回行数；新行太多时整体重建"""
+        e_max, a_max = self._max_ids()
+        e_last, a_last = self.last_ids
+        n = 0
+        for size, algo, value, crc in self.conn.execute(f"""
+            SELECT COALESCE(size_bytes, 0), hash_algo, hash_value, {self.entry_crc} FROM entries
+            WHERE id > ? AND id <= ? AND is_dir = 0 AND is_deleted = 0
+        """, (e_last, e_max)):
+            self._add_extra(size, algo, value, crc)
+            n += 1
+        for size, algo, value, crc in self.conn.execute("""
+            SELECT COALESCE(member_size, 0), hash_algo, hash_value, member_crc FROM archives
+            WHERE id > ? AND id <= ?
+        """, (a_last, a_max)):
+            self._add_extra(size, algo, value, crc)
+            n += 1
+        self.last_ids = (e_max, a_max)
+        self.extra_rows += n
+        if self.extra_rows > max(REBUILD_MIN, REBUILD_RATIO * (len(self.hash_keys) + len(self.crc_keys))):
+            self.load()
+        return n
+
+    def _add_extra(self, size, algo, value, crc):
+        if value and algo == self.algo and _key(value) is not None:
+            self.extra[size].add(("h", _key(value)))
+        elif crc and _key(crc, 8) is not None:
+            self.extra[size].add(("c", _key(crc, 8)))
+        else:
+            self.extra[size].add(("n", None))
+
+    def memory_bytes(self) -> int:
+        arrays = (self.sizes, self.hash_starts, self.hash_keys, self.crc_starts, self.crc_keys, self.no_hash)
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+    def counts(self) -> dict:
+        return {"sizes": len(self.sizes), "hashes": len(self.hash_keys), "crcs": len(self.crc_keys),
+                "no_hash_sizes": sum(self.no_hash), "extra": self.extra_rows}
+
+    # ---- 内存里的判断
+    def _size_index(self, size: int):
+        i = bisect_left(self.sizes, size)
+        return i if i < len(self.sizes) and self.sizes[i] == size else None
+
+    def probe(self, path, st=None) -> dict:
+        """
+        只用内存索引（线程安全，hash 在这里算）：返回的 "checks" 是在内存里命中的检查，
+        按优先级 [("hash", ...), ("crc", ...), ("size", ...)]，交给 confirm() 回库确认。
+        """
+        result = {"path": str(path), "size_bytes": None, "status": "new", "hash_algo": self.algo,
+                  "hash_value": "", "crc32": "", "matches": [], "checks": []}
+        try:
+            st = st or os.stat(path)
+            size = result["size_bytes"] = st.st_size
+            i = self._size_index(size)
+            extra = self.extra.get(size, ())
+            if i is None and not extra:
+                return result
+            has_crc = (i is not None and self.crc_starts[i] < self.crc_starts[i + 1]) or any(
+                k == "c" for k, _ in extra)
+            algos = f"{self.algo},crc32" if has_crc and self.algo != "crc32" else self.algo
+            digests = hash_file_digests(path, algos)
+        except OSError as ex:
+            result["status"] = "error"
+            result["matches"] = [str(ex)]
+            return result
+
+        h = result["hash_value"] = digests[self.algo]
+        crc = result["crc32"] = digests.get("crc32", "") if has_crc else ""
+        key = _key(h)
+        if (i is not None and _in_range(self.hash_keys, self.hash_starts, i, key)) or ("h", key) in extra:
+            result["checks"].append(("hash", size, h))
+        if crc:
+            c = _key(crc, 8)
+            if (i is not None and _in_range(self.crc_keys, self.crc_starts, i, c)) or ("c", c) in extra:
+                result["checks"].append(("crc", size, crc))
+        if (i is not None and self.no_hash[i]) or ("n", None) in extra:
+            result["checks"].append(("size", size, None))
+        return result
+
+    # ---- 回库确认（只在一个线程里调用）
+    def _rows(self, sql: str, params) -> list:
+        return self.conn.execute(sql + " LIMIT ?", tuple(params) + (self.max_matches,)).fetchall()
+
+    def _members(self, where: str, params) -> list:
+        # 所在的压缩包已经删除（delete_exec 只标记 is_deleted）的成员不算
+        rows = self._rows(f"""
+            SELECT a.archive_full_path, a.member_path FROM archives a
+            WHERE {where}
+              AND EXISTS (SELECT 1 FROM entries e WHERE e.full_path = a.archive_full_path
+                          AND e.library_id = a.library_id AND e.is_deleted = 0)
+        """, params)
+        return [f"{archive}{NEST_SEP}{member}" for archive, member in rows]
+
+    def _matches(self, kind: str, size: int, value) -> list:
+        if kind == "hash":
+            values = (value.lower(), value.upper())
+            found = [r[0] for r in self._rows("""
+                SELECT full_path FROM entries
+                WHERE size_bytes = ? AND hash_value IN (?, ?) AND is_dir = 0 AND is_deleted = 0
+            """, (size, *values))]
+            return found + self._members("a.member_size = ? AND a.hash_value IN (?, ?) AND a.hash_algo = ?",
+                                         (size, *values, self.algo))
+        if kind == "crc":
+            values = (value.upper(), value.lower())
+            found = [r[0] for r in self._rows(f"""
+                SELECT full_path FROM entries
+                WHERE size_bytes = ? AND {self.entry_crc} IN (?, ?) AND is_dir = 0 AND is_deleted = 0
+            """, (size, *values))]
+            return found + self._members("a.member_size = ? AND a.member_crc IN (?, ?)", (size, *values))
+        found = [r[0] for r in self._rows("""
+            SELECT full_path FROM entries
+            WHERE size_bytes = ? AND is_dir = 0 AND is_deleted = 0
+              AND (hash_value IS NULL OR hash_value = '' OR hash_algo IS NOT ?)
+        """, (size, self.algo))]
+        return found + self._members("""a.member_size = ? AND (a.member_crc IS NULL OR a.member_crc = '')
+              AND (a.hash_value IS NULL OR a.hash_value = '' OR a.hash_algo IS NOT ?)""", (size, self.algo))
+
+    def confirm(self, result: dict) -> dict:
+        """按 checks 的顺序回库查询，第一个有结果的决定 status；都没有（前缀误报 / 已删除）为 new"""
+        status = {"hash": "exists", "crc": "crc_match", "size": "size_only"}
+        for kind, size, value in result.pop("checks", ()):
+            matches = self._matches(kind, size, value)
+            if matches:
+                result["status"] = status[kind]
+                result["matches"] = matches
+                break
+        return result
+
+    def lookup(self, path, st=None) -> dict:
+        """单个文件：probe + confirm"""
+        return self.confirm(self.probe(path, st))
+
+
+# -------------------------------------------------------------
+# 批量：文件 / 文件夹（文件夹用 walker 遍历），hash 在 worker 线程里算
+# -------------------------------------------------------------
+def iter_paths(paths, exclude=(), exts=None):
+    """产出 (path, stat_result 或 None)"""
+    for p in paths:
+        if os.path.isdir(p):
+            yield from walk_files(p, exclude, exts)
+        else:
+            yield p, None
+
+
+def lookup_paths(index: LookupIndex, paths, on_result, workers: int = 4, exclude=(), exts=None) -> Counter:
+    """on_result(result) 在调用方线程里按输入顺序调用，返回各 status 的计数"""
+    counts = Counter()
+
+    def write(res):
+        res = index.confirm(res)
+        counts[res["status"]] += 1
+        on_result(res)
+
+    items = iter_paths(paths, exclude, exts)
+    if workers and workers > 0:
+        run_pipeline(items, lambda item: index.probe(*item), write, workers)
+    else:
+        for path, st in items:
+            write(index.probe(path, st))
+    return counts
+
+
+def _csv_row(res: dict) -> list:
+    return [res["path"], res["size_bytes"], res["status"], res["hash_algo"], res["hash_value"],
+            res["crc32"], " | ".join(res["matches"])]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check whether incoming files already exist in the indexed libraries")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--hash", required=True, help="Hash method used for the scan (md5/sha1/blake2b-128 ...)")
+    ap.add_argument("paths", nargs="*", help="Files or folders to check")
+    ap.add_argument("--stdin", action="store_true",
+                    help="Read paths from stdin (one per line) and answer each line immediately")
+    ap.add_argument("--refresh-every", type=float, default=60.0,
+                    help="--stdin: pick up rows added to the DB every N seconds (default: 60, 0 = never)")
+    ap.add_argument("--workers", type=int, default=4, help="Hash threads for folders (default: 4, 0 = in order)")
+    ap.add_argument("--exclude", action="append", default=[], help="跳过匹配的文件/目录（fnmatch），可重复")
+    ap.add_argument("--file-exts", default="", help='只检查这些后缀的文件，例如 ".mp3,.wav"')
+    ap.add_argument("--only", action="append", choices=STATUSES, default=[],
+                    help="Only output these statuses (repeatable), e.g. --only new")
+    ap.add_argument("--max-matches", type=int, default=MAX_MATCHES_DEFAULT,
+                    help=f"Existing paths listed per file (default: {MAX_MATCHES_DEFAULT})")
+    ap.add_argument("--out", help="Write results to CSV instead of stdout")
+    args = ap.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"[ERROR] DB not found: {args.db}", file=sys.stderr)
+        sys.exit(2)
+    if not args.paths and not args.stdin:
+        ap.error("give files / folders to check, or --stdin")
+    try:
+        index = LookupIndex(args.db, args.hash, args.max_matches)
+    except ValueError as ex:
+        ap.error(str(ex))
+    c = index.counts()
+    print(f"[INFO] index: {c['sizes']} sizes | {c['hashes']} hashes | {c['crcs']} member CRCs | "
+          f"{c['no_hash_sizes']} sizes without hash | {index.memory_bytes() / 1024 / 1024:.1f} MiB | "
+          f"{index.load_seconds:.1f}s", file=sys.stderr)
+
+    f = writer = None
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        f = open(args.out, "w", newline="", encoding="utf-8-sig")
+        writer = csv.writer(f)
+        writer.writerow(LOOKUP_HEADER)
+    only = set(args.only)
+
+    def on_result(res):
+        if only and res["status"] not in only:
+            return
+        if writer:
+            writer.writerow(_csv_row(res))
+        else:
+            first = res["matches"][0] if res["matches"] else ""
+            print(f"{res['status']}\t{res['path']}\t{first}", flush=True)
+
+    exts = parse_exts(args.file_exts)
+    t0 = time.time()
+    counts = Counter()
+    try:
+        if args.paths:
+            counts += lookup_paths(index, args.paths, on_result, args.workers, args.exclude, exts)
+        if args.stdin:
+            last_refresh = time.time()
+            for line in sys.stdin:
+                path = line.strip()
+                if not path:
+                    continue
+                if args.refresh_every and time.time() - last_refresh >= args.refresh_every:
+                    n = index.refresh()
+                    last_refresh = time.time()
+                    if n:
+                        print(f"[INFO] refresh: {n} new rows", file=sys.stderr)
+                counts += lookup_paths(index, [path], on_result, 0, args.exclude, exts)
+    finally:
+        if f:
+            f.close()
+
+    elapsed = time.time() - t0
+    total = sum(counts.values())
+    rate = total / elapsed if elapsed > 0 else 0.0
+    summary = " | ".join(f"{s}: {counts[s]}" for s in STATUSES if counts[s])
+    print(f"[DONE] {total} files | {summary or 'nothing checked'} | {rate:.0f} files/sec | {elapsed:.1f}s",
+          file=sys.stderr)
+    if args.out:
+        print(f"[INFO] written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
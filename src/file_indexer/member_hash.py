@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+压缩包成员的内容 hash（archives.hash_value）：扫描时只记录成员的 size / CRC，这里按需补算，
+让压缩包里的 track01.wav 能和散落在外面的 track01.wav 按 (size, hash) 对上。
+
+- 只解压「可能重复」的成员（--all 关闭这个筛选）：
+    (member_size, member_crc) 在其它成员里出现过（任一方没有 CRC，例如 tar，就只比 size），
+    或者 member_size 和某个普通文件相同（普通文件有 CRC 时还要求 CRC 相同：entries.crc32，或 hash_algo 为 crc32）
+- 成员数据流式解压直接交给 hasher，不写磁盘：zip / tar 用 zipfile / tarfile，rar / 7z 用 "7z x -so"；
+  --nested-depth 列出的内嵌成员 "inner.zip!/x.wav" 先把内层压缩包放进内存或临时文件（--nested-* 上限）
+- 多个压缩包用进程池并行（--workers），每个 worker 一次处理一个压缩包的全部候选成员；
+  主进程每 --batch-size 个压缩包提交一次，中断后重新运行会跳过已经算过的成员
+- --hash 要和扫描时一致，成员的 hash 才能和 entries.hash_value 比较；空成员不解压，直接写空内容的 hash
+
+用法：
+python src/file_indexer/member_hash.py --db data/workspace/archive_work.db --hash md5 --workers 4
+python src/file_indexer/member_hash.py --db data/workspace/archive_work.db --hash md5 --dry-run
+python src/file_indexer/member_hash.py --db data/workspace/archive_work.db --hash md5 --out "D:\\cross_dups.csv"
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from archive_list import BACKENDS, NESTED_OPTIONS, configure_nested, iter_member_streams
+from hashers import hash_stream, new_hasher, resolve_algo
+
+BATCH_SIZE_DEFAULT = 200
+
+CROSS_HEADER = ["archive_full_path", "member_path", "member_size", "hash_algo", "hash_value",
+                "library_id", "file_full_path"]
+
+
+# -------------------------------------------------------------
+# 候选成员：(size, crc) 有对应的普通文件或其它成员
+# -------------------------------------------------------------
+def find_candidates(conn, hash_method: str, library_ids=None, all_members: bool = False):
+    """
+    返回 (tasks, empty, skipped)：
+      tasks  : {archive_full_path: {member_path: [archives.id, ...]}}，需要解压计算的成员
+      empty  : [archives.id, ...]，size 为 0 的候选成员（不用解压）
+      skipped: 没有对应文件、不需要计算的成员数
+    同一个压缩包在几个 library 里都有记录时只读一次。
+    """
+    loose_sizes, loose_crcs = set(), set()
+    if not all_members:
+        # --hash crc32,... 扫描的库有 entries.crc32；更早的库只有 hash_algo = 'crc32' 的行有 CRC
+        loose_crc = "CASE WHEN hash_algo = 'crc32' THEN hash_value END"
+        if "crc32" in {row[1] for row in conn.execute("PRAGMA table_info(entries)")}:
+            loose_crc = f"COALESCE(crc32, {loose_crc})"
+        for size, crc in conn.execute(f"""
+            SELECT size_bytes, {loose_crc}
+            FROM entries
+            WHERE is_dir = 0 AND is_deleted = 0
+        """):
+            if crc:
+                loose_crcs.add((size, crc.upper()))
+            else:
+                loose_sizes.add(size)
+    loose_any = loose_sizes | {size for size, _ in loose_crcs}
+
+    where, params = "", []
+    if library_ids:
+        where = "AND a.library_id IN (%s)" % ",".join("?" for _ in library_ids)
+        params = list(library_ids)
+    # 已删除的压缩包不算；所有 library 的成员都作为对应文件参与比较
+    members = conn.execute("""
+        SELECT a.id, a.library_id, a.archive_full_path, a.member_path, COALESCE(a.member_size, 0),
+               UPPER(COALESCE(a.member_crc, '')), a.hash_algo, a.hash_value
+        FROM archives a
+        JOIN entries e ON e.library_id = a.library_id AND e.full_path = a.archive_full_path
+        WHERE e.is_deleted = 0
+    """).fetchall()
+    by_key = Counter((m[4], m[5]) for m in members)
+    by_size = Counter(m[4] for m in members)
+    nocrc_sizes = Counter(m[4] for m in members if not m[5])
+
+    def has_counterpart(size: int, crc: str) -> bool:
+        if crc:
+            return (by_key[(size, crc)] > 1 or nocrc_sizes[size] > 0
+                    or size in loose_sizes or (size, crc) in loose_crcs)
+        return by_size[size] > 1 or size in loose_any
+
+    scope = set(library_ids or ())
+    tasks = defaultdict(lambda: defaultdict(list))
+    empty, skipped = [], 0
+    for entry_id, library_id, archive, member, size, crc, algo, value in members:
+        if scope and library_id not in scope:
+            continue
+        if value and algo == hash_method:
+            continue
+        if not all_members and not has_counterpart(size, crc):
+            skipped += 1
+        elif size == 0:
+            empty.append(entry_id)
+        else:
+            tasks[archive][member].append(entry_id)
+    return tasks, empty, skipped
+
+
+# -------------------------------------------------------------
+# worker（子进程中执行）：一个压缩包的候选成员
+# -------------------------------------------------------------
+def hash_archive_members(task):
+    """task = (archive_full_path, [member_path, ...], hash_method, sevenzip, backend, nested_options)"""
+    archive, members, hash_method, sevenzip, backend, nested = task
+    NESTED_OPTIONS.update(nested)
+    hashes, nbytes, errors = {}, 0, []
+    try:
+        for member, stream in iter_member_streams(Path(archive), members, sevenzip, backend):
+            try:
+                hashes[member] = hash_stream(stream, hash_method)
+            except Exception as ex:
+                errors.append(f"{member}: {ex}")
+    except Exception as ex:
+        errors.append(str(ex))
+    missing = set(members) - hashes.keys()
+    if missing and not errors:
+        errors.append(f"{len(missing)} members not found or not readable (encrypted?)")
+    return archive, hashes, errors
+
+
+def _run_tasks(tasks, workers: int):
+    """产出各压缩包的结果（完成顺序）；workers = 0 时在当前进程里依次执行"""
+    if workers <= 0:
+        for task in tasks:
+            yield hash_archive_members(task)
+        return
+    window = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for task in tasks:
+            pending.add(pool.submit(hash_archive_members, task))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        for fut in pending:
+            yield fut.result()
+
+
+# -------------------------------------------------------------
+# 主流程
+# -------------------------------------------------------------
+def hash_members(db_path: str, hash_method: str, workers: int = 0, library_ids=None,
+                 sevenzip: str = "7z", backend: str = "auto", batch_size: int = BATCH_SIZE_DEFAULT,
+                 all_members: bool = False, dry_run: bool = False):
+    conn = sqlite3.connect(db_path)
+    try:
+        t0 = time.time()
+        tasks, empty, skipped = find_candidates(conn, hash_method, library_ids, all_members)
+        todo = sum(len(m) for m in tasks.values())
+        print(f"[INFO] candidates: {todo} members in {len(tasks)} archives | empty: {len(empty)} | "
+              f"skipped (no size/CRC counterpart): {skipped} | {time.time() - t0:.1f}s")
+        if dry_run:
+            return
+
+        empty_hash = new_hasher(hash_method).hexdigest()
+        conn.executemany("UPDATE archives SET hash_algo = ?, hash_value = ? WHERE id = ?",
+                         ((hash_method, empty_hash, i) for i in empty))
+        conn.commit()
+
+        nested = dict(NESTED_OPTIONS)
+        work = ((archive, sorted(members), hash_method, sevenzip, backend, nested)
+                for archive, members in sorted(tasks.items()))
+        stats = {"archives": 0, "members": 0, "errors": 0}
+        t0 = time.time()
+        pending = 0
+        for archive, hashes, errors in _run_tasks(work, workers):
+            ids = tasks[archive]
+            conn.executemany("UPDATE archives SET hash_algo = ?, hash_value = ? WHERE id = ?",
+                             ((hash_method, h, i) for member, h in hashes.items() for i in ids[member]))
+            for err in errors:
+                print(f"[ERROR] {archive}: {err}", file=sys.stderr)
+            stats["archives"] += 1
+            stats["members"] += len(hashes)
+            stats["errors"] += len(ids) - len(hashes)
+            pending += 1
+            if pending >= batch_size:
+                conn.commit()
+                pending = 0
+                elapsed = time.time() - t0
+                rate = stats["members"] / elapsed if elapsed > 0 else 0.0
+                print(f"  {stats['archives']}/{len(tasks)} archives | members hashed: {stats['members']}"
+                      f"/{todo} | {rate:.0f} members/sec")
+        conn.commit()
+        elapsed = time.time() - t0
+        print(f"[DONE] archives: {stats['archives']} | members hashed: {stats['members']} | "
+              f"empty: {len(empty)} | errors: {stats['errors']} | {elapsed:.1f}s")
+    finally:
+        conn.close()
+
+
+def cross_matches(conn, hash_method: str):
+    """已经算过 hash 的成员中，和普通文件 (size, hash) 相同的：产出 CROSS_HEADER 顺序的行"""
+    return conn.execute("""
+        SELECT a.archive_full_path, a.member_path, a.member_size, a.hash_algo, a.hash_value,
+               e.library_id, e.full_path
+        FROM archives a
+        JOIN entries e
+          ON e.hash_value = a.hash_value AND e.size_bytes = a.member_size
+        WHERE a.hash_algo = ? AND a.hash_value <> ''
+          AND e.hash_algo = a.hash_algo AND e.is_dir = 0 AND e.is_deleted = 0
+        ORDER BY a.member_size DESC, a.archive_full_path, a.member_path
+    """, (hash_method,))
+
+
+def report_cross(db_path: str, hash_method: str, out: str = None):
+    conn = sqlite3.connect(db_path)
+    try:
+        n, size = 0, 0
+        f = writer = None
+        if out:
+            Path(out).parent.mkdir(parents=True, exist_ok=True)
+            f = open(out, "w", newline="", encoding="utf-8-sig")
+            writer = csv.writer(f)
+            writer.writerow(CROSS_HEADER)
+        try:
+            for row in cross_matches(conn, hash_method):
+                n += 1
+                size += row[2] or 0
+                if writer:
+                    writer.writerow(row)
+        finally:
+            if f:
+                f.close()
+        print(f"[INFO] archive members identical to a loose file: {n} pairs | {size} bytes")
+        if out:
+            print(f"[INFO] written to {out}")
+    finally:
+        conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Hash archive members that may duplicate loose files or other members")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--hash", required=True, help="Hash method, same as the scan (md5/sha1/blake2b-128 ...)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Worker processes, one archive at a time each (default: CPU count, 0 = in process)")
+    ap.add_argument("--library-id", type=int, action="append", default=[],
+                    help="Only members of these libraries (repeatable, default: all)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE_DEFAULT,
+                    help=f"Archives per committed batch (default: {BATCH_SIZE_DEFAULT})")
+    ap.add_argument("--all", action="store_true", help="Hash every member, not only possible duplicates")
+    ap.add_argument("--sevenzip", default="7z", help="Path to 7z.exe")
+    ap.add_argument("--archive-backend", choices=BACKENDS, default="auto")
+    ap.add_argument("--nested-memory-mb", type=float, help="内层 zip/tar 在内存里读取的大小上限（默认 64）")
+    ap.add_argument("--nested-spill-mb", type=float, help="超过这个大小的内层压缩包不读取（默认 4096）")
+    ap.add_argument("--nested-tmp", help="内层压缩包临时文件的目录")
+    ap.add_argument("--dry-run", action="store_true", help="Only count candidates")
+    ap.add_argument("--out", help="CSV of archive members identical to a loose file")
+    args = ap.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"[ERROR] DB not found: {args.db}", file=sys.stderr)
+        sys.exit(2)
+    try:
+        hash_method = resolve_algo(args.hash)
+        if "," in hash_method:
+            ap.error("--hash takes a single hash method (the scan's hash_algo)")
+        configure_nested(None, args.nested_memory_mb, args.nested_spill_mb, args.nested_tmp)
+    except ValueError as ex:
+        ap.error(str(ex))
+
+    hash_members(args.db, hash_method, args.workers, args.library_id, args.sevenzip,
+                 args.archive_backend, args.batch_size, args.all, args.dry_run)
+    if not args.dry_run:
+        report_cross(args.db, hash_method, args.out)
+
+
+if __name__ == "__main__":
+    main()
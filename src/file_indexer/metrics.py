@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+扫描 / 导入的运行指标：每个阶段的累计耗时和次数、计数器、最慢的文件、实时进度 + ETA、结束时写 JSON。
+
+    m = Metrics(expected_files=..., expected_bytes=..., progress_every=5)
+    with m.stage("hash", path, size):   # 累计耗时（多线程时为各线程之和，可能大于总时长）
+        ...
+    m.count("bytes_hashed", size)       # 计数器
+    m.tick(files=1, size=size)          # writer 每写完一个条目调用一次，按间隔打印 [PROGRESS]
+    m.dump("scan_metrics.json")
+
+ETA 的总量来源：
+- --precount：先遍历一遍只数文件数 / 字节数
+- 上一次运行的 metrics JSON（roots 相同时用它的 totals）
+
+--profile STAGE：只在该阶段的代码里开启 cProfile（每个线程一个 profiler，结束时合并），
+STAGE=all 时对整个运行（调用方线程）做 profile。结果写到 .prof 文件，并打印耗时最多的函数。
+"""
+
+import cProfile
+import heapq
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+SLOWEST_KEEP = 20
+PROGRESS_EVERY_DEFAULT = 5.0
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if n < 1024 or unit == "TiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+
+
+def _fmt_seconds(sec: float) -> str:
+    sec = int(sec)
+    return f"{sec // 3600}:{sec % 3600 // 60:02d}:{sec % 60:02d}"
+
+
+def load_expected(metrics_path, roots=None):
+    """
+    从上一次的 metrics JSON 读出 (files, bytes)，作为这次 ETA 的总量。
+    roots 不同（或文件不存在 / 不完整）时返回 (0, 0)。
+    """
+    try:
+        with open(metrics_path, encoding="utf-8") as f:
+            prev = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0
+    if roots is not None and sorted(prev.get("roots") or []) != sorted(str(r) for r in roots):
+        return 0, 0
+    if not prev.get("completed"):
+        return 0, 0
+    totals = prev.get("totals") or {}
+    return int(totals.get("files") or 0), int(totals.get("bytes") or 0)
+
+
+class Metrics:
+    def __init__(self, expected_files: int = 0, expected_bytes: int = 0,
+                 progress_every: float = PROGRESS_EVERY_DEFAULT, profile_stage: str = None,
+                 label: str = "scan", unit: str = "files"):
+        self.label = label
+        self.unit = unit
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.t0 = time.perf_counter()
+        self.expected_files = expected_files
+        self.expected_bytes = expected_bytes
+        self.progress_every = progress_every
+        self.profile_stage = profile_stage
+
+        self._lock = threading.Lock()
+        self.stages = {}      # name -> {"seconds", "calls", "bytes"}
+        self.counters = {}    # name -> int
+        self._slowest = {}    # name -> heap[(seconds, path, size)]
+        self.done_files = 0
+        self.done_bytes = 0
+        self._last_print = self.t0
+
+        self._profiles = []
+        self._local = threading.local()
+        self._profile_warned = False
+
+    # ---------------------------------------------------------
+    # 阶段计时 / 计数
+    # ---------------------------------------------------------
+    @contextmanager
+    def stage(self, name: str, path=None, size: int = 0):
+        prof = self._enable_profile() if name == self.profile_stage else None
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t
+            if prof is not None:
+                prof.disable()
+            self.add_time(name, elapsed, path, size)
+
+    def add_time(self, name: str, seconds: float, path=None, size: int = 0, calls: int = 1):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = {"seconds": 0.0, "calls": 0, "bytes": 0}
+            s["seconds"] += seconds
+            s["calls"] += calls
+            s["bytes"] += size or 0
+            if path is not None:
+                heap = self._slowest.setdefault(name, [])
+                item = (seconds, str(path), size or 0)
+                if len(heap) < SLOWEST_KEEP:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed_iter(self, name: str, it):
+        """每次 next() 的耗时记到 name 阶段（walker 的 scandir / stat 时间）"""
+        it = iter(it)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    # ---------------------------------------------------------
+    # 进度
+    # ---------------------------------------------------------
+    def tick(self, files: int = 1, size: int = 0):
+        """只在 writer（单线程）中调用"""
+        self.done_files += files
+        self.done_bytes += size or 0
+        if self.progress_every and time.perf_counter() - self._last_print >= self.progress_every:
+            self.print_progress()
+
+    def eta(self):
+        """按字节（有的话）或文件数的完成比例估算剩余秒数，不知道总量时返回 None"""
+        elapsed = time.perf_counter() - self.t0
+        if self.expected_bytes and self.done_bytes:
+            frac = self.done_bytes / self.expected_bytes
+        elif self.expected_files and self.done_files:
+            frac = self.done_files / self.expected_files
+        else:
+            return None, None
+        frac = min(frac, 1.0)
+        return frac, elapsed / frac - elapsed
+
+    def print_progress(self):
+        now = time.perf_counter()
+        self._last_print = now
+        elapsed = max(now - self.t0, 1e-9)
+        total = f"/{self.expected_files}" if self.expected_files else ""
+        parts = [f"[PROGRESS] {self.done_files}{total} {self.unit}",
+                 _fmt_bytes(self.done_bytes),
+                 f"{self.done_files / elapsed:.0f} {self.unit}/s",
+                 f"{self.done_bytes / elapsed / 1024 / 1024:.1f} MB/s"]
+        frac, remaining = self.eta()
+        if frac is not None:
+            parts.append(f"{frac * 100:.1f}% | ETA {_fmt_seconds(remaining)}")
+        parts.append(f"elapsed {_fmt_seconds(elapsed)}")
+        print(" | ".join(parts), flush=True)
+
+    # ---------------------------------------------------------
+    # cProfile
+    # ---------------------------------------------------------
+    def _enable_profile(self):
+        """开启当前线程的 profiler，返回它（失败返回 None，这一次不 profile）"""
+        prof = getattr(self._local, "profile", None)
+        if prof is None:
+            prof = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(prof)
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+ 同一时间只允许一个 profiler：别的线程正在 profile 时跳过这一次
+            if not self._profile_warned:
+                self._profile_warned = True
+                print(f"[WARN] --profile {self.profile_stage}: only one thread can be profiled "
+                      f"at a time on this Python, use --workers 0 for full coverage",
+                      file=sys.stderr)
+            return None
+        return prof
+
+    def profile_all_begin(self):
+        """--profile all：在调用方线程中 profile 整个运行（与 profile_all_end 成对调用）"""
+        if self.profile_stage == "all":
+            self._all_profile = self._enable_profile()
+
+    def profile_all_end(self):
+        prof = getattr(self, "_all_profile", None)
+        if prof is not None:
+            prof.disable()
+            self._all_profile = None
+
+    def write_profile(self, path, top: int = 25):
+        profiles = [p for p in self._profiles if p.getstats()]
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for p in profiles[1:]:
+            stats.add(p)
+        stats.dump_stats(str(path))
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats("cumulative").print_stats(top)
+        print(f"[PROFILE] stage: {self.profile_stage} | threads: {len(profiles)} | {path}")
+        print(out.getvalue())
+
+    # ---------------------------------------------------------
+    # 结果
+    # ---------------------------------------------------------
+    def summary(self, **extra) -> dict:
+        wall = time.perf_counter() - self.t0
+        with self._lock:
+            stages = {}
+            for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1]["seconds"]):
+                d = {"seconds": round(s["seconds"], 3), "calls": s["calls"]}
+                if s["bytes"]:
+                    d["bytes"] = s["bytes"]
+                    if s["seconds"] > 0:
+                        d["mb_per_s"] = round(s["bytes"] / 1024 / 1024 / s["seconds"], 1)
+                if s["calls"]:
+                    d["avg_ms"] = round(s["seconds"] * 1000 / s["calls"], 3)
+                stages[name] = d
+            slowest = {
+                name: [{"path": p, "seconds": round(sec, 3), "bytes": size}
+                       for sec, p, size in sorted(heap, reverse=True)]
+                for name, heap in self._slowest.items()
+            }
+            counters = dict(self.counters)
+        result = {
+            "label": self.label,
+            "started_at": self.started_at,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": round(wall, 3),
+            "totals": {self.unit: self.done_files, "bytes": self.done_bytes},
+            "rates": {
+                f"{self.unit}_per_s": round(self.done_files / wall, 1) if wall > 0 else 0.0,
+                "mb_per_s": round(self.done_bytes / 1024 / 1024 / wall, 1) if wall > 0 else 0.0,
+            },
+            "counters": counters,
+            "stages": stages,
+            "slowest": slowest,
+        }
+        result.update(extra)
+        return result
+
+    def dump(self, path, **extra) -> dict:
+        result = self.summary(**extra)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Metrics JSON: {path}")
+        return result
+
+    def print_stages(self):
+        """结束时打印各阶段耗时（累计值，多线程时可能大于总时长）"""
+        wall = time.perf_counter() - self.t0
+        for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1]["seconds"]):
+            rate = ""
+            if s["bytes"] and s["seconds"] > 0:
+                rate = f" | {s['bytes'] / 1024 / 1024 / s['seconds']:.1f} MB/s"
+            print(f"[STAGE] {name:<13} {s['seconds']:9.2f}s | calls: {s['calls']}{rate}")
+        print(f"[STAGE] wall          {wall:9.2f}s")
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+把 v1 数据库迁移成紧凑的 schema v2（见 create_db.SCHEMA_V2_SQL），写到一个新文件，源库只读打开、不改动。
+
+v1 每一行都存完整的 full_path / parent_path / name 和 hex 文本 hash，
+idx_entries_full_path、idx_entries_hash 两个索引又各存一份。v2：
+  dirs        每个目录一行（id, parent_id, name + 缓存的 path / rel）
+  entries_v2  只存 dir_id + name，hash 存 BLOB，mtime 存整数秒
+  entries     兼容视图，列和 v1 相同，用于查看和临时查询
+
+迁移规则：
+  - entries.id 保持不变（delete_plan.entry_id、archives.archive_entry_id 继续有效）
+  - hex 能无损还原（crc32 大写、其它小写）的 hash 存 BLOB，否则原样存 TEXT
+  - mtime 截成整数秒（唯一有损的列，--verify 比较时同样截断）
+  - library / archives 原样复制；delete_plan、dup_check 等其它表连同索引原样复制；
+    scan_checkpoint 不复制（v2 不能续扫）
+  - 目录按 full_path 去掉 name 得到，分隔符取 name 前面的字符，
+    并按 parent_path 补齐到扫描根目录的上级目录
+
+范围：v2 是单向的归档 / 分析快照，不是工作库，v1 库仍然是工作库。
+  - 没有 v2 -> v1 的转换；扫描、导入、reindex、watch、dedupe、shard merge 只写 v1（遇到 v2 报错），
+    v1 更新之后要重新迁移
+  - 查重用 sql/Dup_Check_v2.sql；Dup_Check.sql 走视图比 v1 慢（--measure 实测约 1.6 倍），
+    Dup_Ranked_v2.sql 这类按拼接出来的 full_path JOIN 的脚本在视图上用不到索引，不支持
+  - 视图只能 UPDATE is_deleted / extra_meta / manifest_hash（INSTEAD OF 触发器），不能 INSERT / DELETE
+
+用法：
+python src/file_indexer/migrate_v2.py --src data/workspace/archive_work.db --dst data/workspace/archive_work_v2.db
+python src/file_indexer/migrate_v2.py --src ... --dst ... --measure      # 对比文件大小和 Dup_Check 耗时
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from create_db import SCHEMA_V2_INDEXES_SQL, SCHEMA_V2_SQL, SCHEMA_V2_VIEW_SQL, schema_version
+
+REPO = Path(__file__).resolve().parent.parent.parent
+BATCH_DEFAULT = 20000
+
+V1_COLUMNS = [
+    "id", "library_id", "full_path", "parent_path", "name", "ext", "is_dir", "is_archive",
+    "size_bytes", "mtime", "hash_algo", "hash_value", "partial_hash", "manifest_hash",
+    "is_deleted", "extra_meta", "crc32",
+]
+
+# 不复制的表（v2 自己建的 / 只对 v1 有意义的）
+SKIP_TABLES = {"library", "entries", "archives", "sqlite_sequence", "scan_checkpoint"}
+
+
+# -------------------------------------------------------------
+# 转换
+# -------------------------------------------------------------
+def hex_to_blob(value, algo=None):
+    """hex 文本 -> bytes；还原后和原值不完全相同（大小写、不是 hex）时原样返回"""
+    if not value or not isinstance(value, str):
+        return value
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        return value
+    back = raw.hex().upper() if algo == "crc32" else raw.hex()
+    return raw if back == value else value
+
+
+def split_dir(full_path: str, name: str, parent_path: str):
+    """
+    返回从扫描根目录到该目录的链 [(path, name, rel), ...]，path 带结尾分隔符。
+    full_path 不以 name 结尾等无法拆分的行返回 None（调用方把整个目录当作一个根目录）。
+    """
+    if not name or not full_path.endswith(name) or len(full_path) == len(name):
+        return None
+    dir_path = full_path[:-len(name)]
+    sep = dir_path[-1]
+    if sep not in "\\/":
+        return None
+    if parent_path in (".", ""):
+        return [(dir_path, dir_path[:-1], parent_path)]
+    # 根目录 = dir_path 去掉 "rel + 分隔符"
+    if not dir_path.endswith(sep + parent_path + sep):
+        return None
+    root = dir_path[:-len(parent_path) - 1]
+    chain = [(root, root[:-1], ".")]
+    rel = ""
+    for part in parent_path.split(sep):
+        rel = f"{rel}{sep}{part}" if rel else part
+        chain.append((root + rel + sep, part, rel))
+    return chain
+
+
+def _dir_id(cur, dirs: dict, library_id: int, full_path: str, name: str, parent_path: str) -> int:
+    """dirs: {(library_id, path): id}，需要时插入目录及其上级目录"""
+    chain = split_dir(full_path, name, parent_path)
+    if chain is None:
+        dir_path = full_path[:len(full_path) - len(name)] if full_path.endswith(name) else full_path
+        chain = [(dir_path, dir_path, parent_path)]
+    key = (library_id, chain[-1][0])
+    found = dirs.get(key)
+    if found is not None:
+        return found
+    parent_id = None
+    for path, dname, rel in chain:
+        key = (library_id, path)
+        did = dirs.get(key)
+        if did is None:
+            cur.execute("INSERT INTO dirs (parent_id, library_id, name, path, rel) VALUES (?, ?, ?, ?, ?)",
+                        (parent_id, library_id, dname, path, rel))
+            did = dirs[key] = cur.lastrowid
+        parent_id = did
+    return parent_id
+
+
+# -------------------------------------------------------------
+# 迁移
+# -------------------------------------------------------------
+def _columns(conn, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _copy_table(conn, table: str, columns: list):
+    cols = ", ".join(columns)
+    conn.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM v1.{table}")
+
+
+def migrate(src: str, dst: str, batch: int = BATCH_DEFAULT, force: bool = False) -> dict:
+    if not Path(src).exists():
+        raise SystemExit(f"[ERROR] source DB not found: {src}")
+    if Path(dst).exists():
+        if not force:
+            raise SystemExit(f"[ERROR] {dst} already exists (use --force to overwrite)")
+        Path(dst).unlink()
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    src_uri = Path(src).resolve().as_uri() + "?mode=ro"
+    read = sqlite3.connect(src_uri, uri=True)
+    if schema_version(read) == 2:
+        read.close()
+        raise SystemExit(f"[ERROR] {src} is already schema v2")
+
+    conn = sqlite3.connect(dst)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA_V2_SQL)
+    # 原样复制 v1 的数据，不在这里检查外键
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("ATTACH DATABASE ? AS v1", (src_uri,))
+    stats = {"entries": 0, "dirs": 0, "blob_hashes": 0, "text_hashes": 0, "tables": []}
+    try:
+        conn.execute("BEGIN")
+        _copy_table(conn, "library", _columns(read, "library"))
+
+        # ---- entries -> dirs + entries_v2（v1 旧库可能缺少后来加的列）
+        have = set(_columns(read, "entries"))
+        select = ", ".join(c if c in have else "NULL" for c in V1_COLUMNS)
+        cur = conn.cursor()
+        dirs = {}
+        rows = read.execute(f"SELECT {select} FROM entries ORDER BY id")
+        while True:
+            chunk = rows.fetchmany(batch)
+            if not chunk:
+                break
+            out = []
+            for (eid, library_id, full_path, parent_path, name, ext, is_dir, is_archive, size_bytes,
+                 mtime, hash_algo, hash_value, partial_hash, manifest_hash, is_deleted, extra_meta,
+                 crc32) in chunk:
+                dir_id = _dir_id(cur, dirs, library_id, full_path, name, parent_path)
+                hv = hex_to_blob(hash_value, hash_algo)
+                if isinstance(hv, bytes):
+                    stats["blob_hashes"] += 1
+                elif hv:
+                    stats["text_hashes"] += 1
+                out.append((eid, library_id, dir_id, name, ext, is_dir, is_archive, size_bytes,
+                            int(mtime) if mtime is not None else None, hash_algo, hv,
+                            hex_to_blob(partial_hash, hash_algo), hex_to_blob(manifest_hash),
+                            is_deleted or 0, extra_meta, hex_to_blob(crc32, "crc32")))
+            cur.executemany("""
+                INSERT INTO entries_v2 (id, library_id, dir_id, name, ext, is_dir, is_archive, size_bytes,
+                                        mtime, hash_algo, hash_value, partial_hash, manifest_hash,
+                                        is_deleted, extra_meta, crc32)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, out)
+            stats["entries"] += len(out)
+            print(f"[INFO] entries: {stats['entries']} | dirs: {len(dirs)}", flush=True)
+        stats["dirs"] = len(dirs)
+        _copy_table(conn, "archives", _columns(read, "archives"))
+
+        # ---- 其它表（delete_plan、dup_check ...）连同索引原样复制
+        objects = read.execute("""
+            SELECT type, name, tbl_name, sql FROM sqlite_master
+            WHERE type IN ('table', 'index') AND sql IS NOT NULL
+            ORDER BY type = 'index', rowid
+        """).fetchall()
+        for typ, name, tbl_name, sql in objects:
+            if tbl_name in SKIP_TABLES or tbl_name.startswith("sqlite_"):
+                continue
+            conn.execute(sql)
+            if typ == "table":
+                conn.execute(f"INSERT INTO main.{name} SELECT * FROM v1.{name}")
+                stats["tables"].append(name)
+
+        conn.executescript(SCHEMA_V2_INDEXES_SQL + SCHEMA_V2_VIEW_SQL)
+        conn.execute("PRAGMA user_version = 2")
+        conn.execute("ANALYZE main")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        read.close()
+        Path(dst).unlink(missing_ok=True)
+        raise
+    conn.execute("DETACH DATABASE v1")
+    conn.close()
+    read.close()
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+
+def verify(src: str, dst: str) -> int:
+    """比较 v1 entries 和 v2 视图（mtime 按整数秒），返回不一致的行数"""
+    conn = sqlite3.connect(dst)
+    try:
+        conn.execute("ATTACH DATABASE ? AS v1", (Path(src).resolve().as_uri() + "?mode=ro",))
+        have = {row[1] for row in conn.execute("PRAGMA v1.table_info(entries)")}
+        cols = [c for c in V1_COLUMNS if c in have]
+        old = ", ".join("CAST(mtime AS INTEGER)" if c == "mtime" else
+                        ("COALESCE(is_deleted, 0)" if c == "is_deleted" else c) for c in cols)
+        new = ", ".join(cols)
+        diff = conn.execute(f"""
+            SELECT COUNT(*) FROM (
+                SELECT {old} FROM v1.entries EXCEPT SELECT {new} FROM main.entries
+                UNION ALL
+                SELECT {new} FROM main.entries EXCEPT SELECT {old} FROM v1.entries
+            )
+        """).fetchone()[0]
+    finally:
+        conn.close()
+    return diff
+
+
+# -------------------------------------------------------------
+# 测量：文件大小 / 各表和索引大小 / Dup_Check 耗时
+# -------------------------------------------------------------
+def object_sizes(path: str) -> list:
+    """[(name, bytes), ...]，按大小降序；SQLite 没有编译 dbstat 时返回 []"""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def time_dup_check(path: str, repeat: int = 3, script_name: str = "Dup_Check.sql"):
+    """在临时副本上执行 sql/<script_name>（它会重建 dup_check 表），返回 (最快秒数, 行数)"""
+    script = (REPO / "sql" / script_name).read_text(encoding="utf-8-sig")
+    tmp_dir = tempfile.mkdtemp(prefix="file_indexer_measure_")
+    best, rows = None, 0
+    try:
+        tmp = os.path.join(tmp_dir, "copy.db")
+        shutil.copyfile(path, tmp)
+        for _ in range(repeat):
+            conn = sqlite3.connect(tmp)
+            try:
+                t = time.perf_counter()
+                conn.executescript(script)
+                conn.commit()
+                elapsed = time.perf_counter() - t
+                rows = conn.execute("SELECT COUNT(*) FROM dup_check").fetchone()[0]
+            finally:
+                conn.close()
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return best, rows
+
+
+def measure(src: str, dst: str, repeat: int = 3):
+    src_size, dst_size = os.path.getsize(src), os.path.getsize(dst)
+    print(f"[MEASURE] file size : v1 {src_size / 1024 / 1024:9.2f} MiB | v2 {dst_size / 1024 / 1024:9.2f} MiB"
+          f" | {dst_size / src_size * 100:.0f}%")
+    for label, path in (("v1", src), ("v2", dst)):
+        sizes = object_sizes(path)
+        if sizes:
+            top = ", ".join(f"{name} {size / 1024 / 1024:.2f}" for name, size in sizes[:8])
+            print(f"[MEASURE] {label} largest objects (MiB): {top}")
+    # Dup_Check.sql 在 v2 上走兼容视图；Dup_Check_v2.sql 直接按 BLOB 分组
+    t1, r1 = time_dup_check(src, repeat)
+    t2, r2 = time_dup_check(dst, repeat)
+    t3, r3 = time_dup_check(dst, repeat, "Dup_Check_v2.sql")
+    print(f"[MEASURE] Dup_Check : v1 {t1:8.3f}s ({r1} rows) | v2 view {t2:8.3f}s ({r2} rows, "
+          f"{t2 / t1 if t1 else 0:.2f}x) | Dup_Check_v2.sql {t3:8.3f}s ({r3} rows, {t3 / t1 if t1 else 0:.2f}x)")
+    if not r1 == r2 == r3:
+        print("[WARN] Dup_Check row count differs between v1 and v2", file=sys.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migrate a v1 database to the compact schema v2")
+    ap.add_argument("--src", required=True, help="v1 DB (opened read-only)")
+    ap.add_argument("--dst", required=True, help="New v2 DB file")
+    ap.add_argument("--force", action="store_true", help="Overwrite --dst if it exists")
+    ap.add_argument("--batch", type=int, default=BATCH_DEFAULT, help=f"Rows per batch (default: {BATCH_DEFAULT})")
+    ap.add_argument("--no-verify", action="store_true", help="Skip comparing the v2 view with v1 entries")
+    ap.add_argument("--measure", action="store_true",
+                    help="Print DB sizes and time sql/Dup_Check.sql on both DBs")
+    ap.add_argument("--repeat", type=int, default=3, help="Dup_Check runs per DB for --measure (default: 3)")
+    args = ap.parse_args()
+
+    stats = migrate(args.src, args.dst, args.batch, args.force)
+    print(f"[DONE] {args.dst} | entries: {stats['entries']} | dirs: {stats['dirs']} | "
+          f"BLOB hashes: {stats['blob_hashes']} | TEXT hashes: {stats['text_hashes']} | "
+          f"{stats['seconds']}s")
+    if stats["tables"]:
+        print(f"[INFO] copied tables: {', '.join(stats['tables'])}")
+
+    if not args.no_verify:
+        diff = verify(args.src, args.dst)
+        if diff:
+            print(f"[ERROR] verify: {diff} rows differ between v1 entries and the v2 view", file=sys.stderr)
+            sys.exit(1)
+        print("[INFO] verify: v2 view matches v1 entries (mtime compared as whole seconds)")
+
+    if args.measure:
+        measure(args.src, args.dst, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+增量重扫描：直接更新已有 archive_work.db 里的某个 library，而不是新建 library。
+
+- 按 (full_path, size_bytes, mtime) 与 entries 比对（走 idx_entries_full_path）
+- 未变化的文件：不重新 hash、不重新跑 7z
+- 新文件：INSERT entries（压缩包同时写 archives，archive_entry_id 直接填好）
+- 已变化的文件：UPDATE entries，并重建该压缩包的 archives 行
+- 已消失的文件：entries.is_deleted = 1，并删除其 archives 成员行
+
+- --exclude / --file-exts 要和首次扫描时相同；被过滤掉的已有行保持原样，不当作消失
+
+用法：
+python src/file_indexer/reindex.py --db data/workspace/archive_work.db --library-id 1 --hash md5 --workers 8
+python src/file_indexer/reindex.py --db ... --library-id 2 --hash md5 --file-exts ".wav,.mp3" --exclude "*.tmp"
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from archive_list import BACKENDS, configure_nested
+from create_db import ensure_columns, require_v1
+from db_writer import upsert_entry
+from hashers import READ_MODES, configure_io, primary_algo, resolve_algo, split_algos
+from index_archives_v2 import is_filtered_path, iter_files, process_file
+from scan_pipeline import run_pipeline
+from stats import open_stats
+from walker import parse_exts
+
+COMMIT_EVERY = 2000
+
+# 按 full_path 找已有的行（reindex / watch 共用，existing 的列顺序见 is_unchanged）；
+# +library_id：不让优化器改走 idx_entries_lib（只有一个 library 时等于全表扫描）
+EXISTING_SQL = """
+    SELECT id, size_bytes, mtime, hash_algo, is_deleted, crc32, extra_meta, is_archive
+    FROM entries
+    WHERE full_path = ? AND +library_id = ?
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+
+def _lookup_existing(db_path: str, library_id: int, root: Path, exclude=(), file_exts=None):
+    """
+    walker：产出 (path, stat_result, existing)，existing 为 entries 中已有的行或 None。
+    使用独立的只读连接（可能运行在 walker 线程中）。
+    """
+    conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+    try:
+        for p, st in iter_files(root, exclude, file_exts):
+            row = conn.execute(EXISTING_SQL, (str(p), library_id)).fetchone()
+            yield p, st, row
+    finally:
+        conn.close()
+
+
+def _stored_algos(hash_algo, crc32, extra_meta) -> set:
+    """entries 里已经有摘要的算法：hash_algo + crc32 列 + extra_meta 的 "digests" """
+    algos = {hash_algo} if hash_algo else set()
+    if crc32:
+        algos.add("crc32")
+    if extra_meta:
+        try:
+            algos.update(json.loads(extra_meta).get("digests") or ())
+        except (ValueError, AttributeError):
+            pass
+    return algos
+
+
+def is_unchanged(existing, st, hash_method: str) -> bool:
+    """
+    existing = (id, size_bytes, mtime, hash_algo, is_deleted, crc32, extra_meta, is_archive)；
+    size / mtime 相同、hash_algo 相同且 hash_method 的每个摘要都已经有了，则不重新处理。
+    标记为删除的压缩包例外：mark_deleted 已经删掉了它的 archives 行，回来时要重新列出成员
+    """
+    _, size_bytes, mtime, hash_algo, is_deleted, crc32, extra_meta, is_archive = existing
+    return (not (is_deleted and is_archive)
+            and st.st_size == size_bytes
+            and mtime is not None and st.st_mtime == mtime
+            and (not hash_method
+                 or (hash_algo == primary_algo(hash_method)
+                     and _stored_algos(hash_algo, crc32, extra_meta) >= set(split_algos(hash_method)))))
+
+
+def reindex(db_path: str,
+            library_id: int,
+            root: Path = None,
+            hash_method: str = "",
+            sevenzip: str = "7z",
+            workers: int = 0,
+            archive_backend: str = "auto",
+            exclude=(),
+            file_exts=None):
+
+    hash_method = resolve_algo(hash_method)
+    conn = sqlite3.connect(db_path, timeout=60)
+    require_v1(conn, db_path)
+    ensure_columns(conn)
+    conn.commit()
+    stats = open_stats(conn)
+
+    lib = conn.execute("SELECT root_path FROM library WHERE id = ?", (library_id,)).fetchone()
+    if lib is None:
+        conn.close()
+        raise SystemExit(f"[ERROR] library_id={library_id} not found in {db_path}")
+
+    # root_path 必须与首次导入时一致，parent_path 才能对得上
+    root = Path(root or lib[0]).resolve()
+
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE seen (id INTEGER PRIMARY KEY)")
+
+    counters = {"unchanged": 0, "new": 0, "changed": 0, "deleted": 0, "errors": 0}
+    pending = 0
+    t0 = time.time()
+
+    def work(item):
+        p, st, existing = item
+        if existing is not None and is_unchanged(existing, st, hash_method):
+            return {"kind": "unchanged", "id": existing[0], "was_deleted": existing[4]}
+
+        res = process_file(p, root, hash_method, sevenzip, st, archive_backend)
+        res["kind"] = "new" if existing is None else "changed"
+        res["id"] = None if existing is None else existing[0]
+        return res
+
+    def write(res: dict):
+        nonlocal pending
+        kind = res["kind"]
+        if kind == "unchanged":
+            cur.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (res["id"],))
+            if res["was_deleted"]:
+                cur.execute("UPDATE entries SET is_deleted = 0 WHERE id = ?", (res["id"],))
+                stats.add_id(cur, res["id"], 1)
+            counters["unchanged"] += 1
+            return
+
+        counters["errors"] += res["errors"]
+        if res["entry_row"] is None:
+            if res["id"] is not None:
+                # 读不到但路径还在：保持原行，不当作消失
+                cur.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (res["id"],))
+            return
+
+        entry_id = upsert_entry(cur, library_id, res["id"], res, stats)
+
+        cur.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (entry_id,))
+        counters[kind] += 1
+
+        pending += 1
+        if pending >= COMMIT_EVERY:
+            stats.commit(conn)
+            pending = 0
+
+    try:
+        items = _lookup_existing(db_path, library_id, root, exclude, file_exts)
+        if workers and workers > 0:
+            run_pipeline(items, work, write, workers)
+        else:
+            for item in items:
+                write(work(item))
+
+        if exclude or file_exts:
+            # 被 --exclude / --file-exts 过滤掉的行没有遍历到，但文件不一定消失了：保持原样
+            unseen = cur.execute("""
+                SELECT id, full_path FROM entries
+                WHERE library_id = ? AND is_deleted = 0 AND id NOT IN (SELECT id FROM seen)
+            """, (library_id,)).fetchall()
+            cur.executemany("INSERT OR IGNORE INTO seen (id) VALUES (?)",
+                            [(i,) for i, fp in unseen if is_filtered_path(fp, root, exclude, file_exts)])
+
+        # 本次没见到的行 -> 标记为已删除
+        cur.execute("""
+            DELETE FROM archives
+            WHERE library_id = ?
+              AND archive_full_path IN (
+                SELECT full_path FROM entries
+                WHERE library_id = ? AND is_deleted = 0 AND is_archive = 1
+                  AND id NOT IN (SELECT id FROM seen)
+            )
+        """, (library_id, library_id))
+        gone = "library_id = ? AND is_deleted = 0 AND id NOT IN (SELECT id FROM seen)"
+        stats.add_query(cur, gone, (library_id,), -1)
+        cur.execute("""
+            UPDATE entries
+            SET is_deleted = 1
+            WHERE library_id = ? AND is_deleted = 0
+              AND id NOT IN (SELECT id FROM seen)
+        """, (library_id,))
+        counters["deleted"] = cur.rowcount
+        stats.commit(conn)
+    finally:
+        conn.close()
+
+    elapsed = time.time() - t0
+    print("")
+    print(f"[DONE] library_id={library_id} | unchanged: {counters['unchanged']} | "
+          f"new: {counters['new']} | changed: {counters['changed']} | "
+          f"deleted: {counters['deleted']} | errors: {counters['errors']} | {elapsed:.1f}s")
+    return counters
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Incrementally re-index an existing library in place")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--library-id", type=int, required=True)
+    ap.add_argument("--root", help="Root folder (default: library.root_path)")
+    ap.add_argument("--hash", default="",
+                    help="Hash method: md5/sha1/sha256/blake2b-128/xxh3_64 ..., comma list e.g. crc32,sha256")
+    ap.add_argument("--exclude", action="append", default=[],
+                    help="跳过匹配的文件/目录（fnmatch，匹配名字或相对路径），可重复；与扫描时相同")
+    ap.add_argument("--file-exts", default="",
+                    help='只处理这些后缀的普通文件（压缩包总是处理），例如 ".mp3,.wav"；与扫描时相同')
+    ap.add_argument("--read-block-kb", type=int, default=1024,
+                    help="hash 读文件的块大小 KiB（默认 1024）")
+    ap.add_argument("--read-mode", choices=READ_MODES, default="readinto",
+                    help="readinto: 复用缓冲区（默认）；mmap: 大文件用 mmap；read: 旧实现")
+    ap.add_argument("--keep-cache", action="store_true",
+                    help="不调用 posix_fadvise(DONTNEED)，读过的文件留在页缓存里")
+    ap.add_argument("--sevenzip", default="7z", help="Path to 7z.exe")
+    ap.add_argument("--archive-backend", choices=BACKENDS, default="auto",
+                    help="auto / native (zipfile, tarfile) / 7z")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="并行 hash/7z worker 线程数（0 = 单线程）")
+    ap.add_argument("--nested-depth", type=int, default=0,
+                    help="列出压缩包里的压缩包，最多 N 层（0 = 不展开）；只对新增 / 变化的压缩包生效")
+    ap.add_argument("--nested-memory-mb", type=float, help="内层 zip/tar 在内存里读取的大小上限（默认 64）")
+    ap.add_argument("--nested-spill-mb", type=float, help="超过这个大小的内层压缩包不展开（默认 4096）")
+    ap.add_argument("--nested-tmp", help="内层压缩包临时文件的目录")
+    args = ap.parse_args()
+    try:
+        resolve_algo(args.hash)
+        configure_nested(args.nested_depth, args.nested_memory_mb, args.nested_spill_mb, args.nested_tmp)
+    except ValueError as ex:
+        ap.error(str(ex))
+    configure_io(args.read_block_kb * 1024, args.read_mode, not args.keep_cache)
+
+    reindex(
+        args.db,
+        args.library_id,
+        Path(args.root) if args.root else None,
+        args.hash,
+        args.sevenzip,
+        workers=args.workers,
+        archive_backend=args.archive_backend,
+        exclude=args.exclude,
+        file_exts=parse_exts(args.file_exts),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Staged scan pipeline:
+
+    walker 线程  ->  work queue  ->  N 个 worker 线程  ->  result queue  ->  writer (调用方线程)
+
+- walker 只负责产出路径（带顺序号 seq）
+- worker 负责 stat / hash / 7z 列表等耗时操作（hashlib 会释放 GIL，7z 是子进程，线程足够）
+- writer 只有一个，按 seq 顺序写出，保证输出与单线程模式完全一致
+- in-flight 信号量限制「已产出但尚未写出」的条目数，队列有背压，内存保持平稳
+"""
+
+import queue
+import threading
+
+_STOP = object()
+_WALK_DONE = object()
+_FAILED = object()
+
+
+def run_pipeline(items, work_fn, write_fn, workers: int, max_in_flight: int = 0):
+    """
+    items     : 可迭代对象（walker），在独立线程中遍历
+    work_fn   : work_fn(item) -> result，在 worker 线程中执行
+    write_fn  : write_fn(result)，只在调用方线程中按输入顺序执行
+    workers   : worker 线程数（>= 1）
+    max_in_flight : 同时在途的最大条目数（默认 workers * 4）
+
+    返回处理的条目总数。
+    """
+    workers = max(1, int(workers))
+    max_in_flight = max_in_flight or workers * 4
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    work_q = queue.Queue(maxsize=max_in_flight)
+    result_q = queue.Queue()
+    stop_event = threading.Event()
+
+    def walker():
+        count = 0
+        try:
+            for item in items:
+                # 背压：writer 没写完之前不再继续产出
+                while not in_flight.acquire(timeout=0.5):
+                    if stop_event.is_set():
+                        return
+                if stop_event.is_set():
+                    return
+                work_q.put((count, item))
+                count += 1
+        except BaseException as ex:  # 交给 writer 线程抛出
+            result_q.put((_FAILED, ex))
+            return
+        finally:
+            for _ in range(workers):
+                work_q.put((None, _STOP))
+        result_q.put((_WALK_DONE, count))
+
+    def worker():
+        while True:
+            seq, item = work_q.get()
+            if item is _STOP:
+                return
+            if stop_event.is_set():
+                continue
+            try:
+                result_q.put((seq, work_fn(item)))
+            except BaseException as ex:
+                result_q.put((_FAILED, ex))
+
+    threads = [threading.Thread(target=walker, name="scan-walker", daemon=True)]
+    threads += [
+        threading.Thread(target=worker, name=f"scan-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for t in threads:
+        t.start()
+
+    total = None
+    next_seq = 0
+    pending = {}
+    try:
+        while total is None or next_seq < total:
+            seq, res = result_q.get()
+            if seq is _WALK_DONE:
+                total = res
+                continue
+            if seq is _FAILED:
+                raise res
+
+            pending[seq] = res
+            # 按顺序写出，保证结果确定
+            while next_seq in pending:
+                write_fn(pending.pop(next_seq))
+                next_seq += 1
+                in_flight.release()
+    finally:
+        stop_event.set()
+        # 让 walker 从 acquire 等待中退出
+        for _ in range(max_in_flight):
+            try:
+                in_flight.release()
+            except ValueError:
+                break
+        # 清空 work queue，避免 walker 在 put 上阻塞
+        try:
+            while True:
+                work_q.get_nowait()
+        except queue.Empty:
+            pass
+
+    for t in threads:
+        t.join(timeout=1.0)
+
+    return next_seq
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+分片扫描：一个很大的 library（分布在几块盘 / 云盘挂载上）拆给多个进程或多台机器同时扫描，
+每个分片写自己的 SQLite 库，最后 merge 进主库 archive_work.db。
+
+分片（index_archives_v2.py --shard K/N --shard-by top|hash）：
+  top   按 root 下第一层的名字分：子目录整个属于一个分片，walker 直接跳过其它分片的子树（默认）
+  hash  按每个文件相对 root 的路径分：分得更均匀，但每个分片都要遍历整棵目录树
+  分片号 = crc32(相对 root、/ 分隔的路径) % N + 1，和机器、Python 版本无关；
+  各分片要用同一个 --root 写法（full_path 原样合并），分片号记在分片库的 scan_shard 表里。
+
+合并（merge）：每个分片库 ATTACH 到主库，INSERT ... SELECT 批量复制
+  - 分片里 (name, root_path) 相同的 library 合并成主库的一个 library（之前合并过的就沿用）
+  - entries.id 整体加上主库当前的最大 id，archives.archive_entry_id 同样平移
+  - 合并期间去掉 entries / archives 的二级索引，全部分片写完后一次性重建（db_writer.bulk_load_*）
+  - 统计表：分片的统计表直接累加（stats.merge_stats），没有统计表的分片按行计算
+  - 每个分片库一个事务，记入 shard_merge 表；中断后重新运行会跳过已经合并的分片库
+  - scan_checkpoint 非空的分片库扫描还没完成（中断后没有 --resume 跑完），默认拒绝合并，--force 才合并
+
+用法：
+python src/file_indexer/index_archives_v2.py --root "D:\\整理完成" --db shards/s1.db --hash md5 --shard 1/4
+python src/file_indexer/index_archives_v2.py --root "D:\\整理完成" --db shards/s2.db --hash md5 --shard 2/4 --shard-by top
+python src/file_indexer/shard.py merge --db data/workspace/archive_work.db shards/s1.db shards/s2.db shards/s3.db shards/s4.db
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from create_db import SCHEMA_SQL, ensure_columns, require_v1
+from import_csv import add_library
+from stats import merge_stats, open_stats, refresh_summary, stats_exist
+
+SHARD_BY = ("top", "hash")
+
+# 分片库：每个 library 属于哪个分片（扫描时写入）
+SCAN_SHARD_SQL = """
+CREATE TABLE IF NOT EXISTS scan_shard (
+    library_id  INTEGER PRIMARY KEY,
+    shard       INTEGER NOT NULL,
+    shards      INTEGER NOT NULL,
+    shard_by    TEXT NOT NULL
+);
+"""
+
+# 主库：已经合并的分片库
+SHARD_MERGE_SQL = """
+CREATE TABLE IF NOT EXISTS shard_merge (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    shard_db          TEXT NOT NULL,
+    shard_library_id  INTEGER NOT NULL,
+    library_id        INTEGER NOT NULL,
+    shard             INTEGER,
+    shards            INTEGER,
+    shard_by          TEXT,
+    entries           INTEGER,
+    archives          INTEGER,
+    merged_at         TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_shard_merge_db
+    ON shard_merge(shard_db);
+"""
+
+
+# -------------------------------------------------------------
+# 分片规则（扫描时 walker 的 skip）
+# -------------------------------------------------------------
+def parse_shard(text: str):
+    """'2/4' -> (2, 4)；空 -> None"""
+    if not text:
+        return None
+    try:
+        shard, shards = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise ValueError(f"bad --shard {text!r}, expected K/N (e.g. 2/4)")
+    if not 1 <= shard <= shards:
+        raise ValueError(f"bad --shard {text!r}, need 1 <= K <= N")
+    return shard, shards
+
+
+def shard_of(rel: str, shards: int) -> int:
+    """相对 root、/ 分隔的路径 -> 分片号 1..shards"""
+    return zlib.crc32(rel.encode("utf-8")) % shards + 1
+
+
+def make_shard_skip(shard, shard_by: str = "top", then=None):
+    """
+    walker 用的 skip(rel, is_dir)：不属于分片 shard = (K, N) 的文件 / 第一层子目录返回 True。
+    then 为另一个 skip（--resume 的断点），两者任一为 True 就跳过。
+    """
+    k, n = shard
+
+    def skip(rel: str, is_dir: bool) -> bool:
+        if shard_by == "top":
+            # 第一层以下的路径能走到这里，说明它的第一层目录属于本分片
+            mine = "/" in rel or shard_of(rel, n) == k
+        else:
+            mine = is_dir or shard_of(rel, n) == k
+        return not mine or (then is not None and then(rel, is_dir))
+    return skip
+
+
+def record_shard(conn, library_ids, shard, shard_by: str):
+    """扫描开始时（和 add_library 一样）记下这些 library 属于哪个分片"""
+    conn.executescript(SCAN_SHARD_SQL)
+    conn.executemany("INSERT OR REPLACE INTO scan_shard (library_id, shard, shards, shard_by) VALUES (?, ?, ?, ?)",
+                     [(i, shard[0], shard[1], shard_by) for i in library_ids])
+    conn.commit()
+
+
+# -------------------------------------------------------------
+# merge
+# -------------------------------------------------------------
+def _columns(conn, schema: str, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _shard_libraries(conn) -> list:
+    """ATTACH 为 shard 的库里的 library：[(id, name, root_path, note, shard, shards, shard_by), ...]"""
+    has_shard = conn.execute("SELECT 1 FROM shard.sqlite_master WHERE name = 'scan_shard'").fetchone()
+    if has_shard:
+        return conn.execute("""
+            SELECT l.id, l.name, l.root_path, l.note, s.shard, s.shards, s.shard_by
+            FROM shard.library l LEFT JOIN shard.scan_shard s ON s.library_id = l.id
+            ORDER BY l.id
+        """).fetchall()
+    return [row + (None, None, None) for row in
+            conn.execute("SELECT id, name, root_path, note FROM shard.library ORDER BY id")]
+
+
+def _target_library(conn, targets: dict, name: str, root_path: str, note) -> int:
+    """(name, root_path) -> 主库 library_id：本次已建 / 以前合并时建的，否则新建"""
+    key = (name, root_path)
+    if key not in targets:
+        row = conn.execute("""
+            SELECT m.library_id FROM shard_merge m JOIN library l ON l.id = m.library_id
+            WHERE l.name = ? AND l.root_path = ?
+            ORDER BY m.id DESC LIMIT 1
+        """, key).fetchone()
+        targets[key] = row[0] if row else add_library(conn, name, root_path, note)
+    return targets[key]
+
+
+def _check_shards(conn, plan: dict):
+    """plan: {main library_id: {(shard, shards, shard_by), ...}}；缺少 / 重复的分片给出警告"""
+    for library_id, specs in plan.items():
+        done = conn.execute("SELECT shard, shards, shard_by FROM shard_merge WHERE library_id = ?",
+                            (library_id,)).fetchall()
+        seen = defaultdict(int)
+        for spec in list(specs) + [tuple(r) for r in done]:
+            if spec[0] is not None:
+                seen[spec] += 1
+        ways = {(n, by) for _, n, by in seen}
+        if len(ways) > 1:
+            print(f"[WARN] library_id={library_id}: shards with different N / --shard-by: {sorted(ways)}",
+                  file=sys.stderr)
+        for n, by in ways:
+            got = {k for k, n2, by2 in seen if (n2, by2) == (n, by)}
+            missing = sorted(set(range(1, n + 1)) - got)
+            if missing:
+                print(f"[WARN] library_id={library_id}: shards {missing} of {n} ({by}) not merged yet",
+                      file=sys.stderr)
+        for (k, n, by), count in seen.items():
+            if count > 1:
+                print(f"[WARN] library_id={library_id}: shard {k}/{n} ({by}) merged {count} times",
+                      file=sys.stderr)
+
+
+def _unfinished_scan(conn) -> bool:
+    """ATTACH 为 shard 的库还有扫描断点：扫描被中断过、还没有用 --resume 跑完"""
+    has_table = conn.execute("SELECT 1 FROM shard.sqlite_master WHERE name = 'scan_checkpoint'").fetchone()
+    return bool(has_table) and conn.execute("SELECT 1 FROM shard.scan_checkpoint LIMIT 1").fetchone() is not None
+
+
+def merge_shards(db_path: str, shard_dbs, defer_indexes: bool = True, force: bool = False) -> dict:
+    """把分片库合并进 db_path（不存在时新建），返回计数；force: 扫描没有完成的分片库也合并"""
+    # db_writer -> index_archives_v2 -> shard，这里延迟导入避免循环
+    from db_writer import bulk_load_begin, bulk_load_end
+
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    totals = {"shards": 0, "skipped": 0, "libraries": 0, "entries": 0, "archives": 0}
+    try:
+        require_v1(conn, db_path)
+        conn.executescript(SCHEMA_SQL)
+        ensure_columns(conn)
+        conn.executescript(SHARD_MERGE_SQL)
+        index_stats = open_stats(conn)
+        main_entries = _columns(conn, "main", "entries")
+        main_archives = _columns(conn, "main", "archives")
+
+        # ---- 先检查所有分片库（出错时主库还没有改动），再确定 library 的对应关系
+        found, paths = [], set()
+        for shard_db in shard_dbs:
+            path = str(Path(shard_db).resolve())
+            if not Path(path).exists():
+                raise SystemExit(f"[ERROR] shard DB not found: {shard_db}")
+            if path == str(Path(db_path).resolve()):
+                raise SystemExit(f"[ERROR] shard DB is the target DB: {shard_db}")
+            if path in paths or conn.execute("SELECT 1 FROM shard_merge WHERE shard_db = ? LIMIT 1",
+                                             (path,)).fetchone():
+                print(f"[INFO] already merged, skipped: {shard_db}")
+                totals["skipped"] += 1
+                continue
+            paths.add(path)
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                kind = conn.execute("SELECT type FROM shard.sqlite_master WHERE name = 'entries'").fetchone()
+                if not kind or kind[0] != "table":
+                    raise SystemExit(f"[ERROR] {shard_db} is not a v1 index database")
+                if _unfinished_scan(conn):
+                    if not force:
+                        raise SystemExit(f"[ERROR] {shard_db} has an unfinished scan (scan_checkpoint is not empty); "
+                                         f"finish it with --resume, or pass --force to merge it anyway")
+                    print(f"[WARN] merging unfinished scan (--force): {shard_db}", file=sys.stderr)
+                libs = _shard_libraries(conn)
+                has_stats = stats_exist(conn, "shard")
+            finally:
+                conn.execute("DETACH DATABASE shard")
+            found.append((shard_db, path, libs, has_stats))
+
+        jobs, targets, plan = [], {}, defaultdict(set)
+        for shard_db, path, libs, has_stats in found:
+            library_map, specs = {}, {}
+            for lib_id, name, root_path, note, k, n, by in libs:
+                library_map[lib_id] = _target_library(conn, targets, name, root_path, note)
+                specs[lib_id] = (k, n, by)
+                plan[library_map[lib_id]].add((k, n, by))
+            jobs.append((shard_db, path, library_map, specs, has_stats))
+        _check_shards(conn, plan)
+        totals["libraries"] = len(targets)
+        if not jobs:
+            print("[DONE] nothing to merge")
+            return totals
+
+        # ---- 批量复制：去掉二级索引，每个分片库一个事务
+        dropped = bulk_load_begin(conn, defer_indexes=defer_indexes)
+        t0 = time.time()
+        merged_stats = False
+        for shard_db, path, library_map, specs, has_stats in jobs:
+            t = time.time()
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                entry_cols = [c for c in _columns(conn, "shard", "entries")
+                              if c in main_entries and c not in ("id", "library_id")]
+                archive_cols = [c for c in _columns(conn, "shard", "archives")
+                                if c in main_archives and c not in ("id", "library_id", "archive_entry_id")]
+                offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.entries").fetchone()[0]
+                cols_e, cols_a = ", ".join(entry_cols), ", ".join(archive_cols)
+                n_entries = n_archives = 0
+                log = []
+                for old, new in library_map.items():
+                    n_e = conn.execute(f"""
+                        INSERT INTO main.entries (id, library_id, {cols_e})
+                        SELECT id + ?, ?, {cols_e} FROM shard.entries WHERE library_id = ?
+                    """, (offset, new, old)).rowcount
+                    n_a = conn.execute(f"""
+                        INSERT INTO main.archives (library_id, archive_entry_id, {cols_a})
+                        SELECT ?, archive_entry_id + ?, {cols_a} FROM shard.archives WHERE library_id = ?
+                    """, (new, offset, old)).rowcount
+                    n_entries += n_e
+                    n_archives += n_a
+                    log.append((path, old, new, *specs[old], n_e, n_a,
+                                datetime.now().isoformat(timespec="seconds")))
+                if has_stats:
+                    merge_stats(conn, "shard", library_map)
+                    merged_stats = True
+                else:
+                    last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.entries").fetchone()[0]
+                    index_stats.add_query(conn, "id > ? AND id <= ?", (offset, last))
+                conn.executemany("""
+                    INSERT INTO shard_merge (shard_db, shard_library_id, library_id, shard, shards, shard_by,
+                                             entries, archives, merged_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, log)
+                index_stats.commit(conn)
+            finally:
+                conn.execute("DETACH DATABASE shard")
+            totals["shards"] += 1
+            totals["entries"] += n_entries
+            totals["archives"] += n_archives
+            print(f"  {shard_db}: entries {n_entries} | archives {n_archives} | "
+                  f"library_id {sorted(set(library_map.values()))} | {time.time() - t:.1f}s")
+
+        if merged_stats:
+            refresh_summary(conn)
+            conn.commit()
+        t = time.time()
+        bulk_load_end(conn, dropped)
+        if dropped:
+            print(f"[INFO] {len(dropped)} indexes rebuilt in {time.time() - t:.1f}s")
+        elapsed = time.time() - t0
+        rate = totals["entries"] / elapsed if elapsed > 0 else 0.0
+        print(f"[DONE] shards: {totals['shards']} (skipped {totals['skipped']}) | "
+              f"libraries: {totals['libraries']} | entries: {totals['entries']} | "
+              f"archives: {totals['archives']} | {rate:.0f} entries/sec | {elapsed:.1f}s")
+        return totals
+    finally:
+        conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge shard databases written by index_archives_v2.py --shard")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    m = sub.add_parser("merge", help="Merge shard DBs into the main DB")
+    m.add_argument("--db", default="archive_work.db", help="Main DB (created if missing)")
+    m.add_argument("--keep-indexes", action="store_true",
+                   help="不删除 / 重建索引（主库很大、分片很小时更快）")
+    m.add_argument("--force", action="store_true",
+                   help="扫描中断过、还没有 --resume 跑完的分片库（scan_checkpoint 非空）也合并")
+    m.add_argument("shard_dbs", nargs="+", help="Shard DB files")
+    args = ap.parse_args()
+
+    if args.cmd == "merge":
+        merge_shards(args.db, args.shard_dbs, not args.keep_indexes, args.force)
+
+
+if __name__ == "__main__":
+    main()
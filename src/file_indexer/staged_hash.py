@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Size-first 多阶段 hash（用于去重）：
+
+  阶段 1：只记录 size_bytes（扫描时完成，不读文件内容）
+  阶段 2：只对 size 有冲突的文件计算 partial hash（头 + 尾各 N 字节）
+  阶段 3：只对 (size, partial hash) 仍冲突的文件计算完整 hash
+
+结果：
+  - hash_value   只在阶段 3 算过的文件上有值（Dup_Check.sql 只看这些，结果不变）
+  - partial_hash 阶段 2 的结果
+  - hash_algo    只要跑过任意阶段就填写算法名
+
+阶段 1 的行先写到临时 CSV，只在内存里保留 size 计数 / 候选文件的 partial hash，
+20M+ 行也不会把整个 entries 表放进内存。
+"""
+
+import csv
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+from hashers import hash_file, new_hasher
+from scan_pipeline import run_pipeline
+
+PARTIAL_BLOCK_DEFAULT = 64 * 1024
+
+
+# -------------------------------------------------------------
+# 头 + 尾 partial hash
+# -------------------------------------------------------------
+def partial_hash(path: Path, method: str, size: int, block: int = PARTIAL_BLOCK_DEFAULT) -> str:
+    """
+    读取文件开头和结尾各 block 字节（文件较小时只读一次），连同 size 一起 hash。
+    """
+    h = new_hasher(method)
+    h.update(str(size).encode("ascii"))
+    h.update(b"\0")
+    with open(path, "rb") as f:
+        head = f.read(block)
+        h.update(head)
+        if size > 2 * block:
+            f.seek(size - block)
+            h.update(f.read(block))
+        elif size > block:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _map(items, fn, consume, workers: int):
+    """按输入顺序对每个 fn(item) 调用 consume，workers > 0 时走并行流水线。"""
+    if workers and workers > 0:
+        run_pipeline(items, fn, consume, workers)
+    else:
+        for item in items:
+            consume(fn(item))
+
+
+def _read_rows(path: Path):
+    with path.open(newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        yield header
+        for row in reader:
+            yield row
+
+
+# -------------------------------------------------------------
+# 阶段 2 / 3（与输出格式无关）
+# -------------------------------------------------------------
+def staged_hashes(candidates, hash_method: str, workers: int = 0,
+                  block: int = PARTIAL_BLOCK_DEFAULT):
+    """
+    candidates: 可迭代的 (full_path, size)，只包含 size 有冲突的文件
+
+    返回 (partials, fulls, stats)：
+      partials: full_path -> partial hash
+      fulls   : full_path -> 完整 hash（只对 (size, partial) 冲突的文件）
+    """
+    stats = {
+        "size_candidates": 0,
+        "partial_hashed": 0,
+        "full_hashed": 0,
+        "bytes_read": 0,
+        "errors": 0,
+    }
+
+    # ---- 阶段 2：size 冲突 -> partial hash
+    def do_partial(item):
+        path, size = item
+        try:
+            return path, size, partial_hash(Path(path), hash_method, size, block)
+        except Exception as ex:
+            print(f"[ERROR] partial hash: {path}", file=sys.stderr)
+            print(ex, file=sys.stderr)
+            return path, size, ""
+
+    partial_keys = {}
+    partial_counts = Counter()
+
+    def keep_partial(res):
+        path, size, ph = res
+        stats["size_candidates"] += 1
+        if not ph:
+            stats["errors"] += 1
+            return
+        stats["partial_hashed"] += 1
+        stats["bytes_read"] += min(size, 2 * block)
+        partial_keys[path] = (size, ph)
+        partial_counts[(size, ph)] += 1
+
+    _map(candidates, do_partial, keep_partial, workers)
+
+    # ---- 阶段 3：(size, partial) 冲突 -> 完整 hash
+    def full_candidates():
+        for path, key in partial_keys.items():
+            if partial_counts[key] > 1:
+                yield path, key[0]
+
+    def do_full(item):
+        path, size = item
+        try:
+            return path, size, hash_file(path, hash_method)
+        except Exception as ex:
+            print(f"[ERROR] full hash: {path}", file=sys.stderr)
+            print(ex, file=sys.stderr)
+            return path, size, ""
+
+    fulls = {}
+
+    def keep_full(res):
+        path, size, fh = res
+        if not fh:
+            stats["errors"] += 1
+            return
+        stats["full_hashed"] += 1
+        stats["bytes_read"] += size
+        fulls[path] = fh
+
+    _map(full_candidates(), do_full, keep_full, workers)
+
+    partials = {path: key[1] for path, key in partial_keys.items()}
+    return partials, fulls, stats
+
+
+# -------------------------------------------------------------
+# CSV：阶段 1 临时 CSV -> 最终 entries CSV
+# -------------------------------------------------------------
+def finalize_staged_hashes(stage1_csv: Path,
+                           entries_out: Path,
+                           sizes: Counter,
+                           hash_method: str,
+                           workers: int = 0,
+                           block: int = PARTIAL_BLOCK_DEFAULT):
+    """
+    stage1_csv : 阶段 1 写出的 entries CSV（hash 列为空）
+    entries_out: 最终 entries CSV
+    sizes      : size_bytes -> 文件数
+
+    返回 (partials, fulls, stats)，见 staged_hashes()。
+    """
+    rows = _read_rows(stage1_csv)
+    header = next(rows)
+    col = {name: i for i, name in enumerate(header)}
+    i_path, i_size = col["full_path"], col["size_bytes"]
+
+    def candidates():
+        for row in rows:
+            size = int(row[i_size])
+            if sizes[size] > 1:
+                yield row[i_path], size
+
+    partials, fulls, stats = staged_hashes(candidates(), hash_method, workers, block)
+
+    # ---- 写最终 CSV
+    i_algo, i_hash, i_partial = col["hash_algo"], col["hash_value"], col["partial_hash"]
+    tmp_out = entries_out.with_name(entries_out.name + ".tmp")
+    with tmp_out.open("w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        rows = _read_rows(stage1_csv)
+        writer.writerow(next(rows))
+        for row in rows:
+            path = row[i_path]
+            ph = partials.get(path, "")
+            fh = fulls.get(path, "")
+            row[i_partial] = ph
+            row[i_hash] = fh
+            row[i_algo] = hash_method if (ph or fh) else ""
+            writer.writerow(row)
+    os.replace(tmp_out, entries_out)
+
+    return partials, fulls, stats
+
+
+# -------------------------------------------------------------
+# SQLite：直接更新 entries 表
+# -------------------------------------------------------------
+def db_size_candidates(conn, library_id: int, sizes: Counter) -> list:
+    """
+    从 entries 表中取出 size 有冲突的文件 [(full_path, size), ...]。
+    返回 list 而不是生成器：sqlite 连接不能在流水线的 walker 线程里使用。
+    """
+    cur = conn.execute(
+        "SELECT full_path, size_bytes FROM entries WHERE library_id = ? AND is_dir = 0",
+        (library_id,),
+    )
+    return [(path, size) for path, size in cur if sizes[size] > 1]
+
+
+def apply_staged_hashes_db(conn, library_id: int, partials: dict, fulls: dict, hash_method: str):
+    """把 staged_hashes() 的结果写回 entries（按 full_path 定位，调用方负责 commit）。"""
+    # +library_id：强制走 idx_entries_full_path，而不是扫描整个 library
+    conn.executemany("""
+        UPDATE entries
+        SET hash_algo = ?, partial_hash = ?, hash_value = ?
+        WHERE +library_id = ? AND full_path = ?
+    """, (
+        (hash_method, ph, fulls.get(path), library_id, path)
+        for path, ph in partials.items()
+    ))
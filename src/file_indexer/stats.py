@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+统计汇总表：写 entries 的同时增量维护，stats_report.py 直接查这几张小表，不用对 entries 做全表 GROUP BY。
+
+  stats_ext          library × 扩展名：文件数 / 字节数 / 压缩包数
+  stats_dirs         library × 目录（与 parent_path 相同的相对路径，根目录为 '.'）：
+                     直接位于该目录的文件数 / 字节数 + 整个子树的合计
+  stats_hash_groups  (size_bytes, hash_value) -> 文件数（跨所有 library，和 Dup_Check 一样按 size + hash 分组）
+  stats_summary      已 hash 的文件数 / 字节数，重复组数，多余的副本数，可节省的字节数
+
+只统计 is_dir = 0 AND is_deleted = 0 的行；hash_value 为空的文件（dedupe 模式下 size 唯一的文件）不进 hash 分组。
+
+写入方（扫描 --db、import_csv、reindex、watch、delete_exec）用 StatsDelta 在内存里累计变化，
+在自己提交事务之前 flush，统计和数据在同一个事务里提交：
+
+    stats = open_stats(conn)              # 表不存在时创建，并从已有 entries 一次性全量计算
+    stats.add(library_id, parent_path, ext, size, hash_value, is_archive)   # 新插入的行
+    stats.add_id(cur, entry_id, -1) ... UPDATE ... stats.add_id(cur, entry_id, +1)   # 原地修改的行
+    stats.commit(conn)                    # flush + conn.commit()
+
+其它方式改过 entries（手写 SQL、sql/db_manipulate.sql）之后用 stats_report.py --rebuild 重新全量计算。
+"""
+
+import time
+from collections import defaultdict
+
+STATS_SQL = """
+CREATE TABLE IF NOT EXISTS stats_ext (
+    library_id  INTEGER NOT NULL,
+    ext         TEXT    NOT NULL,          -- '' = 没有扩展名
+    files       INTEGER NOT NULL DEFAULT 0,
+    bytes       INTEGER NOT NULL DEFAULT 0,
+    archives    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (library_id, ext)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_dirs (
+    library_id    INTEGER NOT NULL,
+    dir           TEXT    NOT NULL,        -- 相对 root，和 entries.parent_path 相同；根目录为 '.'
+    depth         INTEGER NOT NULL,        -- '.' = 0
+    files         INTEGER NOT NULL DEFAULT 0,
+    bytes         INTEGER NOT NULL DEFAULT 0,
+    subtree_files INTEGER NOT NULL DEFAULT 0,
+    subtree_bytes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (library_id, dir)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_stats_dirs_depth
+    ON stats_dirs(library_id, depth, subtree_bytes);
+
+CREATE TABLE IF NOT EXISTS stats_hash_groups (
+    size_bytes  INTEGER NOT NULL,
+    hash_value  TEXT    NOT NULL,
+    files       INTEGER NOT NULL,
+    PRIMARY KEY (size_bytes, hash_value)
+) WITHOUT ROWID;
+
+-- 按可节省字节数排序的重复组（只含 files > 1 的组）
+CREATE INDEX IF NOT EXISTS idx_stats_hash_savings
+    ON stats_hash_groups((files - 1) * size_bytes) WHERE files > 1;
+
+CREATE TABLE IF NOT EXISTS stats_summary (
+    name   TEXT PRIMARY KEY,               -- hashed_files / hashed_bytes / dup_groups / dup_files / dup_bytes
+    value  INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+STATS_TABLES = ("stats_ext", "stats_dirs", "stats_hash_groups", "stats_summary")
+SUMMARY_NAMES = ("hashed_files", "hashed_bytes", "dup_groups", "dup_files", "dup_bytes")
+
+# add_id / add_query 读取的列
+STATS_COLUMNS = "library_id, parent_path, ext, size_bytes, hash_value, is_archive, is_dir, is_deleted"
+
+# 由 stats_hash_groups 得出 stats_summary（全量计算 / 合并分片之后）
+SUMMARY_SQL = """
+    INSERT INTO stats_summary (name, value)
+    SELECT 'hashed_files', COALESCE(SUM(files), 0) FROM stats_hash_groups
+    UNION ALL SELECT 'hashed_bytes', COALESCE(SUM(files * size_bytes), 0) FROM stats_hash_groups
+    UNION ALL SELECT 'dup_groups', COUNT(*) FROM stats_hash_groups WHERE files > 1
+    UNION ALL SELECT 'dup_files', COALESCE(SUM(files - 1), 0) FROM stats_hash_groups WHERE files > 1
+    UNION ALL SELECT 'dup_bytes', COALESCE(SUM((files - 1) * size_bytes), 0) FROM stats_hash_groups
+              WHERE files > 1
+"""
+
+
+def _ancestors(d: str) -> list:
+    """'a/b/c' -> ['.', 'a', 'a/b', 'a/b/c']（保留原来的分隔符，\\ 和 / 都认）"""
+    if d in (".", ""):
+        return ["."]
+    out = ["."]
+    for i, ch in enumerate(d):
+        if ch in "\\/":
+            out.append(d[:i])
+    out.append(d)
+    return out
+
+
+def _depth(d: str) -> int:
+    return 0 if d in (".", "") else d.count("\\") + d.count("/") + 1
+
+
+def _group_summary(files: int, size: int) -> dict:
+    """一个 (size, hash) 组对 stats_summary 的贡献"""
+    extra = max(files - 1, 0)
+    return {"hashed_files": files, "hashed_bytes": files * size,
+            "dup_groups": 1 if files > 1 else 0, "dup_files": extra, "dup_bytes": extra * size}
+
+
+class StatsDelta:
+    """一个事务内对统计表的累计变化（只在单个 writer 线程里使用）"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ext = defaultdict(lambda: [0, 0, 0])        # (library_id, ext) -> [files, bytes, archives]
+        self.dirs = defaultdict(lambda: [0, 0, 0, 0])    # (library_id, dir) -> [files, bytes, sub_files, sub_bytes]
+        self.groups = defaultdict(int)                   # (size, hash) -> files
+
+    def add(self, library_id: int, parent_path: str, ext, size, hash_value, is_archive, sign: int = 1):
+        """一个（未删除的）文件行加入（sign=1）或移出（sign=-1）统计"""
+        size = size or 0
+        e = self.ext[(library_id, ext or "")]
+        e[0] += sign
+        e[1] += sign * size
+        e[2] += sign if is_archive else 0
+        parent_path = parent_path or "."
+        d = self.dirs[(library_id, parent_path)]
+        d[0] += sign
+        d[1] += sign * size
+        for a in _ancestors(parent_path):
+            d = self.dirs[(library_id, a)]
+            d[2] += sign
+            d[3] += sign * size
+        if hash_value:
+            self.groups[(size, hash_value)] += sign
+
+    def add_row(self, row, sign: int = 1):
+        """row = STATS_COLUMNS 顺序的一行；目录和已删除的行不计"""
+        library_id, parent_path, ext, size, hash_value, is_archive, is_dir, is_deleted = row
+        if not is_dir and not is_deleted:
+            self.add(library_id, parent_path, ext, size, hash_value, is_archive, sign)
+
+    def add_id(self, cur, entry_id, sign: int = 1):
+        """按 entries 中的当前值计入：修改前 sign=-1，修改后 sign=+1"""
+        if entry_id is None:
+            return
+        row = cur.execute(f"SELECT {STATS_COLUMNS} FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        if row is not None:
+            self.add_row(row, sign)
+
+    def add_query(self, cur, where: str, params=(), sign: int = 1):
+        """把 WHERE 条件选中的行按当前值计入（批量 UPDATE 之前 / 之后调用）"""
+        for row in cur.execute(f"SELECT {STATS_COLUMNS} FROM entries WHERE {where}", params):
+            self.add_row(row, sign)
+
+    def flush(self, conn):
+        """把累计的变化写进统计表（不提交）"""
+        if not (self.ext or self.dirs or self.groups):
+            return
+        ext = [(k[0], k[1], v[0], v[1], v[2]) for k, v in self.ext.items() if any(v)]
+        conn.executemany("""
+            INSERT INTO stats_ext (library_id, ext, files, bytes, archives) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (library_id, ext) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                archives = archives + excluded.archives
+        """, ext)
+        conn.executemany("DELETE FROM stats_ext WHERE library_id = ? AND ext = ? AND files <= 0",
+                         [(lib, e) for lib, e, *_ in ext])
+
+        dirs = [(k[0], k[1], _depth(k[1]), v[0], v[1], v[2], v[3]) for k, v in self.dirs.items() if any(v)]
+        conn.executemany("""
+            INSERT INTO stats_dirs (library_id, dir, depth, files, bytes, subtree_files, subtree_bytes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (library_id, dir) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                subtree_files = subtree_files + excluded.subtree_files,
+                subtree_bytes = subtree_bytes + excluded.subtree_bytes
+        """, dirs)
+        conn.executemany("DELETE FROM stats_dirs WHERE library_id = ? AND dir = ? AND subtree_files <= 0",
+                         [(lib, d) for lib, d, *_ in dirs])
+
+        # hash 分组：组的文件数跨过 1 时重复数 / 可节省字节数才变化，需要旧值
+        summary = dict.fromkeys(SUMMARY_NAMES, 0)
+        upserts, deletes = [], []
+        for (size, h), n in self.groups.items():
+            if not n:
+                continue
+            row = conn.execute("SELECT files FROM stats_hash_groups WHERE size_bytes = ? AND hash_value = ?",
+                               (size, h)).fetchone()
+            old = row[0] if row else 0
+            new = max(old + n, 0)
+            before, after = _group_summary(old, size), _group_summary(new, size)
+            for k in SUMMARY_NAMES:
+                summary[k] += after[k] - before[k]
+            if new:
+                upserts.append((size, h, new))
+            elif row:
+                deletes.append((size, h))
+        conn.executemany("INSERT OR REPLACE INTO stats_hash_groups (size_bytes, hash_value, files) VALUES (?, ?, ?)",
+                         upserts)
+        conn.executemany("DELETE FROM stats_hash_groups WHERE size_bytes = ? AND hash_value = ?", deletes)
+        conn.executemany("""
+            INSERT INTO stats_summary (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+        """, [(k, v) for k, v in summary.items() if v])
+        self.clear()
+
+    def commit(self, conn):
+        self.flush(conn)
+        conn.commit()
+
+
+# -------------------------------------------------------------
+# 创建 / 全量计算
+# -------------------------------------------------------------
+def stats_exist(conn, schema: str = "main") -> bool:
+    marks = ",".join("?" for _ in STATS_TABLES)
+    n = conn.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master WHERE type = 'table' AND name IN ({marks})",
+                     STATS_TABLES).fetchone()[0]
+    return n == len(STATS_TABLES)
+
+
+def create_stats_tables(conn):
+    """逐条执行 STATS_SQL（executescript 会先提交当前事务，--check 需要能回滚）"""
+    for stmt in STATS_SQL.split(";"):
+        if stmt.strip():
+            conn.execute(stmt)
+
+
+def rebuild_stats(conn) -> float:
+    """清空统计表并从 entries 全量计算（一次全表 GROUP BY），返回耗时秒数；不提交"""
+    t0 = time.perf_counter()
+    create_stats_tables(conn)
+    for table in STATS_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+
+    conn.execute("""
+        INSERT INTO stats_ext (library_id, ext, files, bytes, archives)
+        SELECT library_id, COALESCE(ext, ''), COUNT(*), COALESCE(SUM(size_bytes), 0), SUM(is_archive <> 0)
+        FROM entries
+        WHERE is_dir = 0 AND is_deleted = 0
+        GROUP BY library_id, COALESCE(ext, '')
+    """)
+
+    # 每个目录的直接合计来自 GROUP BY，子树合计在内存里累加到各级上级目录
+    dirs = defaultdict(lambda: [0, 0, 0, 0])
+    for library_id, parent_path, files, size in conn.execute("""
+        SELECT library_id, COALESCE(NULLIF(parent_path, ''), '.'), COUNT(*), COALESCE(SUM(size_bytes), 0)
+        FROM entries
+        WHERE is_dir = 0 AND is_deleted = 0
+        GROUP BY library_id, COALESCE(NULLIF(parent_path, ''), '.')
+    """):
+        d = dirs[(library_id, parent_path)]
+        d[0] += files
+        d[1] += size
+        for a in _ancestors(parent_path):
+            d = dirs[(library_id, a)]
+            d[2] += files
+            d[3] += size
+    conn.executemany("""
+        INSERT INTO stats_dirs (library_id, dir, depth, files, bytes, subtree_files, subtree_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, ((k[0], k[1], _depth(k[1]), *v) for k, v in dirs.items()))
+
+    conn.execute("""
+        INSERT INTO stats_hash_groups (size_bytes, hash_value, files)
+        SELECT COALESCE(size_bytes, 0), hash_value, COUNT(*)
+        FROM entries
+        WHERE is_dir = 0 AND is_deleted = 0 AND hash_value <> ''
+        GROUP BY COALESCE(size_bytes, 0), hash_value
+    """)
+    conn.execute(SUMMARY_SQL)
+    return time.perf_counter() - t0
+
+
+def merge_stats(conn, schema: str, library_map: dict):
+    """
+    把 ATTACH 进来的库（schema）的统计表累加进主库（shard.py merge 用），不提交。
+    library_map = {schema 里的 library_id: 主库的 library_id}，必须包含 schema 里全部 library；
+    之后要用 refresh_summary() 重新计算 stats_summary。
+    """
+    for old, new in library_map.items():
+        conn.execute(f"""
+            INSERT INTO main.stats_ext (library_id, ext, files, bytes, archives)
+            SELECT ?, ext, files, bytes, archives FROM {schema}.stats_ext WHERE library_id = ?
+            ON CONFLICT (library_id, ext) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                archives = archives + excluded.archives
+        """, (new, old))
+        conn.execute(f"""
+            INSERT INTO main.stats_dirs (library_id, dir, depth, files, bytes, subtree_files, subtree_bytes)
+            SELECT ?, dir, depth, files, bytes, subtree_files, subtree_bytes
+            FROM {schema}.stats_dirs WHERE library_id = ?
+            ON CONFLICT (library_id, dir) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                subtree_files = subtree_files + excluded.subtree_files,
+                subtree_bytes = subtree_bytes + excluded.subtree_bytes
+        """, (new, old))
+    conn.execute(f"""
+        INSERT INTO main.stats_hash_groups (size_bytes, hash_value, files)
+        SELECT size_bytes, hash_value, files FROM {schema}.stats_hash_groups WHERE true
+        ON CONFLICT (size_bytes, hash_value) DO UPDATE SET files = files + excluded.files
+    """)
+
+
+def refresh_summary(conn):
+    """按 stats_hash_groups 重新计算 stats_summary，不提交"""
+    conn.execute("DELETE FROM stats_summary")
+    conn.execute(SUMMARY_SQL)
+
+
+def open_stats(conn) -> StatsDelta:
+    """统计表不存在时创建，库里已经有数据就先全量计算一次（并提交）"""
+    if not stats_exist(conn):
+        if conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is None:
+            create_stats_tables(conn)
+        else:
+            print("[INFO] building statistics tables from existing entries (one time)...", flush=True)
+            print(f"[INFO] statistics tables built in {rebuild_stats(conn):.1f}s", flush=True)
+        conn.commit()
+    return StatsDelta()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+库的统计报表：按扩展名 / 目录 / 设备 / library 的文件数和大小，重复率和可节省的空间。
+
+只查 stats.py 维护的汇总表（扫描 --db、import_csv、reindex、watch、delete_exec 写 entries 时增量更新），
+不对 entries 做全表 GROUP BY，几千万行的库也是毫秒级。统计表不存在时第一次运行会全量计算一次。
+
+报表（--report）：
+  summary  每个 library 的文件数 / 大小 / 压缩包数 + 重复汇总（默认）
+  ext      library × 扩展名，按大小降序
+  dir      --depth N 层的目录（子树合计），或 --dir PATH 的直接子目录
+  device   按 library 根目录所在设备（盘符 / 挂载点）汇总
+  dups     可节省空间最多的重复组（size + hash，和 Dup_Check 的分组相同）
+
+用法：
+python src/file_indexer/stats_report.py --db data/workspace/archive_work.db
+python src/file_indexer/stats_report.py --db ... --report ext --library-id 1 --top 20 --out "D:\\ext_stats.csv"
+python src/file_indexer/stats_report.py --db ... --report dir --library-id 1 --dir "作业\\BGM"
+python src/file_indexer/stats_report.py --db ... --report dups --top 50
+python src/file_indexer/stats_report.py --db ... --rebuild      # 用 SQL 改过 entries 之后重新全量计算
+python src/file_indexer/stats_report.py --db ... --check        # 对比增量结果和全量计算
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from io_scheduler import device_kind
+from stats import STATS_TABLES, SUMMARY_NAMES, open_stats, rebuild_stats
+
+REPORTS = ["summary", "ext", "dir", "device", "dups"]
+TOP_DEFAULT = 30
+
+
+def _scope(library_ids, column="library_id"):
+    if not library_ids:
+        return "", []
+    marks = ",".join("?" for _ in library_ids)
+    return f" AND {column} IN ({marks})", list(library_ids)
+
+
+def _fmt_size(n) -> str:
+    n = float(n or 0)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(n) < 1024 or unit == "TiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+
+
+def _summary_values(conn) -> dict:
+    values = dict.fromkeys(SUMMARY_NAMES, 0)
+    values.update(conn.execute("SELECT name, value FROM stats_summary"))
+    return values
+
+
+# -------------------------------------------------------------
+# 各报表：返回 (header, rows)
+# -------------------------------------------------------------
+def report_summary(conn, library_ids=None, top: int = TOP_DEFAULT):
+    where, params = _scope(library_ids, "s.library_id")
+    rows = conn.execute(f"""
+        SELECT l.id, l.name, l.root_path, SUM(s.files), SUM(s.bytes), SUM(s.archives)
+        FROM stats_ext s
+        JOIN library l ON l.id = s.library_id
+        WHERE 1 = 1 {where}
+        GROUP BY l.id
+        ORDER BY l.id
+    """, params).fetchall()
+    return ["library_id", "name", "root_path", "files", "bytes", "archives"], rows
+
+
+def report_ext(conn, library_ids=None, top: int = TOP_DEFAULT):
+    where, params = _scope(library_ids)
+    rows = conn.execute(f"""
+        SELECT library_id, ext, files, bytes, archives
+        FROM stats_ext
+        WHERE 1 = 1 {where}
+        ORDER BY bytes DESC
+        LIMIT ?
+    """, params + [top]).fetchall()
+    return ["library_id", "ext", "files", "bytes", "archives"], rows
+
+
+def report_dir(conn, library_ids=None, top: int = TOP_DEFAULT, depth: int = 1, parent: str = None):
+    header = ["library_id", "dir", "depth", "files", "bytes", "subtree_files", "subtree_bytes"]
+    if parent:
+        # parent 的直接子目录：(library_id, dir) 主键上的范围查询
+        parent = parent.strip("\\/")
+        rows = []
+        for library_id in library_ids or [r[0] for r in conn.execute("SELECT id FROM library")]:
+            base = conn.execute("SELECT depth FROM stats_dirs WHERE library_id = ? AND dir = ?",
+                                (library_id, parent)).fetchone()
+            if base is None:
+                continue
+            for sep in "\\/":
+                rows.extend(conn.execute("""
+                    SELECT library_id, dir, depth, files, bytes, subtree_files, subtree_bytes
+                    FROM stats_dirs
+                    WHERE library_id = ? AND dir >= ? AND dir < ? AND depth = ?
+                """, (library_id, parent + sep, parent + chr(ord(sep) + 1), base[0] + 1)))
+        rows.sort(key=lambda r: -r[6])
+        return header, rows[:top]
+    where, params = _scope(library_ids)
+    rows = conn.execute(f"""
+        SELECT library_id, dir, depth, files, bytes, subtree_files, subtree_bytes
+        FROM stats_dirs
+        WHERE depth = ? {where}
+        ORDER BY subtree_bytes DESC
+        LIMIT ?
+    """, [depth] + params + [top]).fetchall()
+    return header, rows
+
+
+def device_of(root: str):
+    """(设备标签, 类型)：Windows 为盘符，其它为 root 所在的挂载点；root 不可访问时用路径开头"""
+    p = Path(root)
+    if p.drive:
+        return p.drive, "unknown"
+    try:
+        st = os.stat(root)
+    except OSError:
+        return p.anchor or root, "offline"
+    mount = os.path.realpath(root)
+    while not os.path.ismount(mount):
+        mount = os.path.dirname(mount)
+    return mount, device_kind(st.st_dev)
+
+
+def report_device(conn, library_ids=None, top: int = TOP_DEFAULT):
+    _, libs = report_summary(conn, library_ids)
+    devices = {}
+    for library_id, _, root_path, files, size, archives in libs:
+        label, kind = device_of(root_path)
+        d = devices.setdefault(label, [label, kind, 0, 0, 0, []])
+        d[2] += files or 0
+        d[3] += size or 0
+        d[4] += archives or 0
+        d[5].append(str(library_id))
+    rows = [(label, kind, files, size, archives, ",".join(ids))
+            for label, kind, files, size, archives, ids in devices.values()]
+    rows.sort(key=lambda r: -r[3])
+    return ["device", "kind", "files", "bytes", "archives", "library_ids"], rows[:top]
+
+
+def report_dups(conn, library_ids=None, top: int = TOP_DEFAULT):
+    """重复组跨所有 library 统计；给出每组的一个示例路径"""
+    groups = conn.execute("""
+        SELECT size_bytes, hash_value, files, (files - 1) * size_bytes
+        FROM stats_hash_groups
+        WHERE files > 1
+        ORDER BY (files - 1) * size_bytes DESC
+        LIMIT ?
+    """, (top,)).fetchall()
+    rows = []
+    for size, h, files, savings in groups:
+        example = conn.execute("""
+            SELECT full_path FROM entries
+            WHERE size_bytes = ? AND hash_value = ? AND is_dir = 0 AND is_deleted = 0
+            LIMIT 1
+        """, (size, h)).fetchone()
+        rows.append((h, size, files, savings, example[0] if example else ""))
+    return ["hash_value", "size_bytes", "files", "savings_bytes", "example_path"], rows
+
+
+# -------------------------------------------------------------
+# 打印 / CSV
+# -------------------------------------------------------------
+SIZE_COLUMNS = {"bytes", "subtree_bytes", "size_bytes", "savings_bytes"}
+
+
+def print_table(header, rows):
+    cells = [[_fmt_size(v) if h in SIZE_COLUMNS else ("" if v is None else str(v))
+              for h, v in zip(header, row)] for row in rows]
+    widths = [max([len(h)] + [len(c[i]) for c in cells]) for i, h in enumerate(header)]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for c in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(c, widths)))
+
+
+def print_dup_summary(conn, library_ids=None):
+    s = _summary_values(conn)
+    where, params = _scope(library_ids)
+    files, size = conn.execute(f"SELECT COALESCE(SUM(files), 0), COALESCE(SUM(bytes), 0) FROM stats_ext "
+                               f"WHERE 1 = 1 {where}", params).fetchone()
+    hashed = s["hashed_files"]
+    ratio = s["dup_files"] * 100.0 / hashed if hashed else 0.0
+    print(f"[STATS] files: {files} ({_fmt_size(size)}) | hashed: {hashed} ({_fmt_size(s['hashed_bytes'])}) | "
+          f"duplicate groups: {s['dup_groups']} | redundant copies: {s['dup_files']} ({ratio:.1f}% of hashed) | "
+          f"potential savings: {_fmt_size(s['dup_bytes'])}")
+    if library_ids:
+        print("[INFO] duplicate figures cover all libraries (groups are size + hash across libraries)")
+
+
+def write_csv(path: str, header, rows):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+    print(f"[DONE] {len(rows)} rows written to {path}")
+
+
+def check_stats(conn) -> int:
+    """对比统计表和全量计算的结果（在事务里算完再回滚），返回不一致的行数"""
+    def snapshot():
+        return {t: set(conn.execute(f"SELECT * FROM {t}")) for t in STATS_TABLES}
+
+    current = snapshot()
+    try:
+        rebuild_stats(conn)
+        fresh = snapshot()
+    finally:
+        conn.rollback()
+    # stats_summary 里值为 0 的名字可能不存在
+    for snap in (current, fresh):
+        snap["stats_summary"] = {r for r in snap["stats_summary"] if r[1]}
+    diff = 0
+    for t in STATS_TABLES:
+        n = len(current[t] ^ fresh[t])
+        if n:
+            print(f"[WARN] {t}: {n} rows differ from a full recount", file=sys.stderr)
+        diff += n
+    return diff
+
+
+def main():
+    ap = argparse.ArgumentParser(description="File counts / sizes by ext, folder and device, duplicate savings")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--report", choices=REPORTS, default="summary")
+    ap.add_argument("--library-id", type=int, action="append", default=[],
+                    help="Only these libraries (repeatable, default: all)")
+    ap.add_argument("--top", type=int, default=TOP_DEFAULT, help=f"Rows to show (default: {TOP_DEFAULT})")
+    ap.add_argument("--depth", type=int, default=1, help="--report dir: folder depth below the root (default: 1)")
+    ap.add_argument("--dir", help="--report dir: show the sub folders of this folder (relative to the root)")
+    ap.add_argument("--out", help="Write the report to CSV")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="Recount the statistics tables from entries (after editing entries with SQL)")
+    ap.add_argument("--check", action="store_true",
+                    help="Compare the statistics tables with a full recount (exit 1 if they differ)")
+    args = ap.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"[ERROR] DB not found: {args.db}", file=sys.stderr)
+        sys.exit(2)
+    conn = sqlite3.connect(args.db)
+    try:
+        open_stats(conn)
+        if args.rebuild:
+            seconds = rebuild_stats(conn)
+            conn.commit()
+            print(f"[DONE] statistics tables rebuilt in {seconds:.1f}s")
+        if args.check:
+            diff = check_stats(conn)
+            if diff:
+                sys.exit(1)
+            print("[INFO] check: statistics tables match a full recount")
+            return
+
+        t0 = time.perf_counter()
+        if args.report == "dir":
+            header, rows = report_dir(conn, args.library_id, args.top, args.depth, args.dir)
+        else:
+            func = {"summary": report_summary, "ext": report_ext, "device": report_device,
+                    "dups": report_dups}[args.report]
+            header, rows = func(conn, args.library_id, args.top)
+        elapsed = time.perf_counter() - t0
+
+        if args.out:
+            write_csv(args.out, header, rows)
+        else:
+            print_table(header, rows)
+        if args.report in ("summary", "dups"):
+            print_dup_summary(conn, args.library_id)
+        print(f"[INFO] {args.report}: {len(rows)} rows in {elapsed * 1000:.1f} ms")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+基于 os.scandir 的目录遍历器（替代 root.rglob("*") + p.is_dir() + p.stat()）
+
+- 复用 DirEntry.is_dir() / DirEntry.stat() 的结果，每个条目最多一次 stat
+- 支持排除规则（fnmatch，匹配文件名或相对路径）和扩展名过滤（--file-exts）
+- 可选 threads > 0：用线程池预取「接下来要访问的目录」的 scandir + stat，
+  网络盘 / FUSE 云盘这类高延迟挂载上可以并发遍历
+- 输出顺序固定（每个目录内按名字排序，先文件后子目录，深度优先），
+  与线程数无关，保证扫描结果可复现
+
+用法（与 rglob 对比 files/sec）：
+python src/file_indexer/walker.py --root "E:\\BGM_Raw" --bench --threads 16
+"""
+
+import argparse
+import fnmatch
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def parse_exts(text: str):
+    """'.mp3,.wav' / 'mp3 wav' -> ('.mp3', '.wav')；空则返回 None（不过滤）"""
+    if not text:
+        return None
+    exts = []
+    for part in text.replace(";", ",").replace(" ", ",").split(","):
+        part = part.strip().lower()
+        if part:
+            exts.append(part if part.startswith(".") else "." + part)
+    return tuple(exts) or None
+
+
+def _excluded(name: str, rel: str, exclude) -> bool:
+    for pat in exclude:
+        if fnmatch.fnmatch(name, pat) or fnmatch.fnmatch(rel, pat):
+            return True
+    return False
+
+
+def is_filtered(rel: str, exclude=(), exts=None) -> bool:
+    """
+    相对路径 rel（用 / 分隔）的文件会不会被 walk_files 的 exclude / exts 过滤掉
+    （任何一级上级目录被 exclude 也算）。reindex / watch 用它区分「被过滤」和「已消失」。
+    """
+    parts = rel.split("/")
+    if exclude:
+        for i, name in enumerate(parts):
+            if _excluded(name, "/".join(parts[:i + 1]), exclude):
+                return True
+    return bool(exts) and not parts[-1].lower().endswith(exts)
+
+
+def _list_dir(path: str, rel: str, exclude, exts, on_error, skip=None):
+    """
+    列出一个目录：返回 (files, dirs)
+      files: [(full_path, stat_result), ...]（已过滤、已排序）
+      dirs : [(full_path, rel_path), ...]   （已过滤、已排序）
+    """
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError as ex:
+        on_error(path, ex)
+        return files, dirs
+
+    for entry in entries:
+        name = entry.name
+        child_rel = f"{rel}/{name}" if rel else name
+        if exclude and _excluded(name, child_rel, exclude):
+            continue
+        try:
+            # 目录不跟随符号链接，避免环
+            if entry.is_dir(follow_symlinks=False):
+                if not (skip and skip(child_rel, True)):
+                    dirs.append((entry.path, child_rel))
+                continue
+        except OSError as ex:
+            on_error(entry.path, ex)
+            continue
+
+        if exts and not name.lower().endswith(exts):
+            continue
+        if skip and skip(child_rel, False):
+            continue
+        try:
+            st = entry.stat()
+        except OSError as ex:
+            on_error(entry.path, ex)
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            # 指向目录的符号链接：和原来的 rglob + is_dir() 一样直接跳过
+            continue
+        files.append((entry.path, st))
+
+    return files, dirs
+
+
+def _print_error(path, ex):
+    print(f"[ERROR] walk: {path}", file=sys.stderr)
+    print(ex, file=sys.stderr)
+
+
+def walk_files(root, exclude=(), exts=None, threads: int = 0, on_error=None, prefetch: int = 0,
+               skip=None):
+    """
+    递归遍历 root 下所有文件，产出 (full_path: str, stat_result)。
+
+    exclude : fnmatch 规则列表，匹配文件/目录名或相对 root 的路径（用 / 分隔）
+    exts    : 只保留这些后缀的文件（小写、带点，例如 ('.mp3', '.tar.gz')），None 表示不过滤
+    threads : > 0 时用线程池预取目录列表
+    prefetch: 最多预取的目录数（默认 threads * 4），限制内存
+    skip    : skip(rel, is_dir) 返回 True 时跳过该文件 / 整个目录（--resume 跳过已完成的部分，见 checkpoint.py）
+    """
+    root = os.fspath(root)
+    exclude = tuple(exclude or ())
+    on_error = on_error or _print_error
+
+    # 栈顶 = 下一个要访问的目录
+    stack = [(root, "")]
+
+    if not threads or threads <= 0:
+        while stack:
+            path, rel = stack.pop()
+            files, dirs = _list_dir(path, rel, exclude, exts, on_error, skip)
+            yield from files
+            stack.extend(reversed(dirs))
+        return
+
+    prefetch = prefetch or threads * 4
+    futures = {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="walk") as pool:
+        try:
+            while stack:
+                # 预取栈顶附近的目录（也就是接下来 DFS 要访问的那些）
+                for path, rel in stack[-prefetch:]:
+                    if path not in futures:
+                        futures[path] = pool.submit(_list_dir, path, rel, exclude, exts, on_error, skip)
+
+                path, rel = stack.pop()
+                files, dirs = futures.pop(path).result()
+                yield from files
+                stack.extend(reversed(dirs))
+        finally:
+            for fut in futures.values():
+                fut.cancel()
+
+
+# -------------------------------------------------------------
+# Benchmark: rglob vs scandir
+# -------------------------------------------------------------
+def _walk_rglob(root: Path):
+    """旧实现：index_archives_v2.scan() 原来的遍历方式"""
+    for p in root.rglob("*"):
+        if p.is_dir():
+            continue
+        yield str(p), p.stat()
+
+
+def bench(root: Path, threads: int, repeat: int = 1):
+    cases = [
+        ("rglob + is_dir + stat", lambda: _walk_rglob(root)),
+        ("scandir", lambda: walk_files(root)),
+    ]
+    if threads and threads > 0:
+        cases.append((f"scandir threads={threads}", lambda: walk_files(root, threads=threads)))
+
+    print(f"[BENCH] root: {root}")
+    for label, fn in cases:
+        best = None
+        count = 0
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            count = sum(1 for _ in fn())
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        rate = count / best if best else 0.0
+        print(f"  {label:<28} files: {count:>10} | {best:8.3f}s | {rate:12.0f} files/sec")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="os.scandir based file walker")
+    ap.add_argument("--root", required=True, help="Root folder to walk")
+    ap.add_argument("--exclude", action="append", default=[],
+                    help="fnmatch pattern to skip (file/dir name or relative path), repeatable")
+    ap.add_argument("--file-exts", default="", help='Only files with these extensions, e.g. ".mp3,.wav"')
+    ap.add_argument("--threads", type=int, default=0, help="Parallel directory listing threads")
+    ap.add_argument("--bench", action="store_true", help="Compare files/sec against rglob")
+    ap.add_argument("--repeat", type=int, default=1, help="Benchmark repetitions (best time wins)")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(Path(args.root), args.threads, args.repeat)
+        return
+
+    for path, st in walk_files(args.root, args.exclude, parse_exts(args.file_exts), args.threads):
+        print(f"{st.st_size}\t{path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+watch 模式（Linux）：用 inotify 监听 library 根目录，只重新处理有变化的路径，SQLite 索引一直保持最新。
+
+- inotify 通过 ctypes 调用 libc（inotify_init1 / inotify_add_watch），不需要额外的服务或模块
+- 每个目录一个 watch；新建 / 移入的目录自动加 watch，并把整个子目录当作「待核对」
+- 去抖动：同一路径在 --debounce 秒内没有新事件才处理（一直在写的文件最多等 --max-delay 秒）
+- 只对有事件的路径重新 stat；size / mtime 没变就不重新 hash、不重新跑 7z（与 reindex.py 相同的判断）
+- 每批最多 --batch 个路径一个事务（entries / archives 的写法与 reindex.py 相同）
+- 删除 / 移出：entries.is_deleted = 1，并删除其 archives 成员行
+- 事件队列溢出（IN_Q_OVERFLOW）或 watch 数达到上限（fs.inotify.max_user_watches）时事件会丢，
+  每 --reconcile-every 秒（以及启动时）跑一次 reindex.py 的全量核对（只 stat，未变化的文件不读内容）
+- --exclude / --file-exts 与首次扫描时相同：被过滤的路径的事件忽略，已有的行保持原样
+
+用法：
+python src/file_indexer/watch.py --db data/workspace/archive_work.db --library-id 1 --hash md5
+python src/file_indexer/watch.py --db ... --library-id 1 --hash md5 --debounce 5 --reconcile-every 21600
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from pathlib import Path
+
+from archive_list import BACKENDS, configure_nested
+from create_db import ensure_columns, require_v1
+from db_writer import mark_deleted, upsert_entry
+from hashers import READ_MODES, configure_io, resolve_algo
+from index_archives_v2 import is_filtered_path, iter_files, process_file
+from reindex import EXISTING_SQL, is_unchanged, reindex
+from stats import open_stats
+from walker import parse_exts
+
+# <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+DEBOUNCE_DEFAULT = 2.0
+MAX_DELAY_DEFAULT = 60.0
+RECONCILE_EVERY_DEFAULT = 3600.0
+BATCH_DEFAULT = 500
+
+
+# -------------------------------------------------------------
+# inotify（ctypes）
+# -------------------------------------------------------------
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+def inotify_open(libc) -> int:
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+    return fd
+
+
+def read_events(fd: int, timeout: float):
+    """等待最多 timeout 秒，产出 (wd, mask, cookie, name)"""
+    r, _, _ = select.select([fd], [], [], max(timeout, 0.0))
+    if not r:
+        return
+    while True:
+        try:
+            buf = os.read(fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        off = 0
+        while off + EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, off)
+            off += EVENT_HEADER.size
+            name = buf[off:off + length].rstrip(b"\0")
+            off += length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+
+def add_watches(libc, fd: int, top: str, wds: dict, paths: dict) -> int:
+    """
+    给 top 及其下所有目录加 watch（wds: wd -> 目录，paths: 目录 -> wd）。
+    返回因为达到 max_user_watches 而没有加上的目录数。
+    """
+    missed = 0
+    stack = [top]
+    while stack:
+        d = stack.pop()
+        wd = libc.inotify_add_watch(fd, os.fsencode(d), WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                missed += 1
+            elif e not in (errno.ENOENT, errno.ENOTDIR):
+                print(f"[ERROR] inotify_add_watch: {d}: {os.strerror(e)}", file=sys.stderr)
+            continue
+        wds[wd] = d
+        paths[d] = wd
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return missed
+
+
+def drop_watches(libc, fd: int, top: str, wds: dict, paths: dict):
+    """目录被删除 / 移出：去掉它及其子目录的 watch"""
+    prefix = top + os.sep
+    for d in [d for d in paths if d == top or d.startswith(prefix)]:
+        wd = paths.pop(d)
+        wds.pop(wd, None)
+        libc.inotify_rm_watch(fd, wd)
+
+
+# -------------------------------------------------------------
+# 应用变化（单个路径 / 一个目录子树）
+# -------------------------------------------------------------
+def _existing(conn, library_id: int, full_path: str):
+    return conn.execute(EXISTING_SQL, (full_path, library_id)).fetchone()
+
+
+def apply_path(conn, cur, library_id: int, root: Path, full_path: str, opts: dict,
+               counters: dict, st=None):
+    if is_filtered_path(full_path, root, opts["exclude"], opts["file_exts"]):
+        return
+    existing = _existing(conn, library_id, full_path)
+    if st is None:
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            st = None
+        if st is not None and not os.path.isfile(full_path):
+            st = None
+
+    if st is None:
+        if existing is not None and not existing[4]:
+            mark_deleted(cur, library_id, existing[0], full_path, opts["stats"])
+            counters["deleted"] += 1
+        return
+
+    if existing is not None and is_unchanged(existing, st, opts["hash"]):
+        if existing[4]:
+            cur.execute("UPDATE entries SET is_deleted = 0 WHERE id = ?", (existing[0],))
+            opts["stats"].add_id(cur, existing[0], 1)
+        counters["unchanged"] += 1
+        return
+
+    res = process_file(Path(full_path), root, opts["hash"], opts["sevenzip"], st,
+                       opts["archive_backend"])
+    counters["errors"] += res["errors"]
+    if res["entry_row"] is None:
+        return
+    upsert_entry(cur, library_id, None if existing is None else existing[0], res, opts["stats"])
+    counters["new" if existing is None else "changed"] += 1
+
+
+def apply_dir(conn, cur, library_id: int, root: Path, top: str, opts: dict, counters: dict):
+    """
+    核对一个目录子树：磁盘上的文件逐个 apply_path，数据库里在这个目录下但磁盘上已不存在的行标记删除。
+    """
+    seen = set()
+    if os.path.isdir(top):
+        for p, st in iter_files(top, opts["exclude"], opts["file_exts"]):
+            seen.add(str(p))
+            apply_path(conn, cur, library_id, root, str(p), opts, counters, st)
+    # full_path 在 [top/, top0) 范围内 = top 下面的所有文件（走 idx_entries_full_path）
+    lo = top + os.sep
+    hi = top + chr(ord(os.sep) + 1)
+    rows = conn.execute("""
+        SELECT id, full_path FROM entries
+        WHERE full_path >= ? AND full_path < ? AND library_id = ? AND is_deleted = 0
+    """, (lo, hi, library_id)).fetchall()
+    for entry_id, full_path in rows:
+        if full_path not in seen and not is_filtered_path(full_path, root, opts["exclude"], opts["file_exts"]):
+            mark_deleted(cur, library_id, entry_id, full_path, opts["stats"])
+            counters["deleted"] += 1
+
+
+# -------------------------------------------------------------
+# 主循环
+# -------------------------------------------------------------
+def watch(db_path: str,
+          library_id: int,
+          root: Path = None,
+          hash_method: str = "",
+          sevenzip: str = "7z",
+          archive_backend: str = "auto",
+          debounce: float = DEBOUNCE_DEFAULT,
+          max_delay: float = MAX_DELAY_DEFAULT,
+          reconcile_every: float = RECONCILE_EVERY_DEFAULT,
+          initial_reconcile: bool = True,
+          batch: int = BATCH_DEFAULT,
+          workers: int = 0,
+          run_for: float = 0,
+          exclude=(),
+          file_exts=None):
+    if not sys.platform.startswith("linux"):
+        raise SystemExit("[ERROR] watch mode needs Linux inotify; use reindex.py on this platform")
+
+    hash_method = resolve_algo(hash_method)
+    conn = sqlite3.connect(db_path, timeout=60)
+    require_v1(conn, db_path)
+    ensure_columns(conn)
+    conn.commit()
+    lib = conn.execute("SELECT root_path FROM library WHERE id = ?", (library_id,)).fetchone()
+    if lib is None:
+        conn.close()
+        raise SystemExit(f"[ERROR] library_id={library_id} not found in {db_path}")
+    # root_path 必须与首次导入时一致，parent_path 才能对得上
+    root = Path(root or lib[0]).resolve()
+    opts = {"hash": hash_method, "sevenzip": sevenzip, "archive_backend": archive_backend,
+            "exclude": tuple(exclude or ()), "file_exts": file_exts, "stats": open_stats(conn)}
+    stats = opts["stats"]
+
+    libc = _libc()
+    fd = inotify_open(libc)
+    wds, paths = {}, {}
+    t0 = time.time()
+    missed = add_watches(libc, fd, str(root), wds, paths)
+    print(f"[INFO] watching {root} | {len(wds)} directories | {time.time() - t0:.1f}s")
+    if missed:
+        print(f"[WARN] {missed} directories not watched (fs.inotify.max_user_watches reached), "
+              f"relying on --reconcile-every", file=sys.stderr)
+    # 有目录没加上 watch 或者事件丢过时，核对之后重新加一遍 watch
+    watch_gaps = bool(missed)
+
+    dirty = {}       # 文件路径 -> (第一次事件时间, 最后一次事件时间)
+    dirty_dirs = {}  # 目录 -> (第一次, 最后一次)，整个子树核对
+    counters = {"unchanged": 0, "new": 0, "changed": 0, "deleted": 0, "errors": 0}
+    now = time.monotonic()
+    next_reconcile = now if initial_reconcile else now + reconcile_every
+    deadline = now + run_for if run_for else None
+
+    def mark(table: dict, path: str, t: float):
+        first = table.get(path, (t, t))[0]
+        table[path] = (first, t)
+
+    def ready(table: dict, t: float) -> list:
+        return sorted(p for p, (first, last) in table.items()
+                      if t - last >= debounce or t - first >= max_delay)
+
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            now = time.monotonic()
+            timeout = max(0.0, next_reconcile - now)
+            if dirty or dirty_dirs:
+                timeout = min(timeout, debounce)
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, deadline - now))
+
+            for wd, mask, cookie, name in read_events(fd, timeout):
+                t = time.monotonic()
+                if mask & IN_Q_OVERFLOW:
+                    print("[WARN] inotify queue overflow, scheduling reconciliation", file=sys.stderr)
+                    next_reconcile = t
+                    watch_gaps = True
+                    continue
+                if mask & IN_IGNORED:
+                    d = wds.pop(wd, None)
+                    if d is not None and paths.get(d) == wd:
+                        del paths[d]
+                    continue
+                d = wds.get(wd)
+                if d is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    if d == str(root):
+                        print(f"[WARN] library root {root} was moved / deleted", file=sys.stderr)
+                    continue
+                path = os.path.join(d, name) if name else d
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        missed = add_watches(libc, fd, path, wds, paths)
+                        if missed:
+                            print(f"[WARN] {missed} new directories not watched "
+                                  f"(fs.inotify.max_user_watches)", file=sys.stderr)
+                            watch_gaps = True
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        drop_watches(libc, fd, path, wds, paths)
+                    if mask & (IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                        mark(dirty_dirs, path, t)
+                else:
+                    mark(dirty, path, t)
+
+            now = time.monotonic()
+            todo_dirs = ready(dirty_dirs, now)
+            todo = ready(dirty, now)
+            if todo_dirs or todo:
+                t1 = time.time()
+                before = dict(counters)
+                cur = conn.cursor()
+                for d in todo_dirs:
+                    del dirty_dirs[d]
+                    apply_dir(conn, cur, library_id, root, d, opts, counters)
+                    stats.commit(conn)
+                for i, p in enumerate(todo, 1):
+                    del dirty[p]
+                    apply_path(conn, cur, library_id, root, p, opts, counters)
+                    if i % batch == 0:
+                        stats.commit(conn)
+                stats.commit(conn)
+                changes = " | ".join(f"{k}: {counters[k] - before[k]}" for k in counters)
+                print(f"[WATCH] {len(todo)} paths, {len(todo_dirs)} dirs | {changes} | "
+                      f"{time.time() - t1:.2f}s", flush=True)
+
+            if time.monotonic() >= next_reconcile:
+                print("[INFO] reconciliation pass", flush=True)
+                reindex(db_path, library_id, root, hash_method, sevenzip, workers, archive_backend,
+                        exclude, file_exts)
+                if watch_gaps:
+                    # 没加上的目录（watch 上限 / 溢出期间新建的）再试一次
+                    watch_gaps = add_watches(libc, fd, str(root), wds, paths) > 0
+                next_reconcile = time.monotonic() + reconcile_every
+    except KeyboardInterrupt:
+        print("[INFO] interrupted")
+    finally:
+        stats.commit(conn)
+        conn.close()
+        os.close(fd)
+
+    print(f"[DONE] library_id={library_id} | unchanged: {counters['unchanged']} | "
+          f"new: {counters['new']} | changed: {counters['changed']} | "
+          f"deleted: {counters['deleted']} | errors: {counters['errors']}")
+    return counters
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Keep a library's SQLite index current with inotify (Linux)")
+    ap.add_argument("--db", default="archive_work.db")
+    ap.add_argument("--library-id", type=int, required=True)
+    ap.add_argument("--root", help="Root folder (default: library.root_path)")
+    ap.add_argument("--hash", default="",
+                    help="Hash method: md5/sha1/sha256/blake2b-128/xxh3_64 ..., comma list e.g. crc32,sha256")
+    ap.add_argument("--exclude", action="append", default=[],
+                    help="跳过匹配的文件/目录（fnmatch，匹配名字或相对路径），可重复；与扫描时相同")
+    ap.add_argument("--file-exts", default="",
+                    help='只处理这些后缀的普通文件（压缩包总是处理），例如 ".mp3,.wav"；与扫描时相同')
+    ap.add_argument("--read-block-kb", type=int, default=1024,
+                    help="hash 读文件的块大小 KiB（默认 1024）")
+    ap.add_argument("--read-mode", choices=READ_MODES, default="readinto",
+                    help="readinto: 复用缓冲区（默认）；mmap: 大文件用 mmap；read: 旧实现")
+    ap.add_argument("--keep-cache", action="store_true",
+                    help="不调用 posix_fadvise(DONTNEED)，读过的文件留在页缓存里")
+    ap.add_argument("--sevenzip", default="7z", help="Path to 7z")
+    ap.add_argument("--archive-backend", choices=BACKENDS, default="auto",
+                    help="auto / native (zipfile, tarfile) / 7z")
+    ap.add_argument("--debounce", type=float, default=DEBOUNCE_DEFAULT,
+                    help=f"Seconds a path must be quiet before it is processed (default: {DEBOUNCE_DEFAULT:g})")
+    ap.add_argument("--max-delay", type=float, default=MAX_DELAY_DEFAULT,
+                    help=f"Process a path that keeps changing after this many seconds (default: {MAX_DELAY_DEFAULT:g})")
+    ap.add_argument("--reconcile-every", type=float, default=RECONCILE_EVERY_DEFAULT,
+                    help=f"Seconds between full reconciliation passes (default: {RECONCILE_EVERY_DEFAULT:g})")
+    ap.add_argument("--no-initial-reconcile", action="store_true",
+                    help="启动时不做全量核对（确定启动前数据库已是最新时使用）")
+    ap.add_argument("--batch", type=int, default=BATCH_DEFAULT,
+                    help=f"Paths per transaction (default: {BATCH_DEFAULT})")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="核对时的并行 hash/7z worker 线程数（0 = 单线程）")
+    ap.add_argument("--run-for", type=float, default=0,
+                    help="运行这么多秒后退出（0 = 一直运行，Ctrl-C 退出）")
+    ap.add_argument("--nested-depth", type=int, default=0,
+                    help="列出压缩包里的压缩包，最多 N 层（0 = 不展开）；只对新增 / 变化的压缩包生效")
+    ap.add_argument("--nested-memory-mb", type=float, help="内层 zip/tar 在内存里读取的大小上限（默认 64）")
+    ap.add_argument("--nested-spill-mb", type=float, help="超过这个大小的内层压缩包不展开（默认 4096）")
+    ap.add_argument("--nested-tmp", help="内层压缩包临时文件的目录")
+    args = ap.parse_args()
+    try:
+        resolve_algo(args.hash)
+        configure_nested(args.nested_depth, args.nested_memory_mb, args.nested_spill_mb, args.nested_tmp)
+    except ValueError as ex:
+        ap.error(str(ex))
+    configure_io(args.read_block_kb * 1024, args.read_mode, not args.keep_cache)
+
+    watch(
+        args.db,
+        args.library_id,
+        Path(args.root) if args.root else None,
+        args.hash,
+        args.sevenzip,
+        args.archive_backend,
+        debounce=args.debounce,
+        max_delay=args.max_delay,
+        reconcile_every=args.reconcile_every,
+        initial_reconcile=not args.no_initial_reconcile,
+        batch=args.batch,
+        workers=args.workers,
+        run_for=args.run_for,
+        exclude=args.exclude,
+        file_exts=parse_exts(args.file_exts),
+    )
+
+
+if __name__ == "__main__":
+    main()